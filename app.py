@@ -1,36 +1,235 @@
 import os
 import logging
 import json
+import mimetypes
 import base64
 import hashlib
 import time
-import re
-import random
+import secrets
+import threading
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, session
-from openai import OpenAI
-import subprocess
+from flask import (Flask, Response, abort, g, has_request_context, render_template, request, jsonify,
+                   send_from_directory, session, stream_with_context)
+from flask.json.provider import DefaultJSONProvider
+from itsdangerous import BadSignature, URLSafeSerializer
+from werkzeug.middleware.proxy_fix import ProxyFix
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from assets import ASSETS_MAX_AGE, ASSETS_URL, asset_manifest
+from audit import AuditLogWriter, audit_database_url
+from cache import TranslationCache, make_cache_key
+from execution import (
+    EXECUTION_QUEUE_TIMEOUT,
+    EXECUTION_TIMEOUT,
+    ExecutionBusyError,
+    execution_scheduler,
+    collect_output,
+    stream_command,
+)
+from execution_cache import ExecutionCache
+from history import HISTORY_DB, HISTORY_MAX_OFFSET, CommandHistory, HistoryUnavailableError
+from host_context import host_context
+from intents import OFFLINE_DEGRADED_THRESHOLD, translate_offline
+from metrics import REGISTRY, STAGE_DURATION, server_timing_header, stage
+from powershell_simulator import DEFAULT_WORKING_DIR, SYSTEM_INFO, simulate as simulate_powershell
+from prompts import (
+    ALL_FIELDS,
+    OPTIONAL_FIELDS,
+    QUICK_FIELDS,
+    build_details_messages,
+    build_messages,
+    normalize_field,
+    normalize_result,
+    parse_fields,
+    response_format,
+    select_fields,
+)
+from semantic_index import SEMANTIC_DEGRADED_THRESHOLD, SEMANTIC_INDEX_DIR, SemanticIndex
+from shell_sessions import SHELL_SESSIONS_ENABLED, ShellSessionManager
+from singleflight import CancelledFlightError, SingleFlight
+from streaming import IncrementalJSONObjectParser, format_sse
+from upstream import (
+    CircuitBreaker,
+    UpstreamBusyError,
+    UpstreamUnavailableError,
+    LazyOpenAIClient,
+    upstream_breaker,
+    upstream_caller,
+    upstream_limiter,
+)
+from utils import (
+    LINUX_COMMAND_CLASSIFIER,
+    POWERSHELL_RISK_CLASSIFIER,
+    log_command_request,
+    register_command_log_listener,
+    validate_linux_command,
+    validate_powershell_command,
+)
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+# Set up logging (LOG_LEVEL=DEBUG for per-request detail)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider that records response serialization as a timed stage
+    """
+    def response(self, *args, **kwargs):
+        with stage("serialize"):
+            return super().response(*args, **kwargs)
 
 # Initialize Flask app with proper security settings
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 app.secret_key = os.environ.get("SESSION_SECRET")
+# Reverse proxies in front of the app (one for the nginx setup in
+# DEPLOYMENT.md). Only that many X-Forwarded-For entries are trusted, so
+# remote_addr is the address the nearest proxy saw; with 0 the header is
+# ignored, since any client can send it.
+PROXY_HOPS = int(os.environ.get("PROXY_HOPS", "0"))
+if PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS, x_proto=PROXY_HOPS)
 app.config["SESSION_COOKIE_SECURE"] = True  # Only send cookies over HTTPS
 app.config["SESSION_COOKIE_HTTPONLY"] = True  # Prevent JavaScript access to cookies
 app.config["SESSION_COOKIE_SAMESITE"] = "Lax"  # CSRF protection
+# Templates link static files through the asset manifest (see assets.py)
+app.jinja_env.globals["asset_url"] = asset_manifest.url
 
-# Initialize OpenAI client (safely to handle missing API key)
+# Initialize OpenAI client (safely to handle missing API key). It is built
+# on first use, so importing the app does not load the openai package.
 # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
 # do not change this unless explicitly requested by the user
+OPENAI_MODEL = "gpt-4o"
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 openai_client = None
 if OPENAI_API_KEY:
-    openai_client = OpenAI(api_key=OPENAI_API_KEY)
+    openai_client = LazyOpenAIClient(OPENAI_API_KEY)
 else:
     logging.warning("OPENAI_API_KEY not set. Some features will be limited.")
 
+# Details handles carry their query, shell and command, so any worker can
+# serve them without shared state. They are signed so the details endpoint
+# only explains translations this app produced; the key must be the same in
+# every worker, and without an API key forging one would gain nothing.
+details_signer = URLSafeSerializer(app.secret_key or OPENAI_API_KEY or "", salt="details-handle")
+
+# Cache of raw model translations keyed on normalized query, shell and model.
+# Set TRANSLATION_CACHE_DB to a SQLite path to keep entries across worker restarts.
+translation_cache = TranslationCache(
+    max_entries=int(os.environ.get("TRANSLATION_CACHE_SIZE", "1024")),
+    ttl=int(os.environ.get("TRANSLATION_CACHE_TTL", str(24 * 3600))),
+    db_path=os.environ.get("TRANSLATION_CACHE_DB")
+)
+
+# Near-duplicate lookup over past translations, fed by the command log.
+# Set SEMANTIC_INDEX_DIR to share a memory-mapped index between workers.
+semantic_index = SemanticIndex(directory=SEMANTIC_INDEX_DIR)
+register_command_log_listener(semantic_index.record_log_entry)
+
+# Audit entries are written to the database in batches from a background thread
+audit_log_writer = AuditLogWriter(
+    audit_database_url(os.path.join(app.instance_path, "audit.db")),
+    batch_size=int(os.environ.get("AUDIT_BATCH_SIZE", "500")),
+    max_queue=int(os.environ.get("AUDIT_QUEUE_SIZE", "10000"))
+)
+register_command_log_listener(audit_log_writer.submit)
+
+# Searchable history of past translations, shared by all workers and kept
+# per browser session. HISTORY_DB overrides the SQLite path; set it empty
+# to turn history off.
+command_history = CommandHistory(
+    os.path.join(app.instance_path, "history.db") if HISTORY_DB is None else HISTORY_DB
+)
+
+def _history_owner():
+    """
+    Key of the requesting browser's translation history, or None when
+    Flask sessions are unavailable (no SESSION_SECRET) and none is kept
+    """
+    if not app.secret_key or not has_request_context():
+        return None
+    owner = session.get("history_owner")
+    if not owner:
+        owner = session["history_owner"] = secrets.token_hex(16)
+    return owner
+
+register_command_log_listener(lambda log_entry: command_history.record_log_entry(log_entry, _history_owner()))
+
+# Long-lived shells for /execute, one per browser session
+shell_sessions = ShellSessionManager()
+
+# Recent results of read-only commands, shared by everyone running them.
+# Set EXECUTION_CACHE_SIZE=0 to run every command.
+execution_cache = ExecutionCache(wait_timeout=EXECUTION_TIMEOUT + EXECUTION_QUEUE_TIMEOUT)
+
+# Identical concurrent translations share one upstream call.
+# Set SINGLEFLIGHT_DIR (with TRANSLATION_CACHE_DB) to coalesce across workers.
+# Outages are left to the upstream circuit breaker rather than negative-cached.
+upstream_flights = SingleFlight(transient_errors=(UpstreamBusyError, UpstreamUnavailableError))
+
+# Background generation of translation details a client asked to prefetch.
+# Set DETAILS_PREFETCH_WORKERS=0 to ignore prefetch requests.
+DETAILS_PREFETCH_WORKERS = int(os.environ.get("DETAILS_PREFETCH_WORKERS", "2"))
+DETAILS_PREFETCH_QUEUE = int(os.environ.get("DETAILS_PREFETCH_QUEUE", "32"))
+details_prefetcher = (
+    ThreadPoolExecutor(max_workers=DETAILS_PREFETCH_WORKERS, thread_name_prefix="details-prefetch")
+    if DETAILS_PREFETCH_WORKERS > 0 else None
+)
+details_prefetch_slots = threading.BoundedSemaphore(max(1, DETAILS_PREFETCH_QUEUE))
+
+# Metrics exposed at /metrics (stage timings live in metrics.STAGE_DURATION)
+HTTP_REQUESTS = REGISTRY.counter(
+    "nlt_http_requests_total", "HTTP requests by route, method and status", ["route", "method", "status"]
+)
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "nlt_http_request_duration_seconds",
+    "Time until the response is returned (streamed bodies continue afterwards)",
+    ["route", "method"]
+)
+TRANSLATIONS = REGISTRY.counter(
+    "nlt_translations_total",
+    "Translations by shell and source (offline, cache, semantic, model, coalesced, degraded or unavailable)",
+    ["shell", "source"]
+)
+TRANSLATION_DETAILS = REGISTRY.counter(
+    "nlt_translation_details_total",
+    "Translation details served or prefetched, by source (cache, offline, model, coalesced or unavailable)",
+    ["source"]
+)
+RISK_LEVELS = REGISTRY.counter(
+    "nlt_risk_level_total", "Classified commands by shell and risk level", ["shell", "level"]
+)
+EXECUTIONS = REGISTRY.counter(
+    "nlt_executions_total", "Executed commands by outcome (success, error or timeout)", ["outcome"]
+)
+EXECUTION_CACHE = REGISTRY.counter(
+    "nlt_execution_cache_total",
+    "Cacheable executions by result (hit, coalesced or miss)",
+    ["result"]
+)
+BLOCKED_EXECUTIONS = REGISTRY.counter(
+    "nlt_blocked_executions_total", "Execution requests refused, by reason", ["reason"]
+)
+REGISTRY.gauge("nlt_upstream_in_flight", "OpenAI calls in progress",
+               function=lambda: upstream_limiter.stats()["in_flight"])
+REGISTRY.gauge("nlt_upstream_breaker_state", "Upstream circuit breaker state (0 closed, 1 half-open, 2 open)",
+               function=lambda: CircuitBreaker.STATE_VALUES[upstream_breaker.state])
+REGISTRY.counter("nlt_upstream_attempt_failures_total", "Failed OpenAI call attempts",
+                 function=lambda: upstream_caller.stats()["failures"])
+REGISTRY.counter("nlt_upstream_retries_total", "OpenAI call attempts retried after a failure",
+                 function=lambda: upstream_caller.stats()["retries"])
+REGISTRY.counter("nlt_upstream_short_circuited_total", "OpenAI calls refused by the open circuit breaker",
+                 function=lambda: upstream_breaker.stats()["short_circuited"])
+REGISTRY.gauge("nlt_execution_running", "Commands currently running",
+               function=lambda: execution_scheduler.stats()["running"])
+REGISTRY.gauge("nlt_execution_queue_depth", "Execution requests waiting for a slot",
+               function=lambda: execution_scheduler.stats()["queue_depth"])
+REGISTRY.gauge("nlt_execution_cache_entries", "Entries in the execution result cache",
+               function=lambda: execution_cache.stats()["entries"])
+REGISTRY.gauge("nlt_shell_sessions_open", "Open persistent shell sessions",
+               function=lambda: shell_sessions.stats()["open"])
+REGISTRY.gauge("nlt_translation_cache_entries", "Entries in the translation cache",
+               function=lambda: translation_cache.stats()["entries"])
+
 # Copyright information
 COPYRIGHT_INFO = {
     "owner": "Ervin Remus Radosavlevici",
@@ -40,6 +239,37 @@ COPYRIGHT_INFO = {
     "phone": "+447759313990"
 }
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    # Build the OpenAI client in the background once this worker is serving,
+    # so it is usually ready before the first translation arrives
+    if openai_client is not None:
+        openai_client.prewarm()
+
+@app.after_request
+def record_request_metrics(response):
+    """
+    Count the request, time it and report stage timings in Server-Timing
+    """
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    HTTP_REQUEST_DURATION.observe(elapsed, route=route, method=request.method)
+    response.headers["Server-Timing"] = server_timing_header(g.get("stage_timings", {}), elapsed)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """
+    Metrics for this worker in the Prometheus text format
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route('/')
 def index():
     # Pass OpenAI API key status and copyright info to template
@@ -57,6 +287,30 @@ def powershell():
                           copyright=COPYRIGHT_INFO,
                           config={'OPENAI_API_KEY': OPENAI_API_KEY})
 
+@app.route(f"{ASSETS_URL}<path:filename>")
+def built_asset(filename):
+    """
+    Serve a fingerprinted static asset, precompressed if the client accepts
+    it. Built names never change content, so they may be cached for good.
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    try:
+        served, encoding = asset_manifest.variant(
+            filename, lambda name: request.accept_encodings[name] > 0
+        )
+    except KeyError:
+        abort(404)
+    response = send_from_directory(
+        asset_manifest.assets_dir, served,
+        mimetype=mimetypes.guess_type(filename)[0], max_age=ASSETS_MAX_AGE
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add("Accept-Encoding")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    return response
+
 @app.route('/translate', methods=['POST'])
 def translate():
     try:
@@ -65,13 +319,20 @@ def translate():
         
         if not natural_language_query:
             return jsonify({"error": "Query cannot be empty"}), 400
+        # Quick translations by default; details come from /translate/<id>/details
+        try:
+            fields = parse_fields(data.get('fields', request.args.get('fields')), QUICK_FIELDS)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         # Generate a watermark based on query and timestamp
         timestamp = time.time()
-        watermark = generate_watermark(natural_language_query, timestamp)
+        with stage("watermark"):
+            watermark = generate_watermark(natural_language_query, timestamp)
         
         # Get Linux command from OpenAI
-        result = get_linux_command(natural_language_query)
+        result = get_linux_command(natural_language_query, fields)
+        attach_details_handle(result, natural_language_query, "linux", fields, bool(data.get('prefetch')))
         
         # Add watermark and copyright to the result
         result['watermark'] = watermark
@@ -80,10 +341,34 @@ def translate():
         
         return jsonify(result)
     
+    except UpstreamBusyError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+    except UpstreamUnavailableError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
     except Exception as e:
         logging.error(f"Error processing request: {str(e)}")
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
+@app.route('/translate/<details_id>/details', methods=['GET', 'POST'])
+def translate_details(details_id):
+    """
+    Breakdown and simulation for a quick translation, generated on demand
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    try:
+        details, source = translation_details(details_id)
+    except KeyError:
+        return jsonify({"error": "Unknown translation details id"}), 404
+    except UpstreamBusyError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+    except UpstreamUnavailableError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
+    except Exception as e:
+        logging.error(f"Error generating translation details: {str(e)}")
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+    
+    return jsonify(dict(details, details_id=details_id, source=source))
+
 @app.route('/translate_powershell', methods=['POST'])
 def translate_powershell():
     """
@@ -96,13 +381,20 @@ def translate_powershell():
         
         if not natural_language_query:
             return jsonify({"error": "Query cannot be empty"}), 400
+        # Quick translations by default; details come from /translate/<id>/details
+        try:
+            fields = parse_fields(data.get('fields', request.args.get('fields')), QUICK_FIELDS)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         # Generate a watermark based on query and timestamp
         timestamp = time.time()
-        watermark = generate_watermark(natural_language_query, timestamp)
+        with stage("watermark"):
+            watermark = generate_watermark(natural_language_query, timestamp)
         
         # Get PowerShell command from OpenAI
-        result = get_powershell_command(natural_language_query)
+        result = get_powershell_command(natural_language_query, fields)
+        attach_details_handle(result, natural_language_query, "powershell", fields, bool(data.get('prefetch')))
         
         # Add watermark and copyright to the result
         result['watermark'] = watermark
@@ -111,10 +403,299 @@ def translate_powershell():
         
         return jsonify(result)
     
+    except UpstreamBusyError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+    except UpstreamUnavailableError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
     except Exception as e:
         logging.error(f"Error processing PowerShell request: {str(e)}")
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
+@app.route('/cache/stats')
+def cache_stats():
+    """
+    Report translation cache hit/miss counters
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    stats = translation_cache.stats()
+    stats["semantic_index"] = semantic_index.stats()
+    stats["single_flight"] = upstream_flights.stats()
+    return jsonify(stats)
+
+@app.route('/audit/stats')
+def audit_stats():
+    """
+    Report audit log queue depth and write counters for this worker
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    return jsonify(audit_log_writer.stats())
+
+@app.route('/history/search')
+def history_search():
+    """
+    Search the requesting browser's past translations: q matches words of
+    the query, command or explanation as prefixes, best matches first;
+    without q the most recently used are listed. Paginated with limit and
+    offset.
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    owner = _history_owner()
+    if owner is None:
+        return jsonify({"error": "Command history needs sessions; set SESSION_SECRET"}), 503
+    text = request.args.get('q', '')
+    shell = request.args.get('shell') or None
+    if shell is not None and shell not in TRANSLATORS:
+        return jsonify({"error": f"Unknown shell: {shell}"}), 400
+    try:
+        limit = int(request.args.get('limit', '20'))
+        offset = int(request.args.get('offset', '0'))
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers"}), 400
+    if offset > HISTORY_MAX_OFFSET:
+        return jsonify({"error": f"offset may not exceed {HISTORY_MAX_OFFSET}; refine the search instead"}), 400
+
+    try:
+        with stage("history"):
+            entries, has_more = command_history.search(owner, text, shell, limit, offset)
+    except HistoryUnavailableError as e:
+        return jsonify({"error": str(e)}), 503
+
+    next_offset = offset + len(entries)
+    return jsonify({
+        "q": text,
+        "shell": shell,
+        "results": entries,
+        "offset": offset,
+        "next_offset": next_offset if has_more and next_offset <= HISTORY_MAX_OFFSET else None
+    })
+
+@app.route('/history/stats')
+def history_stats():
+    """
+    Report history queue depth, write and search counters for this worker
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    return jsonify(command_history.stats())
+
+@app.route('/upstream/stats')
+def upstream_stats():
+    """
+    Report upstream OpenAI concurrency, retry and circuit breaker state
+    for this worker
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    stats = upstream_limiter.stats()
+    stats.update(upstream_caller.stats())
+    return jsonify(stats)
+
+
+def _prepare_execution(data):
+    """
+    Validate an execution request. Returns (context, None) when the command
+    may run, or (None, error_response) when it may not.
+    """
+    command = data.get('command', '').strip()
+    working_dir = data.get('working_dir', None)
+    
+    if not command:
+        return None, (jsonify({"error": "No command provided"}), 400)
+    
+    # First, validate the command for safety
+    is_safe, reason, risk_level = validate_linux_command(command)
+    
+    # Do not execute high-risk commands
+    if not is_safe:
+        BLOCKED_EXECUTIONS.inc(reason="high_risk")
+        return None, (jsonify({
+            "error": f"Command execution denied: {reason}",
+            "stdout": "",
+            "stderr": f"⚠️ EXECUTION BLOCKED: This high-risk command was not executed for safety reasons.",
+            "risk_level": risk_level,
+            "command": command
+        }), 403)
+    
+    # For safety, we'll only allow execution of commands that are deemed safe or low risk
+    if risk_level >= 2:  # medium or high risk
+        BLOCKED_EXECUTIONS.inc(reason="medium_risk")
+        return None, (jsonify({
+            "error": f"Command execution denied: Risk level too high ({risk_level})",
+            "stdout": "",
+            "stderr": f"⚠️ EXECUTION BLOCKED: This command was not executed due to medium or high risk level.",
+            "risk_level": risk_level,
+            "command": command
+        }), 403)
+    
+    # Log the command execution
+    log_command_request(f"EXECUTION: {command}", command)
+    
+    # Host details are cached per worker rather than gathered per request
+    context = host_context.get()
+    session_id = _shell_session_id()
+    current_dir = (session_id and shell_sessions.current_directory(session_id)) or context["working_directory"]
+    if working_dir and os.path.isdir(working_dir):
+        current_dir = working_dir
+    system_info = host_context.system_info()
+    
+    # Read-only commands may reuse a recent identical run unless the client
+    # asks for a fresh one with "cache": false or Cache-Control: no-cache
+    bypass = data.get("cache") is False or "no-cache" in request.headers.get("Cache-Control", "")
+    cache_ttl = execution_cache.ttl(command, bypass) if risk_level == 0 else None
+    # Results are only shared between shells that would run the command alike
+    shell_state = shell_sessions.state_key(session_id) if cache_ttl and session_id else ""
+    
+    return {
+        "command": command,
+        "risk_level": risk_level,
+        # Execute in specified directory if provided and valid
+        "cwd": working_dir if working_dir and os.path.isdir(working_dir) else None,
+        "current_directory": current_dir,
+        "system_info": system_info,
+        "session_id": session_id,
+        "cache_key": execution_cache.key(command, current_dir, shell_state) if cache_ttl else None,
+        "cache_ttl": cache_ttl,
+        "shell_state": shell_state
+    }, None
+
+def _shell_session_id():
+    """
+    Id of the requesting browser's persistent shell, or None when Flask
+    sessions are unavailable (no SESSION_SECRET) or persistent shells are
+    disabled (SHELL_SESSIONS=0) and commands run one-shot
+    """
+    if not app.secret_key or not SHELL_SESSIONS_ENABLED:
+        return None
+    session_id = session.get("shell_session_id")
+    if not session_id:
+        session_id = session["shell_session_id"] = secrets.token_hex(16)
+    return session_id
+
+def _begin_cached_execution(context):
+    """
+    Join the execution cache for a cacheable command, or return None
+    """
+    if context["cache_key"] is None:
+        return None
+    return execution_cache.begin(context["cache_key"], context["cache_ttl"])
+
+def _execution_events(context, cached=None):
+    """
+    Run the command and yield its (stream, value) events, in the browser's
+    persistent shell when it has one. cached is the command's
+    CachedExecution when it goes through the execution cache.
+    """
+    if cached is not None:
+        if context["shell_state"]:
+            # The browser's shell may define aliases or variables a fresh
+            # one lacks; the result is cached for that shell alone
+            yield from cached.events(lambda: _session_events(context))
+        else:
+            # One-shot in the session's directory, so the result depends
+            # only on what the cache is keyed on
+            yield from cached.events(
+                lambda: stream_command(context["command"], cwd=context["current_directory"])
+            )
+        return
+    yield from _session_events(context)
+
+def _session_events(context):
+    """
+    Run the command in the browser's persistent shell, or one-shot when
+    it has none, and yield its events
+    """
+    session_id = context["session_id"]
+    if session_id is None:
+        yield from stream_command(context["command"], cwd=context["cwd"])
+        return
+    
+    shell = shell_sessions.checkout(session_id, context["cwd"])
+    try:
+        yield from shell.run(context["command"], working_dir=context["cwd"])
+    finally:
+        shell_sessions.checkin(session_id, shell)
+
+def _execution_summary(info):
+    """
+    Result fields describing how an execution finished
+    """
+    exit_code = info["exit_code"]
+    cache = info.get("cache")
+    if cache is not None:
+        EXECUTION_CACHE.inc(result=cache)
+    if cache in ("hit", "coalesced"):
+        # Served from another run; nothing was executed for this request
+        pass
+    elif info["timed_out"]:
+        EXECUTIONS.inc(outcome="timeout")
+    else:
+        EXECUTIONS.inc(outcome="success" if exit_code == 0 else "error")
+    summary = {
+        "exit_code": exit_code,
+        "timed_out": info["timed_out"],
+        "truncated": info["truncated"],
+        "duration": info["duration"],
+        "execution_successful": exit_code == 0 and not info["timed_out"]
+    }
+    if "current_directory" in info:
+        # Persistent shells report where the command left them
+        summary["current_directory"] = info["current_directory"]
+        summary["session_closed"] = info["session_closed"]
+    if cache is not None:
+        summary["cached"] = cache != "miss"
+        if summary["cached"]:
+            summary["cache_age"] = info["cache_age"]
+    if info["timed_out"]:
+        summary["exit_meaning"] = f"Timed out after {EXECUTION_TIMEOUT:g} seconds"
+    else:
+        # Get exit code meaning
+        summary["exit_meaning"] = "Success" if exit_code == 0 else f"Error code: {exit_code}"
+    return summary
+
+@app.route('/execute/stats')
+def execution_stats():
+    """
+    Report execution pool usage, queue depth and wait times for this worker
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    stats = execution_scheduler.stats()
+    stats["sessions"] = shell_sessions.stats()
+    stats["cache"] = execution_cache.stats()
+    return jsonify(stats)
+
+@app.route('/execute/session', methods=['DELETE'])
+def reset_execution_session():
+    """
+    Close the requesting browser's persistent shell; the next command
+    starts a fresh one
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    session_id = session.get("shell_session_id") if app.secret_key and SHELL_SESSIONS_ENABLED else None
+    closed = bool(session_id) and shell_sessions.close(session_id)
+    return jsonify({"closed": closed})
+
+
+def _client_id():
+    """
+    Identify the requesting client for per-client execution fairness
+    """
+    # Not access_route: its first hop is whatever the client put in
+    # X-Forwarded-For (see PROXY_HOPS)
+    return request.remote_addr or "unknown"
+
+def _execution_busy_response(error, command):
+    """
+    429 response telling the client to retry once the execution pool frees up
+    """
+    BLOCKED_EXECUTIONS.inc(reason="busy")
+    response = jsonify({
+        "error": str(error),
+        "stdout": "",
+        "stderr": "The server is busy running other commands. Please retry shortly.",
+        "command": command,
+        "execution_successful": False
+    })
+    response.status_code = 429
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
 
 @app.route('/execute', methods=['POST'])
 def execute_command():
@@ -123,106 +704,48 @@ def execute_command():
     Enhanced to provide more context about the real Linux environment
     """
     try:
-        from utils import validate_linux_command, log_command_request
+        context, error_response = _prepare_execution(request.json)
+        if error_response:
+            return error_response
+        command = context["command"]
         
-        data = request.json
-        command = data.get('command', '').strip()
-        working_dir = data.get('working_dir', None)
-        
-        if not command:
-            return jsonify({"error": "No command provided"}), 400
-        
-        # First, validate the command for safety
-        is_safe, reason, risk_level = validate_linux_command(command)
-        
-        # Do not execute high-risk commands
-        if not is_safe:
-            return jsonify({
-                "error": f"Command execution denied: {reason}",
-                "stdout": "",
-                "stderr": f"⚠️ EXECUTION BLOCKED: This high-risk command was not executed for safety reasons.",
-                "risk_level": risk_level,
-                "command": command
-            }), 403
+        # Output is capped at EXECUTION_MAX_OUTPUT_BYTES and anything
+        # produced before a timeout is kept
+        # Cached or already running commands start no process, so they
+        # need no slot
+        cached = _begin_cached_execution(context)
+        if cached is not None and not cached.leader:
+            slot = nullcontext()
+        else:
+            slot = execution_scheduler.slot(_client_id())
+        try:
+            with slot, stage("execute"):
+                info = collect_output(_execution_events(context, cached))
+        except ExecutionBusyError as e:
+            return _execution_busy_response(e, command)
+        finally:
+            if cached is not None:
+                # Requests sharing this run must not wait for one that never started
+                cached.cancel()
         
-        # For safety, we'll only allow execution of commands that are deemed safe or low risk
-        if risk_level >= 2:  # medium or high risk
-            return jsonify({
-                "error": f"Command execution denied: Risk level too high ({risk_level})",
-                "stdout": "",
-                "stderr": f"⚠️ EXECUTION BLOCKED: This command was not executed due to medium or high risk level.",
-                "risk_level": risk_level,
-                "command": command
-            }), 403
+        result = {
+            # Format output for better display
+            "stdout": info["stdout"].strip(),
+            "stderr": info["stderr"].strip(),
+            "risk_level": context["risk_level"],
+            "current_directory": context["current_directory"],
+            "system_info": context["system_info"],
+            "command": command
+        }
+        result.update(_execution_summary(info))
         
-        # Log the command execution
-        log_command_request(f"EXECUTION: {command}", command)
+        if info["timed_out"]:
+            result["error"] = f"Command execution timed out after {EXECUTION_TIMEOUT:g} seconds"
+            if not result["stderr"]:
+                result["stderr"] = "Execution timed out. This command takes too long to complete in the web interface."
+            return jsonify(result), 408
         
-        # Get current directory context
-        try:
-            current_dir = os.getcwd()
-            if working_dir and os.path.isdir(working_dir):
-                current_dir = working_dir
-        except Exception:
-            current_dir = "/unknown"
-            
-        # Get system info for context
-        try:
-            system_info = subprocess.run(
-                "uname -a",
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=2
-            ).stdout.strip()
-        except Exception:
-            system_info = "Unknown Linux system"
-        
-        # Execute the command in a safe way - with improved timeout and working directory support
-        try:
-            # Execute in specified directory if provided and valid
-            cwd = working_dir if working_dir and os.path.isdir(working_dir) else None
-            
-            # Safe execution with longer timeout (15 seconds) for real-world commands
-            process = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                timeout=15,  # Increased timeout for real Linux commands
-                cwd=cwd  # Set working directory if specified
-            )
-            
-            # Format output for better display
-            stdout = process.stdout.strip() if process.stdout else ""
-            stderr = process.stderr.strip() if process.stderr else ""
-            
-            # Get exit code meaning
-            exit_meaning = "Success" if process.returncode == 0 else f"Error code: {process.returncode}"
-            
-            return jsonify({
-                "stdout": stdout,
-                "stderr": stderr,
-                "exit_code": process.returncode,
-                "exit_meaning": exit_meaning,
-                "risk_level": risk_level,
-                "current_directory": current_dir,
-                "system_info": system_info,
-                "command": command,
-                "execution_successful": process.returncode == 0
-            })
-            
-        except subprocess.TimeoutExpired:
-            return jsonify({
-                "error": "Command execution timed out after 15 seconds",
-                "stdout": "",
-                "stderr": "Execution timed out. This command takes too long to complete in the web interface.",
-                "risk_level": risk_level,
-                "current_directory": current_dir,
-                "system_info": system_info,
-                "command": command,
-                "execution_successful": False
-            }), 408
+        return jsonify(result)
             
     except Exception as e:
         logging.error(f"Command execution error: {str(e)}")
@@ -234,245 +757,771 @@ def execute_command():
             "execution_successful": False
         }), 500
 
-def get_linux_command(query):
+def stream_execution(context, cached=None):
     """
-    Use OpenAI to translate natural language to Linux command with improved formatting
+    Yield server-sent events for a running command: a "start" event with
+    the execution context, "stdout"/"stderr" events as output arrives and
+    a final "exit" event with the exit status
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    command = context["command"]
+    yield format_sse("start", {
+        "command": command,
+        "risk_level": context["risk_level"],
+        "current_directory": context["current_directory"],
+        "system_info": context["system_info"]
+    })
+    try:
+        started = time.perf_counter()
+        for stream, value in _execution_events(context, cached):
+            if stream == "exit":
+                STAGE_DURATION.observe(time.perf_counter() - started, stage="execute")
+                yield format_sse("exit", _execution_summary(value))
+            else:
+                yield format_sse(stream, {"text": value})
+    except Exception as e:
+        logging.error(f"Command execution error: {str(e)}")
+        yield format_sse("error", {"error": f"Failed to execute command: {str(e)}"})
+
+@app.route('/execute/stream', methods=['POST'])
+def execute_stream():
+    """
+    Execute a Linux command and stream its output as server-sent events
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    context, error_response = _prepare_execution(request.json)
+    if error_response:
+        return error_response
+    
+    cached = _begin_cached_execution(context)
+    response = Response(
+        stream_execution(context, cached),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    if cached is not None:
+        # A stream closed before it started must not leave others waiting
+        response.call_on_close(cached.cancel)
+        if not cached.leader:
+            # Replayed or shared with a run in progress: no process, no slot
+            return response
+    
+    # Take the slot before streaming starts so a saturated pool can still
+    # answer with 429; it is released when the response is closed
+    client = _client_id()
+    try:
+        execution_scheduler.acquire(client)
+    except ExecutionBusyError as e:
+        if cached is not None:
+            cached.cancel(e)
+        return _execution_busy_response(e, context["command"])
+    started = time.monotonic()
+    response.call_on_close(
+        lambda: execution_scheduler.release(client, time.monotonic() - started)
+    )
+    return response
+
+def apply_linux_risk(result, classification=None):
+    """
+    Validate the translated Linux command and add risk_level and an
+    appropriate safety_warning to the result in place. A precomputed
+    (is_safe, reason, risk_level) classification may be passed in.
     Copyright (c) 2024 Ervin Remus Radosavlevici
     """
-    # Check if OpenAI API key is available
-    if not openai_client:
-        # Return a message indicating API key is required
-        return {
-            "command": "API_KEY_REQUIRED",
-            "explanation": "An OpenAI API key is required to translate natural language to Linux commands.",
-            "breakdown": {
-                "How to fix": "Please provide an OpenAI API key to use this feature."
-            },
-            "safety_warning": "This application requires an OpenAI API key to function properly."
+    if classification is None:
+        with stage("classify"):
+            classification = validate_linux_command(result.get("command", ""))
+    is_safe, reason, risk_level = classification
+    RISK_LEVELS.inc(shell="linux", level=risk_level)
+    
+    # Add risk level indicator
+    result["risk_level"] = risk_level
+    
+    # Handle dangerous commands
+    if not is_safe:
+        # For high risk commands, add strong warning
+        result["safety_warning"] = f"⚠️ WARNING: {reason}. This command could cause serious system damage and should not be executed."
+    elif risk_level > 0:
+        # For medium or low risk, add appropriate warning if not already present
+        warning_levels = {
+            1: "Low risk: ",
+            2: "Medium risk: "
         }
         
-    try:
-        # Import here to avoid circular imports
-        from utils import validate_linux_command, log_command_request
-        
-        system_prompt = """
-        You are a Linux command translator. Convert natural language requests into appropriate Linux shell commands.
-        For each request, provide:
-        1. The exact Linux command to execute
-        2. A brief explanation of what the command does
-        3. A breakdown of the command's components
-        4. A simulation of what would happen if the command is executed in a standard Linux environment
-        
-        IMPORTANT: Be careful not to generate dangerous commands like 'rm -rf /' or similar destructive operations.
-        Always use common sense and favor safety when translating ambiguous requests.
-        
-        Respond with valid JSON in this format:
-        {
-            "command": "the_linux_command",
-            "explanation": "Brief explanation of what the command does",
-            "breakdown": {
-                "component1": "explanation",
-                "component2": "explanation",
-                ...
-            },
-            "simulation": "A text simulation of what the command would output when executed",
-            "safety_warning": "Any safety concerns if applicable, otherwise null"
+        if result.get("safety_warning"):
+            if not result["safety_warning"].startswith(warning_levels[risk_level]):
+                result["safety_warning"] = f"{warning_levels[risk_level]}{result['safety_warning']}"
+        else:
+            result["safety_warning"] = f"{warning_levels[risk_level]}{reason}"
+    
+    return result
+
+def apply_powershell_risk(result, classification=None):
+    """
+    Validate the translated PowerShell command and add risk_level and an
+    appropriate safety_warning to the result in place. A precomputed
+    (is_safe, reason, risk_level) classification may be passed in.
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    if classification is None:
+        with stage("classify"):
+            classification = validate_powershell_command(result.get("command", ""))
+    is_safe, reason, risk_level = classification
+    RISK_LEVELS.inc(shell="powershell", level=risk_level)
+    
+    # Add risk level to the response
+    result["risk_level"] = risk_level
+    
+    # Handle dangerous commands
+    if risk_level == 3:
+        # For high risk commands, add strong warning
+        result["safety_warning"] = f"⚠️ WARNING: {reason}. This PowerShell command could cause serious system damage and should not be executed."
+    elif risk_level > 0:
+        # For medium or low risk, add appropriate warning if not already present
+        warning_levels = {
+            1: "Low risk: ",
+            2: "Medium risk: "
         }
-        """
-        
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": query}
-            ],
-            response_format={"type": "json_object"}
+        
+        if result.get("safety_warning"):
+            if not result["safety_warning"].startswith(warning_levels[risk_level]):
+                result["safety_warning"] = f"{warning_levels[risk_level]}{result['safety_warning']}"
+        else:
+            if risk_level == 1:
+                result["safety_warning"] = f"{warning_levels[risk_level]}This command modifies files or settings."
+            else:
+                result["safety_warning"] = f"{warning_levels[risk_level]}This command makes significant system changes."
+    
+    return result
+
+def host_description(shell):
+    """
+    Host description for shell's prompt. Linux commands run on this host,
+    so translations should use tools and paths that exist here.
+    """
+    return host_context.prompt_description() if shell == "linux" else None
+
+def translation_messages(query, shell, fields=ALL_FIELDS):
+    return build_messages(query, shell, fields, host_description(shell))
+
+SHELL_NAMES = {
+    "linux": "Linux",
+    "powershell": "PowerShell",
+}
+
+def api_key_required_result(shell):
+    """
+    Placeholder result returned when a query needs the model but no API key is set
+    """
+    return {
+        "command": "API_KEY_REQUIRED",
+        "explanation": f"An OpenAI API key is required to translate natural language to {SHELL_NAMES[shell]} commands.",
+        "breakdown": {
+            "How to fix": "Please provide an OpenAI API key to use this feature."
+        },
+        "safety_warning": "This application requires an OpenAI API key to function properly."
+    }
+
+def translation_key(query, shell, fields=ALL_FIELDS):
+    """
+    Cache (and single-flight) key for a translation limited to fields
+    """
+    return make_cache_key(query, shell, OPENAI_MODEL, None if fields == ALL_FIELDS else fields)
+
+def cached_translation(query, shell, fields=ALL_FIELDS):
+    """
+    Cached translation of query with at least fields, or None. A full
+    translation also answers requests for fewer fields.
+    """
+    result = translation_cache.get(translation_key(query, shell, fields))
+    if result is None and fields != ALL_FIELDS:
+        result = translation_cache.get(translation_key(query, shell))
+    return select_fields(result, fields) if result is not None else None
+
+def lookup_translation(query, shell, fields=ALL_FIELDS):
+    """
+    Answer a query without calling the model. Returns (result, source) where
+    source is "offline" for a matched intent, "cache" for a cached
+    translation or "semantic" for a translation of a near-identical past
+    query, or (None, None) if the model is needed.
+    """
+    # Common intents are answered locally, with or without an API key
+    result = translate_offline(query, shell)
+    if result is not None:
+        return select_fields(result, fields), "offline"
+    
+    # Serve repeated questions from the translation cache
+    result = cached_translation(query, shell, fields)
+    if result is not None:
+        return result, "cache"
+    
+    # Reuse the translation of a near-identical earlier query
+    match = semantic_index.lookup(query, shell)
+    if match is not None:
+        result = similar_translation(match, shell, fields)
+        if result is not None:
+            return result, "semantic"
+    return None, None
+
+def similar_translation(match, shell, fields=ALL_FIELDS, partial=False):
+    """
+    Result for an (entry, similarity) semantic index match: the cached
+    translation of the similar query, or its logged command. The logged
+    command alone has no breakdown or simulation, so it is only used when
+    those were not asked for, or if partial is true; otherwise returns None.
+    """
+    entry, similarity = match
+    result = cached_translation(entry["query"], shell, fields)
+    if result is None:
+        if not partial and any(name in fields for name in OPTIONAL_FIELDS):
+            return None
+        result = {
+            "command": entry["command"],
+            "explanation": f"Translation reused from the similar request \"{entry['query']}\".",
+            "breakdown": {},
+            "simulation": None,
+            "safety_warning": None
+        }
+        select_fields(result, fields)
+    result["similar_query"] = entry["query"]
+    result["similarity"] = round(similarity, 3)
+    return result
+
+def degraded_translation(query, shell, fields=ALL_FIELDS):
+    """
+    Best-effort answer while the model is unavailable: a looser semantic
+    match, then a lower-confidence offline intent. Returns None if neither
+    is close enough.
+    """
+    match = semantic_index.lookup(query, shell, SEMANTIC_DEGRADED_THRESHOLD)
+    if match is not None:
+        result = similar_translation(match, shell, fields, partial=True)
+    else:
+        result = translate_offline(query, shell, OFFLINE_DEGRADED_THRESHOLD)
+        if result is None:
+            return None
+        select_fields(result, fields)
+    result["degraded"] = True
+    return result
+
+def fetch_translation(query, shell, fields=ALL_FIELDS):
+    """
+    Return (result, source) with the raw JSON answer for query, answered
+    locally when possible and otherwise by the model (source "model", or
+    "coalesced" when an identical in-flight request's answer was shared).
+    While the model is unavailable a close-enough local answer is returned
+    with source "degraded"; without one UpstreamUnavailableError is raised.
+    Returns (None, None) if the model is needed but no API key is set.
+    """
+    with stage("lookup"):
+        result, source = lookup_translation(query, shell, fields)
+    if result is not None or not openai_client:
+        TRANSLATIONS.inc(shell=shell, source=source or "unavailable")
+        return result, source
+    
+    key = translation_key(query, shell, fields)
+    try:
+        result, shared = upstream_flights.do(
+            key,
+            lambda: request_translation(query, shell, fields),
+            recheck=lambda: translation_cache.get(key)
         )
+    except UpstreamUnavailableError:
+        with stage("degraded"):
+            result = degraded_translation(query, shell, fields)
+        if result is None:
+            raise
+        TRANSLATIONS.inc(shell=shell, source="degraded")
+        return result, "degraded"
+    source = "coalesced" if shared else "model"
+    TRANSLATIONS.inc(shell=shell, source=source)
+    return result, source
+
+def request_translation(query, shell, fields=ALL_FIELDS):
+    """
+    Ask the model to translate query and cache the JSON answer
+    """
+    messages = translation_messages(query, shell, fields)
+    with stage("upstream"):
+        response = upstream_caller.call(lambda timeout: openai_client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=messages,
+            response_format=response_format(fields),
+            timeout=timeout
+        ))
+    
+    # Parse the response
+    with stage("parse"):
+        result = normalize_result(json.loads(response.choices[0].message.content))
+    translation_cache.set(translation_key(query, shell, fields), result)
+    return result
+
+def make_details_id(query, shell, command):
+    """
+    Self-contained signed handle for the details of command as a
+    translation of query
+    """
+    return details_signer.dumps([query, shell, command])
+
+def details_key(query, shell, command):
+    """
+    Cache key of the details of command as a translation of query
+    """
+    key = f"{translation_key(query, shell)}|{command}"
+    return f"details|{hashlib.sha256(key.encode('utf-8')).hexdigest()[:24]}"
+
+def attach_details_handle(result, query, shell, fields, prefetch=False):
+    """
+    Give a translation that left out optional fields a details_id for
+    /translate/<id>/details, and optionally start generating the details
+    in the background
+    """
+    command = result.get("command")
+    if fields == ALL_FIELDS or not command or command == "API_KEY_REQUIRED":
+        return result
+    details_id = make_details_id(query, shell, command)
+    result["details_id"] = details_id
+    result["details_url"] = f"/translate/{details_id}/details"
+    if prefetch:
+        prefetch_details(details_id)
+    return result
+
+def translation_details(details_id):
+    """
+    Return (details, source) with the breakdown and simulation for a
+    details_id, reusing a cached or offline full translation of the same
+    command when there is one and asking the model otherwise. Raises
+    KeyError for an id this app did not issue.
+    """
+    try:
+        query, shell, command = details_signer.loads(details_id)
+    except (BadSignature, TypeError, ValueError):
+        raise KeyError(details_id)
+    if shell not in SHELL_NAMES:
+        raise KeyError(details_id)
+    
+    key = details_key(query, shell, command)
+    with stage("lookup"):
+        details, source = translation_cache.get(key), "cache"
+        if details is None:
+            for full, source in ((translation_cache.get(translation_key(query, shell)), "cache"),
+                                 (translate_offline(query, shell), "offline")):
+                if full is not None and full.get("command") == command:
+                    details = {name: full.get(name) for name in OPTIONAL_FIELDS}
+                    break
+    if details is None:
+        if not openai_client:
+            details, source = {"breakdown": {}, "simulation": None}, "unavailable"
+        else:
+            details, shared = upstream_flights.do(
+                key,
+                lambda: request_details(key, query, shell, command),
+                recheck=lambda: translation_cache.get(key)
+            )
+            source = "coalesced" if shared else "model"
+    TRANSLATION_DETAILS.inc(source=source)
+    return details, source
+
+def request_details(key, query, shell, command):
+    """
+    Ask the model for the breakdown and simulation of command and cache them under key
+    """
+    messages = build_details_messages(query, command, shell, host_description(shell))
+    with stage("upstream"):
+        response = upstream_caller.call(lambda timeout: openai_client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=messages,
+            response_format=response_format(OPTIONAL_FIELDS),
+            timeout=timeout
+        ))
+    with stage("parse"):
+        details = normalize_result(json.loads(response.choices[0].message.content))
+    translation_cache.set(key, details)
+    return details
+
+def prefetch_details(details_id):
+    """
+    Generate the details for details_id in the background so a later
+    details request finds them cached (or joins the call in progress).
+    Returns False if prefetching is off or its queue is full.
+    """
+    if details_prefetcher is None or not openai_client:
+        return False
+    if not details_prefetch_slots.acquire(blocking=False):
+        return False
+    
+    def run():
+        try:
+            translation_details(details_id)
+        except Exception as e:
+            logging.warning(f"Details prefetch failed: {str(e)}")
+        finally:
+            details_prefetch_slots.release()
+    
+    details_prefetcher.submit(run)
+    return True
+
+def get_linux_command(query, fields=ALL_FIELDS):
+    """
+    Use OpenAI to translate natural language to Linux command with improved formatting
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    try:
+        result, source = fetch_translation(query, "linux", fields)
         
-        # Parse the response
-        result = json.loads(response.choices[0].message.content)
+        # Check if OpenAI API key is available
+        if result is None:
+            # Return a message indicating API key is required
+            return api_key_required_result("linux")
         
-        # Validate the command for safety
-        command = result.get("command", "")
-        is_safe, reason, risk_level = validate_linux_command(command)
+        result["cached"] = source == "cache"
+        result["source"] = source
         
-        # Add risk level indicator
-        result["risk_level"] = risk_level
+        # Validate the command for safety (cache hits are re-validated too)
+        apply_linux_risk(result)
         
         # Log the command request
-        log_command_request(query, command)
+        log_command_request(query, result.get("command", ""), explanation=result.get("explanation"),
+                            source=source)
         
-        # Handle dangerous commands
-        if not is_safe:
-            # For high risk commands, add strong warning
-            result["safety_warning"] = f"⚠️ WARNING: {reason}. This command could cause serious system damage and should not be executed."
-        elif risk_level > 0:
-            # For medium or low risk, add appropriate warning if not already present
-            warning_levels = {
-                1: "Low risk: ",
-                2: "Medium risk: "
-            }
-            
-            if result.get("safety_warning"):
-                if not result["safety_warning"].startswith(warning_levels[risk_level]):
-                    result["safety_warning"] = f"{warning_levels[risk_level]}{result['safety_warning']}"
-            else:
-                result["safety_warning"] = f"{warning_levels[risk_level]}{reason}"
-                
         return result
         
+    except (UpstreamBusyError, UpstreamUnavailableError):
+        raise
     except Exception as e:
         logging.error(f"OpenAI API error: {str(e)}")
         raise Exception(f"Failed to process your request: {str(e)}")
 
-def get_powershell_command(query):
+def get_powershell_command(query, fields=ALL_FIELDS):
     """
     Use OpenAI to translate natural language to PowerShell command
     Copyright (c) 2024 Ervin Remus Radosavlevici
     """
-    # Check if OpenAI API key is available
-    if not openai_client:
-        # Return a message indicating API key is required
-        return {
-            "command": "API_KEY_REQUIRED",
-            "explanation": "An OpenAI API key is required to translate natural language to PowerShell commands.",
-            "breakdown": {
-                "How to fix": "Please provide an OpenAI API key to use this feature."
-            },
-            "safety_warning": "This application requires an OpenAI API key to function properly."
-        }
-        
     try:
-        # Import here to avoid circular imports
-        from utils import validate_linux_command, log_command_request
-        
-        system_prompt = """
-        You are a PowerShell command translator. Convert natural language requests into appropriate PowerShell commands.
-        For each request, provide:
-        1. The exact PowerShell command to execute
-        2. A brief explanation of what the command does
-        3. A breakdown of the command's components
-        4. A simulation of what would happen if the command is executed in a Windows environment
-        
-        IMPORTANT: Be careful not to generate dangerous commands that could damage systems.
-        Always use PowerShell best practices and modern cmdlets where possible.
-        Favor safety when translating ambiguous requests.
-        
-        Respond with valid JSON in this format:
-        {
-            "command": "the_powershell_command",
-            "explanation": "Brief explanation of what the command does",
-            "breakdown": {
-                "component1": "explanation",
-                "component2": "explanation",
-                ...
-            },
-            "simulation": "A text simulation of what the command would output when executed",
-            "safety_warning": "Any safety concerns if applicable, otherwise null"
-        }
-        """
-        
-        response = openai_client.chat.completions.create(
-            model="gpt-4o", # the newest OpenAI model is "gpt-4o" which was released May 13, 2024
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": query}
-            ],
-            response_format={"type": "json_object"}
-        )
-        
-        # Parse the response
-        result = json.loads(response.choices[0].message.content)
+        result, source = fetch_translation(query, "powershell", fields)
         
-        # Validate the PowerShell command for safety
-        # In a real implementation, we would have a dedicated PowerShell command validator
-        # For now, we'll use a simplified approach based on pattern matching
-        powershell_command = result.get("command", "")
-        risk_level = 0
-        
-        # Simple risk assessment based on command content
-        # High risk patterns
-        high_risk_patterns = [
-            "remove-item.*-recurse.*-force", 
-            "format-volume", 
-            "clear-disk",
-            "reset-computermachinepassword",
-            "stop-computer",
-            "restart-computer"
-        ]
-        
-        # Medium risk patterns
-        medium_risk_patterns = [
-            "set-item",
-            "set-itemproperty",
-            "new-item",
-            "move-item",
-            "set-service",
-            "restart-service",
-            "stop-service"
-        ]
-        
-        # Low risk patterns
-        low_risk_patterns = [
-            "out-file",
-            "export-csv",
-            "add-content",
-            "set-content",
-            "rename-item"
-        ]
-        
-        # Check for high risk patterns
-        for pattern in high_risk_patterns:
-            if re.search(pattern, powershell_command.lower()):
-                risk_level = 3
-                break
-        
-        # Check for medium risk patterns if not already high
-        if risk_level < 3:
-            for pattern in medium_risk_patterns:
-                if re.search(pattern, powershell_command.lower()):
-                    risk_level = 2
-                    break
+        # Check if OpenAI API key is available
+        if result is None:
+            # Return a message indicating API key is required
+            return api_key_required_result("powershell")
         
-        # Check for low risk patterns if not already higher
-        if risk_level < 2:
-            for pattern in low_risk_patterns:
-                if re.search(pattern, powershell_command.lower()):
-                    risk_level = 1
-                    break
+        result["cached"] = source == "cache"
+        result["source"] = source
         
-        # Add risk level to the response
-        result["risk_level"] = risk_level
+        # Validate the PowerShell command for safety
+        apply_powershell_risk(result)
         
         # Log the command request
-        log_command_request(query, powershell_command, command_type="powershell")
-        
-        # Handle dangerous commands
-        if risk_level == 3:
-            # For high risk commands, add strong warning
-            result["safety_warning"] = f"⚠️ WARNING: This PowerShell command could cause serious system damage and should not be executed."
-        elif risk_level > 0:
-            # For medium or low risk, add appropriate warning if not already present
-            warning_levels = {
-                1: "Low risk: ",
-                2: "Medium risk: "
-            }
-            
-            if result.get("safety_warning"):
-                if not result["safety_warning"].startswith(warning_levels[risk_level]):
-                    result["safety_warning"] = f"{warning_levels[risk_level]}{result['safety_warning']}"
-            else:
-                if risk_level == 1:
-                    result["safety_warning"] = f"{warning_levels[risk_level]}This command modifies files or settings."
-                else:
-                    result["safety_warning"] = f"{warning_levels[risk_level]}This command makes significant system changes."
-                
+        log_command_request(query, result.get("command", ""), command_type="powershell",
+                            explanation=result.get("explanation"), source=source)
+        
         return result
         
+    except (UpstreamBusyError, UpstreamUnavailableError):
+        raise
     except Exception as e:
         logging.error(f"OpenAI API error: {str(e)}")
         raise Exception(f"Failed to process your PowerShell request: {str(e)}")
 
+# Per-shell translation settings used by the streaming endpoints
+TRANSLATORS = {
+    "linux": {
+        "apply_risk": apply_linux_risk,
+    },
+    "powershell": {
+        "apply_risk": apply_powershell_risk,
+    },
+}
+
+def _stream_model_fields(query, shell, fields=ALL_FIELDS):
+    """
+    Request a streamed completion and yield top-level (key, value) pairs
+    of the JSON answer as soon as each one is complete
+    """
+    messages = translation_messages(query, shell, fields)
+    chunks = upstream_caller.stream(lambda timeout: openai_client.chat.completions.create(
+        model=OPENAI_MODEL,
+        messages=messages,
+        response_format=response_format(fields),
+        stream=True,
+        timeout=timeout
+    ))
+    
+    parser = IncrementalJSONObjectParser()
+    with stage("upstream"):
+        for chunk in chunks:
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if text:
+                for key, value in parser.feed(text):
+                    yield key, normalize_field(key, value)
+
+def _coalesced_model_fields(query, shell, outcome, fields=ALL_FIELDS):
+    """
+    Yield the model's (key, value) pairs for query, streaming them if this
+    request leads the upstream call for its cache key, or replaying the
+    leader's result otherwise. Sets outcome["source"] to "model" or
+    "coalesced".
+    """
+    key = translation_key(query, shell, fields)
+    flight, leader = upstream_flights.begin(key)
+    if not leader:
+        outcome["source"] = "coalesced"
+        yield from flight.wait(upstream_flights.lock_timeout).items()
+        return
+    
+    raw_result = {}
+    try:
+        with upstream_flights.interprocess(key) as waited:
+            cached = translation_cache.get(key) if waited else None
+            if cached is not None:
+                # Another worker just answered the same query
+                outcome["source"] = "coalesced"
+                raw_result = cached
+                yield from cached.items()
+            else:
+                outcome["source"] = "model"
+                for field in _stream_model_fields(query, shell, fields):
+                    raw_result[field[0]] = field[1]
+                    yield field
+                translation_cache.set(key, raw_result)
+    except Exception as e:
+        flight.reject(e)
+        raise
+    except BaseException:
+        # The client went away mid-stream
+        flight.reject(CancelledFlightError("The identical request was cancelled"))
+        raise
+    flight.resolve(raw_result)
+
+def _resilient_model_fields(query, shell, outcome, fields=ALL_FIELDS):
+    """
+    Like _coalesced_model_fields, but falls back to a degraded answer
+    (outcome["source"] "degraded") if the model is unavailable before
+    anything was streamed
+    """
+    started = False
+    try:
+        for field in _coalesced_model_fields(query, shell, outcome, fields):
+            started = True
+            yield field
+    except UpstreamUnavailableError:
+        if started:
+            raise
+        with stage("degraded"):
+            result = degraded_translation(query, shell, fields)
+        if result is None:
+            raise
+        outcome["source"] = "degraded"
+        yield from result.items()
+
+def stream_translation(query, shell, fields=ALL_FIELDS, prefetch=False):
+    """
+    Yield server-sent events for a translation while the model generates it.
+    A "command" event (with its risk level) is sent as soon as the command is
+    complete, followed by one event per remaining field and a final "done"
+    event carrying the full result, watermark and copyright.
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    translator = TRANSLATORS[shell]
+    timestamp = time.time()
+    watermark = generate_watermark(query, timestamp)
+    
+    try:
+        with stage("lookup"):
+            local_result, source = lookup_translation(query, shell, fields)
+        if local_result is None and not openai_client:
+            TRANSLATIONS.inc(shell=shell, source="unavailable")
+            # Placeholder result explaining that an API key is required
+            result = api_key_required_result(shell)
+            for key, value in result.items():
+                yield format_sse(key, {key: value})
+        else:
+            outcome = {"source": source}
+            if local_result is not None:
+                generated = local_result.items()
+            else:
+                generated = _resilient_model_fields(query, shell, outcome, fields)
+            
+            raw_result = {}
+            for key, value in generated:
+                raw_result[key] = value
+                if key == "command":
+                    # Classify the command the moment it is known
+                    risk = translator["apply_risk"]({"command": value})
+                    yield format_sse("command", {
+                        "command": value,
+                        "risk_level": risk["risk_level"],
+                        "safety_warning": risk.get("safety_warning")
+                    })
+                else:
+                    yield format_sse(key, {key: value})
+            
+            source = outcome["source"]
+            TRANSLATIONS.inc(shell=shell, source=source)
+            
+            result = translator["apply_risk"](dict(raw_result))
+            result["cached"] = source == "cache"
+            result["source"] = source
+            attach_details_handle(result, query, shell, fields, prefetch)
+            log_command_request(query, result.get("command", ""), command_type=shell,
+                                explanation=result.get("explanation"), source=source)
+        
+        result['watermark'] = watermark
+        result['copyright'] = COPYRIGHT_INFO
+        result['timestamp'] = timestamp
+        yield format_sse("done", result)
+    
+    except Exception as e:
+        logging.error(f"Error streaming {shell} translation: {str(e)}")
+        yield format_sse("error", {"error": f"An error occurred: {str(e)}"})
+
+def _stream_response(shell):
+    data = request.json
+    natural_language_query = data.get('query', '')
+    
+    if not natural_language_query:
+        return jsonify({"error": "Query cannot be empty"}), 400
+    try:
+        fields = parse_fields(data.get('fields', request.args.get('fields')))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Create the history key now; the session cookie goes out with the headers
+    _history_owner()
+    return Response(
+        stream_with_context(stream_translation(natural_language_query, shell, fields, bool(data.get('prefetch')))),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route('/translate/stream', methods=['POST'])
+def translate_stream():
+    """
+    Stream a Linux translation as server-sent events
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    return _stream_response("linux")
+
+@app.route('/translate_powershell/stream', methods=['POST'])
+def translate_powershell_stream():
+    """
+    Stream a PowerShell translation as server-sent events
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    return _stream_response("powershell")
+
+# Limits for /translate/batch
+BATCH_MAX_QUERIES = int(os.environ.get("BATCH_MAX_QUERIES", "500"))
+BATCH_MAX_PARALLEL = int(os.environ.get("BATCH_MAX_PARALLEL", "8"))
+
+def translate_batch(queries, shell, fields=ALL_FIELDS):
+    """
+    Translate a list of queries, returning results in input order.
+    Queries that normalize to the same cache key are fetched once, cache
+    misses run concurrently with bounded parallelism, and all commands are
+    risk-classified together in one batch.
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    translator = TRANSLATORS[shell]
+    
+    # Dedupe on the cache key
+    keys = [translation_key(query, shell, fields) for query in queries]
+    unique = {}
+    for query, key in zip(queries, keys):
+        unique.setdefault(key, query)
+    
+    fetched = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(BATCH_MAX_PARALLEL, len(unique)))) as pool:
+        futures = {key: pool.submit(fetch_translation, query, shell, fields) for key, query in unique.items()}
+        for key, future in futures.items():
+            try:
+                fetched[key] = future.result()
+            except Exception as e:
+                logging.error(f"Batch translation error: {str(e)}")
+                fetched[key] = e
+    
+    # Classify every distinct command in one pass
+    classifier = LINUX_COMMAND_CLASSIFIER if shell == "linux" else POWERSHELL_RISK_CLASSIFIER
+    succeeded = [key for key in unique
+                 if not isinstance(fetched[key], Exception) and fetched[key][0] is not None]
+    classifications = dict(zip(
+        succeeded,
+        classifier.classify_many([fetched[key][0].get("command", "") for key in succeeded])
+    ))
+    
+    results = []
+    for query, key in zip(queries, keys):
+        outcome = fetched[key]
+        if isinstance(outcome, Exception):
+            results.append({"query": query, "error": f"Failed to process your request: {str(outcome)}"})
+            continue
+        raw_result, source = outcome
+        if raw_result is None:
+            results.append(dict(api_key_required_result(shell), query=query))
+            continue
+        result = translator["apply_risk"](dict(raw_result), classifications[key])
+        result["cached"] = source == "cache"
+        result["source"] = source
+        result["query"] = query
+        attach_details_handle(result, query, shell, fields)
+        log_command_request(query, result.get("command", ""), command_type=shell,
+                            explanation=result.get("explanation"), source=source)
+        results.append(result)
+    return results
+
+@app.route('/translate/batch', methods=['POST'])
+def translate_batch_route():
+    """
+    Translate a list of natural language queries in one request
+    Expects {"queries": [...], "shell": "linux" | "powershell"} and an
+    optional "fields" list like single translations
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    try:
+        data = request.json or {}
+        queries = data.get('queries')
+        shell = data.get('shell', 'linux')
+        
+        if not isinstance(queries, list) or not queries:
+            return jsonify({"error": "queries must be a non-empty list"}), 400
+        if shell not in TRANSLATORS:
+            return jsonify({"error": f"Unsupported shell: {shell}"}), 400
+        if len(queries) > BATCH_MAX_QUERIES:
+            return jsonify({"error": f"At most {BATCH_MAX_QUERIES} queries per batch"}), 413
+        if not all(isinstance(query, str) and query.strip() for query in queries):
+            return jsonify({"error": "Queries cannot be empty"}), 400
+        try:
+            fields = parse_fields(data.get('fields'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        started = time.perf_counter()
+        results = translate_batch([query.strip() for query in queries], shell, fields)
+        elapsed = time.perf_counter() - started
+        
+        # Watermark each result like single translations
+        timestamp = time.time()
+        for result in results:
+            result['watermark'] = generate_watermark(result['query'], timestamp)
+        
+        return jsonify({
+            "shell": shell,
+            "results": results,
+            "count": len(results),
+            "cached": sum(1 for result in results if result.get("cached")),
+            "errors": sum(1 for result in results if "error" in result),
+            "elapsed": round(elapsed, 4),
+            "queries_per_second": round(len(results) / elapsed, 2) if elapsed else None,
+            "copyright": COPYRIGHT_INFO,
+            "timestamp": timestamp
+        })
+    
+    except Exception as e:
+        logging.error(f"Error processing batch request: {str(e)}")
+        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+
 @app.route('/execute_powershell', methods=['POST'])
 def execute_powershell():
     """
@@ -480,15 +1529,28 @@ def execute_powershell():
     Copyright (c) 2024 Ervin Remus Radosavlevici
     """
     try:
-        from utils import log_command_request
-        
         data = request.json
         command = data.get('command', '').strip()
-        working_dir = data.get('working_dir', "C:\\Users\\Administrator\\Documents")
+        working_dir = data.get('working_dir', DEFAULT_WORKING_DIR)
         
         if not command:
             return jsonify({"error": "No command provided"}), 400
         
+        # Validate the command with the same rules used for translation
+        is_safe, reason, risk_level = validate_powershell_command(command)
+        
+        # Do not simulate high-risk commands
+        if not is_safe:
+            return jsonify({
+                "error": f"Command execution denied: {reason}",
+                "stdout": "",
+                "stderr": f"⚠️ EXECUTION BLOCKED: This high-risk command was not executed for safety reasons.",
+                "risk_level": risk_level,
+                "command": command,
+                "working_dir": working_dir,
+                "execution_successful": False
+            }), 403
+        
         # Log the command execution
         log_command_request(f"POWERSHELL EXECUTION: {command}", command, command_type="powershell")
         
@@ -499,77 +1561,23 @@ def execute_powershell():
         # Generate watermark
         watermark = generate_watermark(command, timestamp)
         
-        # Simulate execution result based on the command
-        if "Get-Process" in command:
-            stdout = "Handles  NPM(K)    PM(K)      WS(K)     CPU(s)     Id  SI ProcessName\n" + \
-                    "-------  ------    -----      -----     ------     --  -- -----------\n" + \
-                    "    562      38    58840      76456      15.27   7840   1 chrome\n" + \
-                    "    418      26    44784      56976       8.53   5844   1 explorer\n" + \
-                    "    211      16     7668      18456       1.14   2268   1 powershell\n" + \
-                    "    156      12     3276       9844       0.28   3952   1 svchost"
-            stderr = ""
-            exit_code = 0
-        elif "Get-ChildItem" in command or "dir" in command.lower() or "ls" in command.lower():
-            stdout = "Directory: " + working_dir + "\n\n" + \
-                    "Mode                 LastWriteTime         Length Name\n" + \
-                    "----                 -------------         ------ ----\n" + \
-                    "d-----          4/5/2024   1:14 PM                PowerShell Scripts\n" + \
-                    "d-----          4/2/2024  11:22 AM                Reports\n" + \
-                    "-a----          4/5/2024   3:43 PM           2458 deployment.log\n" + \
-                    "-a----          4/4/2024  10:19 AM          18548 results.csv\n" + \
-                    "-a----          4/1/2024   9:56 AM         124958 documentation.docx"
-            stderr = ""
-            exit_code = 0
-        elif "Get-Date" in command:
-            stdout = datetime.now().strftime("%A, %B %d, %Y %I:%M:%S %p")
-            stderr = ""
-            exit_code = 0
-        elif "Get-ComputerInfo" in command:
-            stdout = "WindowsBuildLabEx          : 14393.693.amd64fre.rs1_release.161220-1747\n" + \
-                    "WindowsCurrentVersion      : 6.3\n" + \
-                    "WindowsEditionId           : ServerStandard\n" + \
-                    "WindowsInstallationType    : Server\n" + \
-                    "WindowsProductName         : Windows Server 2022 Standard\n" + \
-                    "WindowsVersion             : 1607\n" + \
-                    "BiosFirmwareType           : Uefi\n" + \
-                    "CsProcessors                : {Intel(R) Xeon(R) CPU E5-2673 v4 @ 2.30GHz}\n" + \
-                    "CsNumberOfLogicalProcessors : 4\n" + \
-                    "CsNumberOfProcessors       : 1\n" + \
-                    "CsTotalPhysicalMemory      : 8589598720"
-            stderr = ""
-            exit_code = 0
-        elif "Remove-Item" in command and "-Force" in command and "-Recurse" in command:
-            stdout = ""
-            stderr = "Remove-Item : Operation not permitted for security reasons. Use -Confirm parameter for confirmation."
-            exit_code = 1
-        else:
-            stdout = "Command executed successfully in simulated PowerShell environment."
-            stderr = ""
-            exit_code = 0
-        
-        # Simulate system information
-        system_info = {
-            "hostname": "WIN-SERVER2022",
-            "os": "Windows Server 2022 Standard",
-            "powershell_version": "PowerShell Core 7.3.4",
-            "cpu": "Intel(R) Xeon(R) CPU E5-2673 v4 @ 2.30GHz",
-            "memory": "8 GB",
-        }
-        
-        # Calculate a simulated execution time (between 0.1 and 2.0 seconds)
-        execution_time = round(random.uniform(0.1, 2.0), 2)
+        # Run the command against the simulated host and time it
+        started = time.perf_counter()
+        result = simulate_powershell(command, working_dir)
+        execution_time = round(time.perf_counter() - started, 6)
         
         # Return results with system info and watermark
         return jsonify({
-            "stdout": stdout,
-            "stderr": stderr,
-            "exit_code": exit_code,
+            "stdout": result.stdout,
+            "stderr": result.stderr,
+            "exit_code": result.exit_code,
             "command": command,
-            "working_dir": working_dir,
-            "system_info": system_info,
+            "working_dir": result.working_dir,
+            "system_info": SYSTEM_INFO,
+            "risk_level": risk_level,
             "watermark": watermark,
             "execution_time": execution_time,
-            "execution_successful": exit_code == 0
+            "execution_successful": result.exit_code == 0
         })
     except Exception as e:
         logging.error(f"Error simulating PowerShell command: {str(e)}")
@@ -613,5 +1621,38 @@ def generate_watermark(content, timestamp):
         "authenticated_by": COPYRIGHT_INFO['owner']
     }
 
+# Inputs that take the classifiers and shell parser through their main paths
+_WARM_UP_COMMANDS = {
+    "linux": ["ls -la | grep log > /tmp/out.txt", "sudo rm -rf /tmp/build && echo done"],
+    "powershell": ["Get-ChildItem C:\\Logs | Sort-Object Length", "Remove-Item C:\\Temp -Recurse -Force"],
+}
+
+def warm_up():
+    """
+    One-time startup work done before the first request instead of during
+    it: compile the page templates, read the asset manifest and the host
+    context, build the prompts and schemas, and run the classifiers and
+    intent matchers once.
+    Under gunicorn --preload this runs once in the master process and the
+    workers share the result copy-on-write.
+    """
+    started = time.perf_counter()
+    for template in ("index.html", "powershell.html"):
+        app.jinja_env.get_template(template)
+    asset_manifest.entries()
+    host_context.get()
+    for shell in TRANSLATORS:
+        for fields in (ALL_FIELDS, QUICK_FIELDS):
+            translation_messages("", shell, fields)
+            response_format(fields)
+        build_details_messages("", "", shell, host_description(shell))
+        translate_offline("list files", shell)
+    response_format(OPTIONAL_FIELDS)
+    LINUX_COMMAND_CLASSIFIER.classify_many(_WARM_UP_COMMANDS["linux"])
+    POWERSHELL_RISK_CLASSIFIER.classify_many(_WARM_UP_COMMANDS["powershell"])
+    logging.info(f"Warm-up finished in {time.perf_counter() - started:.3f}s")
+
+warm_up()
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
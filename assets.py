@@ -0,0 +1,274 @@
+"""
+Fingerprinted, precompressed static assets
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+`python -m assets` builds static/ into ASSETS_DIR: CSS and JS are
+minified, every file gets a hash of its content in its name, and text
+files get gzip (and, with the brotli package, brotli) variants next to
+them. /static/ references inside CSS and JS are rewritten to the built
+files, and a manifest maps each source path to its built name.
+
+Templates link assets through asset_url(), which returns the built URL
+when a manifest exists and the plain /static/ one otherwise, so the app
+still works without a build. A built name never changes content, so
+built files are served with a year-long immutable Cache-Control, and a
+front-end proxy can serve ASSETS_DIR itself (see DEPLOYMENT.md).
+
+brotli is optional: without it only gzip variants are written.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+STATIC_DIR = os.path.join(_ROOT, "static")
+ASSETS_DIR = os.environ.get("ASSETS_DIR", os.path.join(_ROOT, "build", "assets"))
+ASSETS_URL = "/assets/"
+# Seconds browsers and proxies may keep a built asset
+ASSETS_MAX_AGE = int(os.environ.get("ASSETS_MAX_AGE", str(365 * 24 * 3600)))
+
+MANIFEST_NAME = "manifest.json"
+# Content-Encoding values in order of preference, with their file suffixes
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# Seconds between checks for a rebuilt manifest
+_MANIFEST_CHECK_INTERVAL = 5
+# Files worth compressing; images like PNG already are
+_COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt", ".html"}
+_HASH_LENGTH = 12
+
+_STATIC_REF_RE = re.compile(r"/static/([\w./-]+)")
+_CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+_CSS_SPACE_RE = re.compile(r"\s+")
+_CSS_PUNCTUATION_RE = re.compile(r"\s*([{};,>])\s*")
+_BACKTICK_RE = re.compile(r"(?<!\\)`")
+
+
+def minify_css(source):
+    """
+    Drop comments (except the copyright notice) and redundant whitespace
+    """
+    source = _CSS_COMMENT_RE.sub(
+        lambda m: m.group(0) if "Copyright" in m.group(0) else "", source
+    )
+    source = _CSS_SPACE_RE.sub(" ", source)
+    source = _CSS_PUNCTUATION_RE.sub(r"\1", source)
+    return source.replace(": ", ":").replace(";}", "}").strip()
+
+
+def minify_js(source):
+    """
+    Conservative JS minification: keep the leading copyright comment, then
+    drop blank lines, whole-line comments and indentation. Line breaks are
+    kept, so automatic semicolon insertion is unaffected, and lines inside
+    template literals are left exactly as written.
+    """
+    lines = source.splitlines()
+    output = []
+    index = 0
+    # The leading comment block is the licence header
+    in_comment = False
+    while index < len(lines):
+        stripped = lines[index].strip()
+        if in_comment or stripped.startswith("//") or stripped.startswith("/*"):
+            output.append(stripped)
+            in_comment = (in_comment or stripped.startswith("/*")) and "*/" not in stripped
+            index += 1
+        else:
+            break
+
+    in_template = False
+    in_comment = False
+    for line in lines[index:]:
+        if in_template:
+            output.append(line)
+        else:
+            stripped = line.strip()
+            if in_comment:
+                in_comment = "*/" not in stripped
+                continue
+            if not stripped or stripped.startswith("//"):
+                continue
+            if stripped.startswith("/*") and "*/" not in stripped[2:]:
+                in_comment = True
+                continue
+            if stripped.startswith("/*") and stripped.endswith("*/"):
+                continue
+            output.append(stripped)
+        if len(_BACKTICK_RE.findall(line)) % 2:
+            in_template = not in_template
+            if in_template:
+                # Trailing whitespace belongs to the template literal
+                output[-1] = line.lstrip()
+    return "\n".join(output) + "\n"
+
+
+_MINIFIERS = {".css": minify_css, ".js": minify_js}
+
+
+def _compress(encoding, content):
+    if encoding == "gzip":
+        return gzip.compress(content, compresslevel=9, mtime=0)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(content, quality=11)
+    return None
+
+
+def _write(directory, name, content):
+    path = os.path.join(directory, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(content)
+    os.replace(temporary, path)
+
+
+def build(static_dir=STATIC_DIR, output_dir=ASSETS_DIR):
+    """
+    Build every file under static_dir into output_dir and write the
+    manifest. Files from earlier builds are kept, so pages already served
+    can still load them. Returns the manifest.
+    """
+    sources = []
+    for root, _, files in os.walk(static_dir):
+        for name in files:
+            sources.append(os.path.relpath(os.path.join(root, name), static_dir).replace(os.sep, "/"))
+    # Everything else before CSS and JS, so those can refer to built names
+    sources.sort(key=lambda path: (os.path.splitext(path)[1] in _MINIFIERS, path))
+
+    manifest = {}
+
+    def built_reference(match):
+        built = manifest.get(match.group(1))
+        return ASSETS_URL + built if built else match.group(0)
+
+    for path in sources:
+        with open(os.path.join(static_dir, path), "rb") as f:
+            content = f.read()
+        stem, extension = os.path.splitext(path)
+        minify = _MINIFIERS.get(extension)
+        if minify is not None:
+            text = _STATIC_REF_RE.sub(built_reference, minify(content.decode("utf-8")))
+            content = text.encode("utf-8")
+        digest = hashlib.sha256(content).hexdigest()[:_HASH_LENGTH]
+        built = f"{stem}.{digest}{extension}"
+        _write(output_dir, built, content)
+        if extension in _COMPRESSIBLE:
+            for encoding, suffix in ENCODINGS:
+                compressed = _compress(encoding, content)
+                if compressed is not None and len(compressed) < len(content):
+                    _write(output_dir, built + suffix, compressed)
+        manifest[path] = built
+
+    # Written last, so a running server never links to files not yet built
+    _write(output_dir, MANIFEST_NAME, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+    return manifest
+
+
+class AssetManifest:
+    """
+    Maps static paths to built asset URLs, picking up rebuilds
+    """
+
+    def __init__(self, assets_dir=ASSETS_DIR, url_prefix=ASSETS_URL):
+        self.assets_dir = assets_dir
+        self.url_prefix = url_prefix
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._encodings = {}  # built name -> encodings with a variant on disk
+        self._mtime = None
+        self._checked_at = None
+        self.loads = 0
+
+    def _load(self):
+        path = os.path.join(self.assets_dir, MANIFEST_NAME)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime and self.loads:
+            return
+        entries = {}
+        if mtime is not None:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.error(f"Asset manifest unreadable: {str(e)}")
+        self._encodings = {
+            built: tuple(
+                encoding for encoding, suffix in ENCODINGS
+                if os.path.exists(os.path.join(self.assets_dir, built + suffix))
+            )
+            for built in entries.values()
+        }
+        self._entries = entries
+        self._mtime = mtime
+        self.loads += 1
+
+    def entries(self):
+        """
+        Return the manifest, rereading it if it has been rebuilt
+        """
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= _MANIFEST_CHECK_INTERVAL:
+            with self._lock:
+                if self._checked_at is None or now - self._checked_at >= _MANIFEST_CHECK_INTERVAL:
+                    self._load()
+                    self._checked_at = now
+        return self._entries
+
+    def url(self, path):
+        """
+        URL for the static file at path (relative to static/)
+        """
+        built = self.entries().get(path)
+        return f"{self.url_prefix}{built}" if built else f"/static/{path}"
+
+    def variant(self, filename, accepted):
+        """
+        Return (file to send, Content-Encoding or None) for the built asset
+        filename, given a predicate telling whether the client accepts an
+        encoding. Raises KeyError for names that are not built assets.
+        """
+        self.entries()
+        for encoding in self._encodings[filename]:
+            if accepted(encoding):
+                return filename + dict(ENCODINGS)[encoding], encoding
+        return filename, None
+
+
+asset_manifest = AssetManifest()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--static-dir", default=STATIC_DIR)
+    parser.add_argument("--output-dir", default=ASSETS_DIR)
+    args = parser.parse_args(argv)
+
+    manifest = build(args.static_dir, args.output_dir)
+    for path, built in sorted(manifest.items()):
+        sizes = [os.path.getsize(os.path.join(args.static_dir, path))]
+        for suffix in ("",) + tuple(suffix for _, suffix in ENCODINGS):
+            variant = os.path.join(args.output_dir, built + suffix)
+            sizes.append(os.path.getsize(variant) if os.path.exists(variant) else None)
+        print(f"{path} -> {built}  " + " / ".join("-" if size is None else str(size) for size in sizes))
+    if brotli is None:
+        print("brotli is not installed; only gzip variants were written")
+
+
+if __name__ == "__main__":
+    main()
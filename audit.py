@@ -0,0 +1,221 @@
+"""
+Persistent, batched audit log writer
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+log_command_request hands every entry to AuditLogWriter.submit, which only
+puts it on a bounded in-memory queue. A background thread drains the queue
+and writes entries in batches, one executemany INSERT per batch (which
+SQLAlchemy turns into multi-row INSERT ... VALUES statements on
+PostgreSQL/psycopg2), so audit logging adds no database round trip to
+/translate or /execute. The queue is flushed when the process exits.
+
+The database comes from AUDIT_DATABASE_URL, then DATABASE_URL, and falls
+back to a SQLite file. SQLAlchemy is only imported by the writer thread,
+when the first batch is written, so it stays off the startup path.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+from datetime import datetime
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def audit_schema():
+    """
+    Return (metadata, command_audit_log table), defined on first use
+    """
+    from sqlalchemy import BigInteger, Column, DateTime, Index, Integer, MetaData, String, Table, Text
+
+    metadata = MetaData()
+    command_audit_log = Table(
+        "command_audit_log",
+        metadata,
+        Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True),
+        Column("timestamp", DateTime, nullable=False),
+        Column("command_hash", String(64), nullable=False),
+        Column("command_type", String(16), nullable=False),
+        Column("user_query", Text, nullable=False),
+        Column("generated_command", Text, nullable=False),
+        Column("ip_address", String(45)),
+        Index("ix_command_audit_log_command_hash", "command_hash"),
+        Index("ix_command_audit_log_timestamp", "timestamp"),
+    )
+    return metadata, command_audit_log
+
+
+# Sentinel telling the writer thread to flush and stop
+_STOP = object()
+
+
+class BatchWriter:
+    """
+    Queues entries in memory and hands them to _write() in batches from a
+    background thread. Subclasses implement _write(batch).
+    """
+    # Used in the thread name and log messages
+    name = "batch"
+
+    def __init__(self, batch_size=500, flush_interval=1.0, max_queue=10000, enqueue_timeout=0.05):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    def _ensure_started(self):
+        # Threads do not survive fork, so each worker starts its own writer
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._reset()
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-writer", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+            atexit.register(self.close)
+
+    def _reset(self):
+        """
+        Drop per-process state (connections) inherited from the parent
+        """
+
+    def submit(self, entry):
+        """
+        Queue an entry for writing. When the queue is full this waits briefly
+        (backpressure) and then drops the entry rather than stall the request.
+        """
+        self._ensure_started()
+        try:
+            self._queue.put(entry, timeout=self.enqueue_timeout)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logging.warning(f"{self.name.capitalize()} queue full; entry dropped")
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = []
+            item = first
+            while True:
+                if item is _STOP:
+                    stopping = True
+                else:
+                    batch.append(item)
+                if stopping or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self._write(batch)
+                    with self._lock:
+                        self.written += len(batch)
+                        self.batches += 1
+                except Exception as e:
+                    with self._lock:
+                        self.failed += len(batch)
+                    logging.error(f"{self.name.capitalize()} write failed for {len(batch)} entries: {str(e)}")
+
+    def _write(self, batch):
+        raise NotImplementedError
+
+    def close(self, timeout=5.0):
+        """
+        Flush queued entries and stop the writer thread
+        """
+        thread = self._thread
+        if thread is None or not thread.is_alive() or self._pid != os.getpid():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logging.warning(f"{self.name.capitalize()} queue full at shutdown; some entries were not written")
+            return
+        thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "max_queue": self._queue.maxsize,
+                "written": self.written,
+                "batches": self.batches,
+                "dropped": self.dropped,
+                "failed": self.failed
+            }
+
+
+class AuditLogWriter(BatchWriter):
+    """
+    Writes audit entries to the audit database in batches from a
+    background thread
+    """
+    name = "audit log"
+
+    def __init__(self, database_url, batch_size=500, flush_interval=1.0,
+                 max_queue=10000, enqueue_timeout=0.05):
+        super().__init__(batch_size, flush_interval, max_queue, enqueue_timeout)
+        self.database_url = database_url
+        self._engine = None
+
+    def _reset(self):
+        self._engine = None
+
+    def _connect(self):
+        if self._engine is None:
+            from sqlalchemy import create_engine
+
+            metadata, _ = audit_schema()
+            self._engine = create_engine(self.database_url, pool_pre_ping=True)
+            metadata.create_all(self._engine)
+        return self._engine
+
+    def _write(self, batch):
+        rows = [
+            {
+                "timestamp": datetime.fromisoformat(entry["timestamp"]),
+                "command_hash": entry["command_hash"],
+                "command_type": entry["command_type"],
+                "user_query": entry["user_query"],
+                "generated_command": entry["generated_command"],
+                "ip_address": entry.get("ip_address"),
+            }
+            for entry in batch
+        ]
+        engine = self._connect()
+        _, command_audit_log = audit_schema()
+        with engine.begin() as connection:
+            connection.execute(command_audit_log.insert(), rows)
+
+
+def audit_database_url(default_path):
+    """
+    Resolve the audit database URL from the environment, falling back to
+    a SQLite file at default_path
+    """
+    url = os.environ.get("AUDIT_DATABASE_URL") or os.environ.get("DATABASE_URL")
+    if not url:
+        os.makedirs(os.path.dirname(default_path), exist_ok=True)
+        url = f"sqlite:///{default_path}"
+    # SQLAlchemy requires the postgresql:// scheme
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
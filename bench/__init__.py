@@ -0,0 +1,12 @@
+"""
+Benchmark and load-test suite
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+    python -m bench.micro         classifier, parser and watermark microbenchmarks
+    python -m bench.fake_openai   local stand-in for the OpenAI chat completions API
+    python -m bench.load          drive the app under gunicorn and measure it
+    python -m bench.startup       import time and time to first request
+
+Every tool writes its results as JSON (see --output) so runs can be
+compared over time.
+"""
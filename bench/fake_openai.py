@@ -0,0 +1,178 @@
+"""
+Local stand-in for the OpenAI chat completions API
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+Answers POST /v1/chat/completions with a canned translation after a
+configurable latency plus uniform jitter, both plain and streamed
+(stream=true), so the app can be load-tested without network access or
+API cost. Structured-output requests get only the fields in their
+schema. Point the app at it with OPENAI_BASE_URL=http://HOST:PORT/v1.
+
+    python -m bench.fake_openai [--port 8765] [--latency 0.5] [--jitter 0.1]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LINUX_ANSWER = {
+    "command": "du -ah /var/log | sort -rh | head -n 10",
+    "explanation": "Lists the ten largest files and directories under /var/log.",
+    "breakdown": {
+        "du -ah /var/log": "Report the size of every file and directory in human-readable units",
+        "sort -rh": "Sort human-readable sizes from largest to smallest",
+        "head -n 10": "Keep the first ten lines"
+    },
+    "simulation": "1.2G\t/var/log\n800M\t/var/log/journal\n120M\t/var/log/syslog.1",
+    "safety_warning": None
+}
+
+POWERSHELL_ANSWER = {
+    "command": "Get-ChildItem -Path C:\\Logs -Recurse | Sort-Object Length -Descending | Select-Object -First 10",
+    "explanation": "Lists the ten largest files under C:\\Logs.",
+    "breakdown": {
+        "Get-ChildItem -Path C:\\Logs -Recurse": "Enumerate every file below C:\\Logs",
+        "Sort-Object Length -Descending": "Order files from largest to smallest",
+        "Select-Object -First 10": "Keep the first ten"
+    },
+    "simulation": "Mode  LastWriteTime  Length Name\n-a---  1/1/2024  10485760 app.log",
+    "safety_warning": None
+}
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _answer(self, body):
+        system_prompt = next(
+            (m.get("content", "") for m in body.get("messages", []) if m.get("role") == "system"), ""
+        )
+        answer = POWERSHELL_ANSWER if "PowerShell" in system_prompt else LINUX_ANSWER
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            # Answer only the requested fields, in the schema's shapes
+            properties = response_format["json_schema"]["schema"]["properties"]
+            answer = {name: answer.get(name) for name in properties}
+            if "breakdown" in answer:
+                answer["breakdown"] = [
+                    {"part": part, "meaning": meaning} for part, meaning in answer["breakdown"].items()
+                ]
+        return json.dumps(answer)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", "0"))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+
+        server = self.server
+        time.sleep(max(0.0, server.latency + random.uniform(-server.jitter, server.jitter)))
+        with server.lock:
+            server.requests += 1
+
+        content = self._answer(body)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        model = body.get("model", "gpt-4o")
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            step = max(1, server.chunk_size)
+            for i in range(0, len(content), step):
+                self._write_chunk({
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": content[i:i + step]}, "finish_reason": None}]
+                })
+            self._write_chunk({
+                "id": completion_id, "object": "chat.completion.chunk", "created": created,
+                "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+            })
+            self._write_raw(b"data: [DONE]\n\n")
+            self._write_raw(b"")
+            return
+
+        payload = json.dumps({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 200, "completion_tokens": len(content) // 4, "total_tokens": 200 + len(content) // 4}
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _write_chunk(self, data):
+        self._write_raw(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+
+    def _write_raw(self, data):
+        # HTTP/1.1 chunked transfer encoding; an empty chunk ends the body
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """
+    Threaded fake API server with configurable latency and request count
+    """
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.5, jitter=0.1, chunk_size=16):
+        super().__init__((host, port), FakeOpenAIHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """
+        Serve from a background thread and return self
+        """
+        thread = threading.Thread(target=self.serve_forever, name="fake-openai", daemon=True)
+        thread.start()
+        return self
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds before each answer")
+    parser.add_argument("--jitter", type=float, default=0.1, help="uniform +/- seconds added to latency")
+    parser.add_argument("--chunk-size", type=int, default=16, help="characters per streamed chunk")
+    args = parser.parse_args(argv)
+
+    server = FakeOpenAIServer(args.host, args.port, args.latency, args.jitter, args.chunk_size)
+    print(f"Fake OpenAI API on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Load driver for the app running under gunicorn
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+Starts the fake OpenAI server and a gunicorn instance pointed at it
+(unless --url targets an already running app), then, for each concurrency
+level, runs client threads against one or more scenarios for a fixed time.
+It reports latency percentiles (total and time to first byte), requests
+per second, status counts and the resident memory of the gunicorn
+processes.
+
+Each client thread keeps its own connection and session cookie and sends
+its own X-Forwarded-For address, so it behaves like a separate browser.
+The gunicorn started here trusts one proxy hop (PROXY_HOPS=1) for that;
+an app behind --url needs the same to tell the clients apart.
+
+    python -m bench.load --scenario translate --concurrency 1,16,64 --duration 20 \\
+        --output bench/results/translate.json
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.common import REPO_ROOT, child_pids, process_rss, summarize, write_results  # noqa: E402
+from bench.fake_openai import FakeOpenAIServer  # noqa: E402
+
+BASE_QUERY = "show the ten largest files under /var/log"
+POWERSHELL_QUERY = "show the ten largest files under C:\\Logs"
+
+
+def _query(base, unique, sequence):
+    return f"{base} variant {next(sequence)}" if unique else base
+
+
+# name -> (path, function(unique, sequence) returning the JSON body)
+SCENARIOS = {
+    "translate": ("/translate", lambda unique, seq: {"query": _query(BASE_QUERY, unique, seq)}),
+    "translate_powershell": (
+        "/translate_powershell", lambda unique, seq: {"query": _query(POWERSHELL_QUERY, unique, seq)}
+    ),
+    "translate_stream": ("/translate/stream", lambda unique, seq: {"query": _query(BASE_QUERY, unique, seq)}),
+    "execute": ("/execute", lambda unique, seq: {"command": "echo bench"}),
+    "execute_stream": ("/execute/stream", lambda unique, seq: {"command": "echo bench"}),
+}
+
+
+class Client:
+    """
+    One simulated browser: a keep-alive connection and a session cookie
+    """
+
+    def __init__(self, url, index):
+        parts = urlsplit(url)
+        connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self._connect = lambda: connection_class(parts.hostname, parts.port, timeout=120)
+        self.connection = self._connect()
+        self.cookie = None
+        self.address = f"10.{(index >> 16) & 255}.{(index >> 8) & 255}.{index & 255}"
+
+    def post(self, path, body):
+        headers = {"Content-Type": "application/json", "X-Forwarded-For": self.address}
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        started = time.perf_counter()
+        try:
+            self.connection.request("POST", path, json.dumps(body), headers)
+            response = self.connection.getresponse()
+            first_byte = time.perf_counter() - started
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = self._connect()
+            return None, time.perf_counter() - started, None
+        cookie = response.getheader("Set-Cookie")
+        if cookie:
+            self.cookie = cookie.split(";", 1)[0]
+        return response.status, time.perf_counter() - started, first_byte
+
+
+def run_level(url, scenarios, concurrency, duration, warmup, unique):
+    """
+    Drive the app with concurrency client threads and return per-scenario results
+    """
+    sequence = itertools.count()
+    samples = []
+    samples_lock = threading.Lock()
+    measure_from = time.perf_counter() + warmup
+    deadline = measure_from + duration
+
+    def worker(index):
+        client = Client(url, index)
+        names = itertools.cycle(scenarios)
+        local = []
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            name = next(names)
+            path, make_body = SCENARIOS[name]
+            status, latency, first_byte = client.post(path, make_body(unique, sequence))
+            if now >= measure_from:
+                local.append((name, status, latency, first_byte))
+        client.connection.close()
+        with samples_lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    results = {}
+    for name in scenarios:
+        rows = [s for s in samples if s[0] == name]
+        ok = [s for s in rows if s[1] is not None and s[1] < 400]
+        results[name] = {
+            "requests": len(rows),
+            "requests_per_second": round(len(rows) / duration, 2),
+            "successful": len(ok),
+            "status_counts": dict(Counter(str(s[1]) if s[1] is not None else "connection_error" for s in rows)),
+            "latency": summarize([s[2] for s in ok]),
+            "time_to_first_byte": summarize([s[3] for s in ok])
+        }
+    return results
+
+
+class RSSSampler:
+    """
+    Samples the summed RSS of a process and its children in the background
+    """
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.last = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self):
+        pids = [self.pid] + child_pids(self.pid)
+        self.last = {pid: process_rss(pid) for pid in pids}
+        self.peak = max(self.peak, sum(self.last.values()))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.sample()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+        return {
+            "peak_total_bytes": self.peak,
+            "final_total_bytes": sum(self.last.values()),
+            "final_per_process_bytes": {str(pid): rss for pid, rss in self.last.items()}
+        }
+
+
+def start_gunicorn(port, args, fake_url, workdir):
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": fake_url,
+        "SESSION_SECRET": env.get("SESSION_SECRET", "bench"),
+        "GUNICORN_BIND": f"127.0.0.1:{port}",
+        "GUNICORN_WORKERS": str(args.workers),
+        "GUNICORN_THREADS": str(args.threads),
+        "AUDIT_DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'audit.db')}",
+        "EXECUTION_MAX_PER_CLIENT": env.get("EXECUTION_MAX_PER_CLIENT", "4"),
+        # The driver stands in for the reverse proxy that sets X-Forwarded-For
+        "PROXY_HOPS": "1",
+    })
+    if args.unique:
+        # Unique queries would otherwise be answered as near-duplicates
+        env["SEMANTIC_MATCH_THRESHOLD"] = "2"
+    log = open(os.path.join(workdir, "gunicorn.log"), "wb")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+        cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited early; see {log.name}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            connection.request("GET", "/")
+            if connection.getresponse().status == 200:
+                connection.close()
+                return process, url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn did not start within 60 seconds")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable); defaults to translate")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated client counts")
+    parser.add_argument("--duration", type=float, default=15, help="measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=2, help="unmeasured seconds before each level")
+    parser.add_argument("--unique", action="store_true",
+                        help="make every query unique so translations miss the caches")
+    parser.add_argument("--url", help="benchmark an already running app instead of starting gunicorn")
+    parser.add_argument("--port", type=int, default=5055, help="port for the gunicorn under test")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.5, help="fake OpenAI latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="fake OpenAI latency jitter in seconds")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args(argv)
+    scenarios = args.scenario or ["translate"]
+    levels = [int(level) for level in args.concurrency.split(",") if level]
+
+    fake = None
+    process = None
+    sampler = None
+    url = args.url
+    workdir = tempfile.mkdtemp(prefix="nlt-bench-")
+    try:
+        if not url:
+            fake = FakeOpenAIServer(latency=args.latency, jitter=args.jitter).start()
+            process, url = start_gunicorn(args.port, args, fake.base_url, workdir)
+            sampler = RSSSampler(process.pid).start()
+
+        results = {}
+        for level in levels:
+            print(f"concurrency {level}: {', '.join(scenarios)} for {args.duration:g}s", file=sys.stderr)
+            results[str(level)] = run_level(url, scenarios, level, args.duration, args.warmup, args.unique)
+
+        summary = {"levels": results}
+        if sampler:
+            summary["rss"] = sampler.stop()
+        if fake:
+            summary["upstream_requests"] = fake.requests
+        config = dict(vars(args), scenario=scenarios, workdir=workdir)
+        write_results("load", config, summary, args.output)
+    finally:
+        if process:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if fake:
+            fake.shutdown()
+
+
+if __name__ == "__main__":
+    main()
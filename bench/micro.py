@@ -0,0 +1,145 @@
+"""
+Microbenchmarks for command classification, parsing, simulation and watermarking
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+"warm" cases repeat the same inputs, so per-command caches are hit; "cold"
+cases make every input unique to measure the uncached path.
+
+    python -m bench.micro [--number N] [--repeat R] [--filter NAME] [--output FILE]
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.common import write_results  # noqa: E402
+
+LINUX_COMMANDS = [
+    "ls -la",
+    "find . -name '*.log' -mtime +7 -exec rm {} \\;",
+    "ps aux | grep python | awk '{print $2}'",
+    "tar -czvf backup.tar.gz /home/user/documents",
+    "du -sh * | sort -rh | head -n 10",
+    "curl -s https://example.com/install.sh | sh",
+    "sudo rm -rf /var/log/old",
+    "grep -rn 'TODO' src/ --include='*.py'",
+    "echo $(date) >> /tmp/run.log",
+    "dd if=/dev/zero of=/dev/sda bs=1M",
+    "chmod -R 777 /",
+    "docker ps -a --format '{{.Names}}'",
+]
+
+POWERSHELL_COMMANDS = [
+    "Get-ChildItem -Path C:\\Users -Recurse -Filter *.log",
+    "Get-Process | Sort-Object CPU -Descending | Select-Object -First 10",
+    "Remove-Item -Path C:\\Temp\\* -Recurse -Force",
+    "Stop-Computer -Force",
+    "Get-Service | Where-Object {$_.Status -eq 'Running'}",
+    "ls C:\\ | % { $_.Name }",
+    "Set-ExecutionPolicy Unrestricted",
+    "Invoke-WebRequest https://example.com/file.zip -OutFile file.zip",
+]
+
+QUERIES = [
+    "list all files in the current directory",
+    "show disk usage of the home folder",
+    "find files larger than 100MB in /var",
+    "show running processes sorted by memory",
+    "compress the logs directory into a tarball",
+]
+
+
+def _cold(commands, count, comment="#"):
+    # A trailing comment makes each command unique without changing its meaning
+    return [f"{commands[i % len(commands)]} {comment} {i}" for i in range(count)]
+
+
+def build_cases(number, repeat):
+    """
+    Return {name: (function, inputs)}; each call of function takes one input
+    """
+    from utils import (
+        LINUX_COMMAND_CLASSIFIER,
+        LINUX_RISK_CLASSIFIER,
+        validate_linux_command,
+        validate_powershell_command,
+    )
+    from shell_parser import parse_command
+    from intents import translate_offline
+    from cache import make_cache_key
+    from powershell_simulator import simulate as simulate_powershell
+
+    import app
+    logging.getLogger().setLevel(logging.WARNING)
+
+    total = number * repeat
+    linux_warm = [LINUX_COMMANDS[i % len(LINUX_COMMANDS)] for i in range(total)]
+    powershell_warm = [POWERSHELL_COMMANDS[i % len(POWERSHELL_COMMANDS)] for i in range(total)]
+    queries = [QUERIES[i % len(QUERIES)] for i in range(total)]
+    timestamp = time.time()
+
+    return {
+        "validate_linux_command.warm": (validate_linux_command, linux_warm),
+        "validate_linux_command.cold": (validate_linux_command, _cold(LINUX_COMMANDS, total)),
+        "parse_command.cold": (parse_command, _cold(LINUX_COMMANDS, total, "# parse")),
+        "regex_tiers.classify": (LINUX_RISK_CLASSIFIER.classify, linux_warm),
+        "classify_many.batch64": (
+            LINUX_COMMAND_CLASSIFIER.classify_many,
+            [_cold(LINUX_COMMANDS, 64, f"# batch{i}") for i in range(total)]
+        ),
+        "validate_powershell_command.warm": (validate_powershell_command, powershell_warm),
+        "validate_powershell_command.cold": (
+            validate_powershell_command, _cold(POWERSHELL_COMMANDS, total)
+        ),
+        "simulate_powershell.warm": (simulate_powershell, powershell_warm),
+        "translate_offline": (lambda query: translate_offline(query, "linux"), queries),
+        "make_cache_key": (lambda query: make_cache_key(query, "linux", app.OPENAI_MODEL), queries),
+        "generate_watermark": (lambda query: app.generate_watermark(query, timestamp), queries),
+    }
+
+
+def run_case(function, inputs, number, repeat):
+    """
+    Time repeat rounds of number calls and return per-call statistics
+    """
+    rounds = []
+    for r in range(repeat):
+        batch = inputs[r * number:(r + 1) * number]
+        started = time.perf_counter()
+        for item in batch:
+            function(item)
+        rounds.append((time.perf_counter() - started) / number)
+    best = min(rounds)
+    return {
+        "calls": number * repeat,
+        "best_us": round(best * 1e6, 3),
+        "median_us": round(statistics.median(rounds) * 1e6, 3),
+        "ops_per_second": round(1 / best) if best else None
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--number", type=int, default=2000, help="calls per round")
+    parser.add_argument("--repeat", type=int, default=5, help="timed rounds per case")
+    parser.add_argument("--filter", help="only run cases whose name contains this")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    cases = build_cases(args.number, args.repeat)
+    results = {}
+    for name, (function, inputs) in cases.items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = run_case(function, inputs, args.number, args.repeat)
+        print(f"{name:40s} {results[name]['best_us']:>12.3f} us/call", file=sys.stderr)
+
+    write_results("micro", vars(args), results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Cold-start benchmark: import time and time to first request
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+Measures, over several runs in fresh processes:
+
+- import: seconds to `import app` in a new interpreter, plus the process
+  wall time including interpreter start-up. With --importtime the slowest
+  top-level imports (from python -X importtime) are listed too.
+- boot: seconds from starting gunicorn to the first 200 from GET /, then
+  the latency of the first and second POST /translate (the first one pays
+  for anything deferred, such as building the OpenAI client). Runs with
+  and without --preload unless --preload-mode picks one.
+
+Translations go to the local fake OpenAI server with no added latency, so
+the numbers are the app's own start-up costs.
+
+    python -m bench.startup [--runs 5] [--workers 2] [--importtime] [--output FILE]
+"""
+import argparse
+import http.client
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.common import REPO_ROOT, summarize, write_results  # noqa: E402
+from bench.fake_openai import FakeOpenAIServer  # noqa: E402
+from bench.load import BASE_QUERY  # noqa: E402
+
+_IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import app; "
+    "print(time.perf_counter() - started)"
+)
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def app_env(fake_url, workdir):
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": fake_url,
+        "SESSION_SECRET": env.get("SESSION_SECRET", "bench"),
+        "AUDIT_DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'audit.db')}",
+        "LOG_LEVEL": "WARNING",
+        # Both translations should reach the model, not the semantic index
+        "SEMANTIC_MATCH_THRESHOLD": "2",
+    })
+    return env
+
+
+def measure_import(env, importtime=False):
+    """
+    Import app in a new interpreter. Returns (import seconds, process
+    seconds, top-level import timings or None)
+    """
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    started = time.perf_counter()
+    completed = subprocess.run(
+        command + ["-c", _IMPORT_SNIPPET], cwd=REPO_ROOT, env=env,
+        capture_output=True, text=True, check=True
+    )
+    wall = time.perf_counter() - started
+    imported = float(completed.stdout.strip().splitlines()[-1])
+    modules = None
+    if importtime:
+        modules = {}
+        for line in completed.stderr.splitlines():
+            found = _IMPORTTIME_RE.match(line)
+            # Only imports made directly by app (one level of nesting)
+            if found and len(found.group(3)) == 2:
+                modules[found.group(4)] = int(found.group(2)) / 1e6
+    return imported, wall, modules
+
+
+def _get(port, path):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        connection.request("GET", path)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def _post(port, path, body):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    started = time.perf_counter()
+    try:
+        connection.request("POST", path, json.dumps(body), {"Content-Type": "application/json"})
+        response = connection.getresponse()
+        response.read()
+        return response.status, time.perf_counter() - started
+    finally:
+        connection.close()
+
+
+def measure_boot(env, workers, preload, workdir, timeout=60):
+    """
+    Start gunicorn and time the first page and the first two translations
+    """
+    port = _free_port()
+    env = dict(env, GUNICORN_BIND=f"127.0.0.1:{port}", GUNICORN_WORKERS=str(workers),
+               GUNICORN_PRELOAD="1" if preload else "0")
+    log = open(os.path.join(workdir, f"gunicorn-{port}.log"), "wb")
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "main:app"],
+        cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    try:
+        deadline = started + timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited early; see {log.name}")
+            if time.perf_counter() > deadline:
+                raise RuntimeError(f"gunicorn did not answer within {timeout} seconds")
+            try:
+                if _get(port, "/") == 200:
+                    break
+            except OSError:
+                time.sleep(0.01)
+        first_page = time.perf_counter() - started
+        results = {"first_page": first_page}
+        for name, query in (("first_translate", BASE_QUERY), ("second_translate", f"{BASE_QUERY} again")):
+            status, elapsed = _post(port, "/translate", {"query": query})
+            if status != 200:
+                raise RuntimeError(f"/translate answered {status}; see {log.name}")
+            results[name] = elapsed
+        return results
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per measurement")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--preload-mode", choices=["both", "on", "off"], default="both",
+                        help="boot gunicorn with --preload, without it, or both")
+    parser.add_argument("--importtime", action="store_true",
+                        help="also list the slowest imports made by app")
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="nlt-startup-")
+    fake = FakeOpenAIServer(latency=0, jitter=0).start()
+    try:
+        env = app_env(fake.base_url, workdir)
+        imports, walls = [], []
+        for _ in range(args.runs):
+            imported, wall, _ = measure_import(env)
+            imports.append(imported)
+            walls.append(wall)
+        summary = {"import": {"app_import": summarize(imports), "process": summarize(walls)}}
+        print(f"import app: {summary['import']['app_import']['p50_ms']} ms (p50)", file=sys.stderr)
+        if args.importtime:
+            _, _, modules = measure_import(env, importtime=True)
+            slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:15]
+            summary["import"]["slowest_seconds"] = {name: round(seconds, 4) for name, seconds in slowest}
+
+        modes = {"both": [True, False], "on": [True], "off": [False]}[args.preload_mode]
+        summary["boot"] = {}
+        for preload in modes:
+            runs = [measure_boot(env, args.workers, preload, workdir) for _ in range(args.runs)]
+            mode = "preload" if preload else "no_preload"
+            summary["boot"][mode] = {
+                name: summarize([run[name] for run in runs])
+                for name in ("first_page", "first_translate", "second_translate")
+            }
+            print(f"{mode}: first page {summary['boot'][mode]['first_page']['p50_ms']} ms, "
+                  f"first translate {summary['boot'][mode]['first_translate']['p50_ms']} ms (p50)",
+                  file=sys.stderr)
+
+        write_results("startup", dict(vars(args), workdir=workdir), summary, args.output)
+    finally:
+        fake.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Translation cache for natural language -> command lookups
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+Users ask the same few hundred questions over and over, so raw model
+responses are cached keyed on a normalized query, the target shell and
+the model name. Entries live in a bounded in-memory LRU with a TTL and
+can optionally be written through to SQLite so warm entries survive
+gunicorn worker restarts.
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Characters folded away when normalizing a query
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+")
+# Sentence punctuation around a word
+_LEADING_PUNCTUATION = "'\"([{<"
+_TRAILING_PUNCTUATION = "'\")]}>,!?;:."
+# Words containing these (or starting with -) are paths, hosts, flags or
+# patterns, kept exactly as written
+_LITERAL_CHARS = frozenset("/\\~.$*=:@%+")
+# Names such as foo-bar, my_file or v1.2 are literals too
+_COMPOUND_RE = re.compile(r"\w[-_.]\w")
+# Quoted text is a pattern or an argument, kept as one literal word
+_WORD_RE = re.compile(r"""(['"])[^'"]*\1|\S+""")
+# Fields marking a stand-in answer (an outage fallback or a near-duplicate
+# query's translation) rather than the model's answer to the query itself
+_STAND_IN_FIELDS = ("degraded", "similar_query")
+# Seconds between purges of expired rows from the SQLite store
+_PURGE_INTERVAL = 300
+
+
+def _normalize_word(word):
+    if len(word) > 1 and word[0] in "'\"" and word[-1] == word[0]:
+        return word
+    stripped = word.lstrip(_LEADING_PUNCTUATION)
+    # "." and ".." are directories, not sentence punctuation
+    if stripped.strip("./"):
+        stripped = stripped.rstrip(_TRAILING_PUNCTUATION)
+    if stripped.startswith("-") or _LITERAL_CHARS.intersection(stripped) or _COMPOUND_RE.search(stripped):
+        return stripped
+    return _PUNCTUATION_RE.sub(" ", stripped.casefold()).strip()
+
+
+def normalize_query(query):
+    """
+    Fold case, punctuation and whitespace so trivially different phrasings
+    ("List files by size!" / "list  files by size") share a cache entry.
+    Paths, flags, addresses, names like foo-bar and quoted text keep their
+    case and punctuation, so "~/tmp" and "/tmp", "foo-bar" and "foo bar",
+    or "grep 'Error'" and "grep 'error'" are different queries.
+    """
+    words = (_normalize_word(match.group()) for match in _WORD_RE.finditer(query))
+    return " ".join(word for word in words if word)
+
+
+def make_cache_key(query, shell, model, fields=None):
+    """
+    Build the cache key for a query translated to a shell by a model.
+    Translations limited to some fields are keyed separately from full ones.
+    """
+    key = f"{shell}|{model}|{normalize_query(query)}"
+    return f"{key}|{','.join(fields)}" if fields else key
+
+
+class TranslationCache:
+    """
+    Bounded LRU/TTL cache of translation results with optional SQLite backing
+    """
+
+    def __init__(self, max_entries=1024, ttl=24 * 3600, db_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (stored_at, result)
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_pid = None
+        self._last_purge = time.monotonic()
+
+    def _connection(self):
+        """
+        Return the SQLite connection for this process, opening it lazily
+        (connections must not be shared across forked gunicorn workers)
+        """
+        if not self.db_path:
+            return None
+        if self._db is None or self._db_pid != os.getpid():
+            try:
+                self._db = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS translation_cache ("
+                    "cache_key TEXT PRIMARY KEY, stored_at REAL NOT NULL, result TEXT NOT NULL)"
+                )
+                self._db.execute(
+                    "CREATE INDEX IF NOT EXISTS ix_translation_cache_stored_at "
+                    "ON translation_cache (stored_at)"
+                )
+                self._db.commit()
+                self._db_pid = os.getpid()
+            except sqlite3.Error as e:
+                logging.error(f"Translation cache database unavailable: {str(e)}")
+                self.db_path = None
+                self._db = None
+        return self._db
+
+    def _expired(self, stored_at, now):
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def get(self, key):
+        """
+        Return a cached result for key or None, updating hit/miss counters
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, result = entry
+                if not self._expired(stored_at, now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(result)
+                del self._entries[key]
+
+            # Fall back to the persistent store shared between workers
+            db = self._connection()
+            if db is not None:
+                try:
+                    row = db.execute(
+                        "SELECT stored_at, result FROM translation_cache WHERE cache_key = ?",
+                        (key,)
+                    ).fetchone()
+                except sqlite3.Error as e:
+                    logging.error(f"Translation cache read failed: {str(e)}")
+                    row = None
+                if row is not None and not self._expired(row[0], now):
+                    self._store(key, row[0], row[1])
+                    self.hits += 1
+                    return json.loads(row[1])
+
+            self.misses += 1
+            return None
+
+    def set(self, key, result):
+        """
+        Store a result (any JSON-serializable dict) under key. Stand-in
+        answers are not stored, so they are never served as real ones.
+        """
+        if any(result.get(field) for field in _STAND_IN_FIELDS):
+            return
+        now = time.time()
+        payload = json.dumps(result)
+        with self._lock:
+            self._store(key, now, payload)
+            db = self._connection()
+            if db is not None:
+                try:
+                    db.execute(
+                        "INSERT OR REPLACE INTO translation_cache (cache_key, stored_at, result) VALUES (?, ?, ?)",
+                        (key, now, payload)
+                    )
+                    if self.ttl is not None and time.monotonic() - self._last_purge >= _PURGE_INTERVAL:
+                        self._last_purge = time.monotonic()
+                        db.execute("DELETE FROM translation_cache WHERE stored_at < ?", (now - self.ttl,))
+                    db.commit()
+                except sqlite3.Error as e:
+                    logging.error(f"Translation cache write failed: {str(e)}")
+
+    def _store(self, key, stored_at, payload):
+        # Caller holds the lock
+        self._entries[key] = (stored_at, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Drop all in-memory entries and reset the counters
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Return hit/miss counters and current size
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "persistent": bool(self.db_path)
+            }
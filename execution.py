@@ -0,0 +1,354 @@
+"""
+Streaming command execution
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+Commands run under subprocess.Popen with both pipes switched to
+non-blocking mode and multiplexed with a selector, so output is handed to
+the caller chunk by chunk as the command produces it instead of being
+buffered until exit. Total output is capped per command: once the cap is
+reached a truncation marker is emitted and the rest is read and discarded,
+so memory stays bounded even for chatty commands like `find /`. When the
+timeout fires the process group is killed and everything already emitted
+is kept.
+
+Each child also runs under CPU-time, address-space and file-size rlimits,
+and ExecutionScheduler caps how many commands a worker runs at once. It
+queues a bounded number of waiting requests and serves clients round-robin,
+so one client cannot crowd out the rest.
+"""
+import codecs
+import math
+import os
+import selectors
+import signal
+import subprocess
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# Seconds a command may run before it is killed
+EXECUTION_TIMEOUT = float(os.environ.get("EXECUTION_TIMEOUT", "15"))
+# Maximum bytes of stdout + stderr passed on per command
+EXECUTION_MAX_OUTPUT_BYTES = int(os.environ.get("EXECUTION_MAX_OUTPUT_BYTES", str(256 * 1024)))
+
+# Commands running at once per worker, and requests allowed to wait for a slot
+EXECUTION_MAX_CONCURRENCY = int(os.environ.get("EXECUTION_MAX_CONCURRENCY", str(os.cpu_count() or 2)))
+EXECUTION_QUEUE_SIZE = int(os.environ.get("EXECUTION_QUEUE_SIZE", "32"))
+# Running plus queued commands allowed per client
+EXECUTION_MAX_PER_CLIENT = int(os.environ.get("EXECUTION_MAX_PER_CLIENT", "2"))
+# Seconds a queued request waits for a slot before giving up
+EXECUTION_QUEUE_TIMEOUT = float(os.environ.get("EXECUTION_QUEUE_TIMEOUT", "10"))
+# Per-command resource limits
+EXECUTION_CPU_SECONDS = int(os.environ.get("EXECUTION_CPU_SECONDS", str(math.ceil(EXECUTION_TIMEOUT))))
+EXECUTION_MEMORY_BYTES = int(os.environ.get("EXECUTION_MEMORY_MB", "512")) * 1024 * 1024
+EXECUTION_FILE_SIZE_BYTES = int(os.environ.get("EXECUTION_FILE_SIZE_MB", "64")) * 1024 * 1024
+
+TRUNCATION_MARKER = "\n[output truncated after {limit} bytes]\n"
+
+_READ_SIZE = 65536
+
+
+def resource_limits_script(file_block_size=512):
+    """
+    Shell commands applying the per-command rlimits to the shell and
+    everything it starts. The shell sets them itself before reading the
+    command, because preexec_fn is unsafe in a threaded server and
+    prlimit() after spawning races with the command's first fork.
+    file_block_size is the shell's ulimit -f unit: 512 bytes for POSIX
+    sh, 1024 for bash outside POSIX mode.
+    """
+    limits = (
+        ("-t", EXECUTION_CPU_SECONDS),
+        ("-v", EXECUTION_MEMORY_BYTES // 1024),
+        ("-f", EXECUTION_FILE_SIZE_BYTES // file_block_size),
+    )
+    # One limit per ulimit call, which is all dash accepts
+    return "; ".join(f"ulimit {flag} {value} 2>/dev/null" for flag, value in limits)
+
+
+def _kill_group(process):
+    # The command runs in its own session, so this also reaches its children
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def stream_command(command, cwd=None, timeout=EXECUTION_TIMEOUT,
+                   max_output_bytes=EXECUTION_MAX_OUTPUT_BYTES):
+    """
+    Run a shell command and yield (stream, text) pairs as output arrives,
+    where stream is "stdout" or "stderr". The last item is ("exit", info)
+    with exit_code, timed_out, truncated, output_bytes and duration.
+    Closing the generator early kills the command.
+    """
+    started = time.monotonic()
+    deadline = started + timeout
+    process = subprocess.Popen(
+        # On the same line, so error messages keep the command's line numbers
+        f"{resource_limits_script()}; {command}",
+        shell=True,
+        cwd=cwd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True
+    )
+    selector = selectors.DefaultSelector()
+    decoders = {}
+    for name, pipe in (("stdout", process.stdout), ("stderr", process.stderr)):
+        os.set_blocking(pipe.fileno(), False)
+        selector.register(pipe, selectors.EVENT_READ, name)
+        decoders[name] = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    output_bytes = 0
+    truncated = False
+    timed_out = False
+    try:
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                break
+            for key, _ in selector.select(remaining):
+                try:
+                    data = os.read(key.fd, _READ_SIZE)
+                except BlockingIOError:
+                    continue
+                if not data:
+                    selector.unregister(key.fileobj)
+                    tail = decoders[key.data].decode(b"", final=True)
+                    if tail and not truncated:
+                        yield key.data, tail
+                    continue
+                if truncated:
+                    # Keep draining so the command is not blocked on a full pipe
+                    continue
+                allowed = max_output_bytes - output_bytes
+                if len(data) > allowed:
+                    data = data[:allowed]
+                    truncated = True
+                output_bytes += len(data)
+                text = decoders[key.data].decode(data, final=truncated)
+                if text:
+                    yield key.data, text
+                if truncated:
+                    yield key.data, TRUNCATION_MARKER.format(limit=max_output_bytes)
+
+        if timed_out:
+            _kill_group(process)
+        try:
+            exit_code = process.wait(max(deadline - time.monotonic(), 0.1))
+        except subprocess.TimeoutExpired:
+            # Pipes were closed but the process has not exited yet
+            timed_out = True
+            _kill_group(process)
+            exit_code = process.wait()
+
+        yield "exit", {
+            "exit_code": exit_code,
+            "timed_out": timed_out,
+            "truncated": truncated,
+            "output_bytes": output_bytes,
+            "duration": round(time.monotonic() - started, 3)
+        }
+    finally:
+        selector.close()
+        if process.poll() is None:
+            _kill_group(process)
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+
+def collect_output(events):
+    """
+    Drain (stream, text) events from stream_command (or a shell session)
+    into a dict with stdout, stderr and the fields of the exit info
+    """
+    output = {"stdout": [], "stderr": []}
+    info = {}
+    for stream, value in events:
+        if stream == "exit":
+            info = value
+        else:
+            output[stream].append(value)
+    info["stdout"] = "".join(output["stdout"])
+    info["stderr"] = "".join(output["stderr"])
+    return info
+
+
+def run_command(command, cwd=None, timeout=EXECUTION_TIMEOUT,
+                max_output_bytes=EXECUTION_MAX_OUTPUT_BYTES):
+    """
+    Run a shell command to completion and return a dict with stdout, stderr
+    and the exit info from stream_command. Output produced before a
+    timeout is kept.
+    """
+    return collect_output(stream_command(command, cwd, timeout, max_output_bytes))
+
+
+class ExecutionBusyError(Exception):
+    """
+    Raised when a command cannot be admitted to the execution pool.
+    retry_after is a suggested wait in seconds.
+    """
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("client", "event", "granted", "queued_at")
+
+    def __init__(self, client):
+        self.client = client
+        self.event = threading.Event()
+        self.granted = False
+        self.queued_at = time.monotonic()
+
+
+class ExecutionScheduler:
+    """
+    Fixed number of execution slots with a bounded, per-client fair queue.
+    Slots freed while requests are waiting go to clients in round-robin
+    order; each client gets its own FIFO.
+    """
+
+    def __init__(self, max_concurrency, max_queue, max_per_client, queue_timeout):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_per_client = max_per_client
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        # client -> deque of waiters, in round-robin order
+        self._waiting = OrderedDict()
+        self._queued = 0
+        self._running = 0
+        self._per_client = {}
+        self._recent_waits = deque(maxlen=1000)
+        self._run_time = 1.0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.completed = 0
+        self.max_wait = 0.0
+
+    def _retry_after(self):
+        # Rough time for the queue ahead to drain, from the average run time
+        backlog = (self._queued + 1) / self.max_concurrency
+        return max(1, math.ceil(backlog * self._run_time))
+
+    def _reject(self, message):
+        self.rejected += 1
+        raise ExecutionBusyError(message, self._retry_after())
+
+    def acquire(self, client):
+        """
+        Wait for an execution slot for client. Raises ExecutionBusyError
+        if the queue or the client's share is full, or the wait times out.
+        """
+        with self._lock:
+            if self._per_client.get(client, 0) >= self.max_per_client:
+                self._reject("Too many commands from this client are running or queued")
+            if self._running < self.max_concurrency and not self._queued:
+                self._per_client[client] = self._per_client.get(client, 0) + 1
+                self._admit(client, 0.0)
+                return
+            if self._queued >= self.max_queue:
+                self._reject("Execution queue is full, please retry shortly")
+            waiter = _Waiter(client)
+            self._waiting.setdefault(client, deque()).append(waiter)
+            self._queued += 1
+            self._per_client[client] = self._per_client.get(client, 0) + 1
+
+        waiter.event.wait(self.queue_timeout)
+        with self._lock:
+            if waiter.granted:
+                return
+            # Timed out: leave the queue
+            waiters = self._waiting[client]
+            waiters.remove(waiter)
+            if not waiters:
+                del self._waiting[client]
+            self._queued -= 1
+            self._release_client(client)
+            self.timed_out += 1
+            self._reject("Timed out waiting for an execution slot")
+
+    def _admit(self, client, waited):
+        self._running += 1
+        self.admitted += 1
+        self._recent_waits.append(waited)
+        self.max_wait = max(self.max_wait, waited)
+
+    def _release_client(self, client):
+        remaining = self._per_client[client] - 1
+        if remaining:
+            self._per_client[client] = remaining
+        else:
+            del self._per_client[client]
+
+    def release(self, client, run_time=None):
+        """
+        Free the slot held by client and hand it to the next waiting client
+        """
+        with self._lock:
+            self._running -= 1
+            self.completed += 1
+            self._release_client(client)
+            if run_time is not None:
+                # Exponentially weighted average used for Retry-After
+                self._run_time = 0.8 * self._run_time + 0.2 * run_time
+            if self._waiting and self._running < self.max_concurrency:
+                next_client, waiters = self._waiting.popitem(last=False)
+                waiter = waiters.popleft()
+                if waiters:
+                    # Rotate the client to the back of the line
+                    self._waiting[next_client] = waiters
+                self._queued -= 1
+                waiter.granted = True
+                self._admit(next_client, time.monotonic() - waiter.queued_at)
+                waiter.event.set()
+
+    @contextmanager
+    def slot(self, client):
+        """
+        Hold one execution slot for client for the duration of the with-block
+        """
+        self.acquire(client)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(client, time.monotonic() - started)
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._recent_waits)
+            return {
+                "running": self._running,
+                "max_concurrency": self.max_concurrency,
+                "queue_depth": self._queued,
+                "max_queue": self.max_queue,
+                "max_per_client": self.max_per_client,
+                "waiting_clients": len(self._waiting),
+                "admitted": self.admitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "wait_seconds": {
+                    "p50": round(waits[len(waits) // 2], 4) if waits else 0.0,
+                    "p95": round(waits[int(len(waits) * 0.95)], 4) if waits else 0.0,
+                    "max": round(self.max_wait, 4)
+                },
+                "average_run_seconds": round(self._run_time, 3)
+            }
+
+
+execution_scheduler = ExecutionScheduler(
+    EXECUTION_MAX_CONCURRENCY, EXECUTION_QUEUE_SIZE,
+    EXECUTION_MAX_PER_CLIENT, EXECUTION_QUEUE_TIMEOUT
+)
@@ -0,0 +1,406 @@
+"""
+Short-lived cache of read-only command executions
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+In demos and classrooms everyone runs the same step at once: ten people
+running `df -h` within a second fork ten shells for ten identical answers.
+Commands that are provably read-only are therefore cached for a few
+seconds, and identical executions already running are joined rather than
+started again (see singleflight.SingleFlight).
+
+A command is cacheable only if every stage of it, including command
+substitutions, runs a program from READ_ONLY_PROGRAMS with arguments that
+program cannot use to write or to run forever, there are no variable
+expansions, and nothing is redirected except to /dev/null or another file
+descriptor. The risk classifier must also rate it 0; the app checks that.
+Each program belongs to a class whose TTL fits how fast its output goes
+stale: seconds for file listings, about one for live process and memory
+figures, a minute for host facts. A command's TTL is the shortest among
+its stages.
+
+Entries are keyed on the command hash, the working directory, the user
+the command runs as and the state of the browser's persistent shell (see
+shell_sessions.ShellSessionManager.state_key). While that shell is as a
+fresh one would be, cached commands run one-shot in its directory and
+their results are shared by everyone; once it may have gained variables,
+aliases or functions, they run in that shell and are cached for it alone.
+
+A request joins the cache with begin(), which settles at once whether it
+replays a result, shares a run in progress or runs the command itself.
+Only in that last case does it take an execution slot, so a request never
+skips the slot on the strength of a run that has since finished.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from shell_parser import ShellParseError, command_name, parse_command
+from singleflight import CancelledFlightError, SingleFlight
+
+# Entries kept per worker and their total output size; 0 entries disables caching
+EXECUTION_CACHE_SIZE = int(os.environ.get("EXECUTION_CACHE_SIZE", "256"))
+EXECUTION_CACHE_MAX_BYTES = int(os.environ.get("EXECUTION_CACHE_MAX_MB", "16")) * 1024 * 1024
+
+# Seconds results stay fresh, per command class; 0 disables a class
+EXECUTION_CACHE_TTLS = {
+    "system": float(os.environ.get("EXECUTION_CACHE_TTL_SYSTEM", "60")),
+    "files": float(os.environ.get("EXECUTION_CACHE_TTL_FILES", "5")),
+    "live": float(os.environ.get("EXECUTION_CACHE_TTL_LIVE", "1")),
+}
+
+
+def _no_short_flags(*flags, long=()):
+    """
+    Argument check rejecting the given short flags (also inside clusters
+    such as -nf) and long options
+    """
+    def check(args):
+        for arg in args:
+            if arg.startswith("--"):
+                if arg.split("=", 1)[0] in long:
+                    return False
+            elif arg.startswith("-") and any(flag in arg[1:] for flag in flags):
+                return False
+        return True
+    return check
+
+
+def _no_words(*words):
+    """
+    Argument check rejecting any of the given words
+    """
+    return lambda args: not any(arg in words for arg in args)
+
+
+def _options_only(args):
+    # vmstat DELAY repeats forever
+    return all(arg.startswith("-") for arg in args)
+
+
+def _hostname_args(args):
+    # hostname NAME and hostname -F FILE set the name rather than show it
+    return _options_only(args) and not any(arg in ("-F", "-b") or arg.startswith("--file")
+                                           for arg in args)
+
+
+def _date_args(args):
+    # date MMDDhhmm and date -s set the clock; date +FORMAT only shows it
+    for arg in args:
+        if arg.startswith("+"):
+            continue
+        if not arg.startswith("-") or arg in ("-s", "--set") or arg.startswith("--set="):
+            return False
+    return True
+
+
+# Read-only programs: name -> (class, argument check or None)
+READ_ONLY_PROGRAMS = {
+    # Host facts
+    "uname": ("system", None),
+    "hostname": ("system", _hostname_args),
+    "whoami": ("system", None),
+    "id": ("system", None),
+    "groups": ("system", None),
+    "arch": ("system", None),
+    "nproc": ("system", None),
+    "lscpu": ("system", None),
+    "lsb_release": ("system", None),
+    "getconf": ("system", None),
+    "echo": ("system", None),
+    "printf": ("system", _no_words("-v")),
+    "which": ("system", None),
+    "true": ("system", None),
+    # Files and directories
+    "ls": ("files", None),
+    "dir": ("files", None),
+    "pwd": ("files", None),
+    "cat": ("files", None),
+    "head": ("files", None),
+    "tail": ("files", _no_short_flags("f", "F", long=("--follow", "--retry"))),
+    "wc": ("files", None),
+    "stat": ("files", None),
+    "file": ("files", _no_short_flags("C", long=("--compile",))),
+    "du": ("files", None),
+    "df": ("files", None),
+    "tree": ("files", _no_short_flags("o")),
+    "find": ("files", _no_words("-exec", "-execdir", "-ok", "-okdir", "-delete",
+                                "-fprint", "-fprint0", "-fprintf", "-fls")),
+    "grep": ("files", None),
+    "egrep": ("files", None),
+    "fgrep": ("files", None),
+    "sort": ("files", _no_short_flags("o", long=("--output", "--compress-program"))),
+    "cut": ("files", None),
+    "tr": ("files", None),
+    "nl": ("files", None),
+    "column": ("files", None),
+    "basename": ("files", None),
+    "dirname": ("files", None),
+    "realpath": ("files", None),
+    "readlink": ("files", None),
+    "md5sum": ("files", None),
+    "sha1sum": ("files", None),
+    "sha256sum": ("files", None),
+    "diff": ("files", None),
+    "cmp": ("files", None),
+    # Live figures
+    "date": ("live", _date_args),
+    "uptime": ("live", None),
+    "free": ("live", _no_short_flags("s", "c", long=("--seconds", "--count"))),
+    "ps": ("live", None),
+    "who": ("live", None),
+    "w": ("live", None),
+    "users": ("live", None),
+    "vmstat": ("live", _options_only),
+    "lsblk": ("live", None),
+    "ss": ("live", _no_short_flags("K", long=("--kill",))),
+    "netstat": ("live", _no_short_flags("c", long=("--continuous",))),
+}
+
+# Control operators allowed between stages ("&" would outlive the request)
+_ALLOWED_OPERATORS = frozenset([None, "|", "|&", "&&", "||", ";"])
+_UNSAFE_TEXT = ("$", "`", "<(", ">(")
+# `ls() { ...; }` parses as harmless stages but defines a function
+_FUNCTION_DEFINITION_RE = re.compile(r"\(\s*\)")
+
+
+def command_class(command):
+    """
+    Return the class of the shortest-lived stage of a read-only command,
+    or None if command is not provably read-only
+    """
+    if any(text in command for text in _UNSAFE_TEXT) or _FUNCTION_DEFINITION_RE.search(command):
+        return None
+    try:
+        stages = parse_command(command).stages
+    except ShellParseError:
+        return None
+    if not stages:
+        return None
+    shortest = None
+    for stage in stages:
+        if not stage.argv or stage.operator not in _ALLOWED_OPERATORS:
+            return None
+        program = READ_ONLY_PROGRAMS.get(command_name(stage.argv[0]))
+        if program is None:
+            return None
+        cls, check = program
+        if check is not None and not check(stage.argv[1:]):
+            return None
+        for redirection in stage.redirections:
+            if redirection.operator in (">&", "<&") and (redirection.target or "").isdigit():
+                continue
+            if redirection.operator in (">", ">>", "&>") and redirection.target == "/dev/null":
+                continue
+            if redirection.operator == "<":
+                continue
+            return None
+        if shortest is None or EXECUTION_CACHE_TTLS[cls] < EXECUTION_CACHE_TTLS[shortest]:
+            shortest = cls
+    return shortest
+
+
+class ExecutionCache:
+    """
+    Bounded LRU of recent results of read-only commands, with per-class
+    TTLs and coalescing of identical executions in progress
+    """
+
+    def __init__(self, max_entries=EXECUTION_CACHE_SIZE, max_bytes=EXECUTION_CACHE_MAX_BYTES,
+                 ttls=EXECUTION_CACHE_TTLS, wait_timeout=60):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttls = dict(ttls)
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        # key -> (expires, stored_at, exit info, stdout, stderr)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # Failed runs are not remembered; the next request runs the command again
+        self._flights = SingleFlight(negative_ttl=0, lock_dir=None, lock_timeout=wait_timeout)
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.bypassed = 0
+        self.stored = 0
+
+    def ttl(self, command, bypass=False):
+        """
+        Seconds a result of command may be reused, or None if it must run
+        every time. bypass is the client asking for a fresh run.
+        """
+        if self.max_entries <= 0:
+            return None
+        cls = command_class(command)
+        ttl = self.ttls.get(cls) if cls else None
+        if not ttl:
+            return None
+        if bypass:
+            with self._lock:
+                self.bypassed += 1
+            return None
+        return ttl
+
+    @staticmethod
+    def key(command, working_dir, shell_state=""):
+        """
+        Cache key: the user commands run as, the directory, the state of
+        the shell they run in and the command hash
+        """
+        # Import here to avoid circular imports
+        from utils import generate_command_hash
+
+        return f"{os.geteuid()}|{working_dir}|{shell_state}|{generate_command_hash(command)}"
+
+    def _entry_size(self, entry):
+        return len(entry[3]) + len(entry[4])
+
+    def _lookup(self, key):
+        # Caller holds the lock
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() >= entry[0]:
+            self._bytes -= self._entry_size(self._entries.pop(key))
+            entry = None
+        return entry
+
+    def _store(self, key, entry):
+        # Huge outputs would evict everything else
+        if self._entry_size(entry) > self.max_bytes // 8:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entry_size(self._entries.pop(key))
+            self._entries[key] = entry
+            self._bytes += self._entry_size(entry)
+            self.stored += 1
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._bytes -= self._entry_size(self._entries.popitem(last=False)[1])
+
+    @staticmethod
+    def _replay(entry, source):
+        _, stored_at, info, stdout, stderr = entry
+        if stdout:
+            yield "stdout", stdout
+        if stderr:
+            yield "stderr", stderr
+        yield "exit", dict(info, cache=source, cache_age=round(time.monotonic() - stored_at, 3))
+
+    def _lead(self, flight, key, ttl, events):
+        # Pass the live events on while keeping a copy for the cache
+        output = {"stdout": [], "stderr": []}
+        try:
+            for stream, value in events():
+                if stream == "exit":
+                    info = value
+                    value = dict(value, cache="miss")
+                else:
+                    output[stream].append(value)
+                yield stream, value
+        except Exception as e:
+            flight.reject(e)
+            raise
+        except BaseException:
+            # Includes the client going away mid-stream
+            flight.reject(CancelledFlightError("The identical execution was cancelled"))
+            raise
+        now = time.monotonic()
+        entry = (now + ttl, now, info, "".join(output["stdout"]), "".join(output["stderr"]))
+        # Timed-out runs are incomplete
+        if not info["timed_out"]:
+            self._store(key, entry)
+        flight.resolve(entry)
+
+    def begin(self, key, ttl):
+        """
+        Start a request for a cacheable command. The returned
+        CachedExecution already knows whether it replays a cached result,
+        shares an identical run in progress, or is the leader that runs the
+        command (and so needs an execution slot).
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if entry is not None:
+            return CachedExecution(self, key, ttl, entry=entry)
+        flight, leader = self._flights.begin(key)
+        if leader:
+            with self._lock:
+                self.misses += 1
+        return CachedExecution(self, key, ttl, flight=flight, leader=leader)
+
+    def clear(self):
+        """
+        Drop all entries
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Return hit/miss counters and current size
+        """
+        with self._lock:
+            lookups = self.hits + self.coalesced + self.misses
+            return {
+                "hits": self.hits,
+                "coalesced": self.coalesced,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+                "stored": self.stored,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttls": dict(self.ttls),
+            }
+
+
+class CachedExecution:
+    """
+    One request for a cacheable command, from ExecutionCache.begin()
+    """
+
+    def __init__(self, cache, key, ttl, entry=None, flight=None, leader=False):
+        self._cache = cache
+        self.key = key
+        self.ttl = ttl
+        self._entry = entry
+        self._flight = flight
+        # True if this request runs the command itself
+        self.leader = leader
+        self._started = False
+
+    def events(self, events):
+        """
+        Yield the (stream, value) events of the command, like
+        execution.stream_command: replayed from the cache, shared with an
+        identical run in progress, or live from events(), which starts the
+        command. The exit info gains a "cache" field saying which ("hit",
+        "coalesced" or "miss").
+        """
+        self._started = True
+        if self._entry is not None:
+            yield from self._cache._replay(self._entry, "hit")
+            return
+        if self.leader:
+            yield from self._cache._lead(self._flight, self.key, self.ttl, events)
+            return
+        entry = self._flight.wait(self._cache.wait_timeout)
+        with self._cache._lock:
+            self._cache.coalesced += 1
+        yield from self._cache._replay(entry, "coalesced")
+
+    def cancel(self, error=None):
+        """
+        Give up before events() ran, e.g. because no execution slot was
+        free; requests sharing this one's run get error. Does nothing once
+        events() has started.
+        """
+        if self.leader and not self._started:
+            self._started = True
+            self._flight.reject(error or CancelledFlightError("The identical execution was cancelled"))
@@ -0,0 +1,35 @@
+"""
+Gunicorn settings
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+Translations spend almost all of their time waiting on the OpenAI API, so
+workers run threaded: each process serves many requests concurrently and
+shares one pooled upstream client (see upstream.py) instead of one request
+pinning a whole process for the length of the call.
+
+The app is preloaded: the master imports and warms it up once (see
+app.warm_up) and forks workers that already have it, sharing that memory
+copy-on-write, so workers are ready to serve as soon as they start.
+"""
+import os
+import sys
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.environ.get("GUNICORN_WORKERS", "2"))
+threads = int(os.environ.get("GUNICORN_THREADS", "100"))
+# Persistent shells (see shell_sessions.py) live in the worker that started
+# them, while a browser's requests may reach any worker; with more than one
+# worker a session would lose its directory and variables, or 404, whenever
+# the next request lands elsewhere. Threads still serve requests concurrently.
+if workers > 1 and os.environ.get("SESSION_SECRET") and os.environ.get("SHELL_SESSIONS", "1") != "0":
+    sys.stderr.write(f"Persistent shell sessions need a single worker; running 1 instead of {workers}. "
+                     "Set SHELL_SESSIONS=0 to run commands one-shot with more workers.\n")
+    workers = 1
+# Long-lived streaming responses must not be cut off by the worker timeout
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+keepalive = 5
+# Reloading needs each worker to import the code itself, so --reload (or
+# GUNICORN_PRELOAD=0) turns preloading off
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") != "0" and "--reload" not in sys.argv
+
@@ -0,0 +1,260 @@
+"""
+Server-side translation history with full-text search
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+Every translation logged by log_command_request is recorded in a SQLite
+database with one row per (owner, shell, normalized query, command), where
+the owner is a random key kept in the browser's Flask session. Searches
+only see the requesting browser's rows, so queries (which may name hosts,
+paths or users) are never shown to anyone else; without SESSION_SECRET
+there are no sessions and nothing is recorded. Asking the same thing
+again bumps that row's use count instead of adding a row, so the table
+grows with distinct answers rather than with traffic.
+
+An FTS5 index covers the query, command and explanation. It is an
+external-content table kept in sync by triggers, with prefix indexes for
+two- and three-character prefixes. /history/search matches every word as
+a prefix and ranks results by bm25, weighting the query text highest, so
+a search stays an index lookup at millions of rows. Deep pages are capped
+at HISTORY_MAX_OFFSET.
+
+Rows are written in batches on a background thread (see
+audit.BatchWriter), so recording history adds no database work to
+requests. Searches use one read connection per thread; WAL mode lets them
+run alongside the writer.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+from audit import BatchWriter
+from cache import normalize_query
+
+HISTORY_DB = os.environ.get("HISTORY_DB")
+HISTORY_BATCH_SIZE = int(os.environ.get("HISTORY_BATCH_SIZE", "200"))
+HISTORY_QUEUE_SIZE = int(os.environ.get("HISTORY_QUEUE_SIZE", "10000"))
+# Deepest offset /history/search pages to
+HISTORY_MAX_OFFSET = int(os.environ.get("HISTORY_MAX_OFFSET", "1000"))
+HISTORY_MAX_LIMIT = 100
+
+# bm25 weights of the query, command and explanation columns
+_RANK_WEIGHTS = (10.0, 4.0, 1.0)
+_SEARCH_TERM_RE = re.compile(r"\w+")
+_MAX_SEARCH_TERMS = 8
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS command_history (
+    id INTEGER PRIMARY KEY,
+    owner TEXT NOT NULL,
+    shell TEXT NOT NULL,
+    query_key TEXT NOT NULL,
+    command_hash TEXT NOT NULL,
+    query TEXT NOT NULL,
+    command TEXT NOT NULL,
+    explanation TEXT,
+    uses INTEGER NOT NULL DEFAULT 1,
+    first_used REAL NOT NULL,
+    last_used REAL NOT NULL,
+    UNIQUE (owner, shell, query_key, command_hash)
+);
+CREATE INDEX IF NOT EXISTS ix_command_history_owner_last_used ON command_history (owner, last_used);
+CREATE VIRTUAL TABLE IF NOT EXISTS command_history_fts USING fts5(
+    query, command, explanation,
+    content='command_history', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS command_history_ai AFTER INSERT ON command_history BEGIN
+    INSERT INTO command_history_fts (rowid, query, command, explanation)
+    VALUES (new.id, new.query, new.command, new.explanation);
+END;
+CREATE TRIGGER IF NOT EXISTS command_history_ad AFTER DELETE ON command_history BEGIN
+    INSERT INTO command_history_fts (command_history_fts, rowid, query, command, explanation)
+    VALUES ('delete', old.id, old.query, old.command, old.explanation);
+END;
+CREATE TRIGGER IF NOT EXISTS command_history_au AFTER UPDATE OF query, command, explanation
+ON command_history
+WHEN old.query IS NOT new.query OR old.command IS NOT new.command
+    OR old.explanation IS NOT new.explanation
+BEGIN
+    INSERT INTO command_history_fts (command_history_fts, rowid, query, command, explanation)
+    VALUES ('delete', old.id, old.query, old.command, old.explanation);
+    INSERT INTO command_history_fts (rowid, query, command, explanation)
+    VALUES (new.id, new.query, new.command, new.explanation);
+END;
+"""
+
+_UPSERT = """
+INSERT INTO command_history
+    (owner, shell, query_key, command_hash, query, command, explanation, uses, first_used, last_used)
+VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?, ?)
+ON CONFLICT (owner, shell, query_key, command_hash) DO UPDATE SET
+    uses = uses + 1,
+    last_used = max(last_used, excluded.last_used),
+    explanation = coalesce(command_history.explanation, excluded.explanation)
+"""
+
+_COLUMNS = "h.id, h.shell, h.query, h.command, h.explanation, h.uses, h.last_used"
+
+
+class HistoryUnavailableError(Exception):
+    """
+    Raised when history is disabled or its database cannot be used
+    """
+
+
+def match_expression(text):
+    """
+    FTS5 MATCH expression matching every word of text as a prefix, or None
+    if text has no words. Words are quoted, so FTS5 syntax in user input
+    is never interpreted.
+    """
+    terms = _SEARCH_TERM_RE.findall(text.casefold())[:_MAX_SEARCH_TERMS]
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def _connect(db_path):
+    db = sqlite3.connect(db_path, timeout=5, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+class CommandHistory(BatchWriter):
+    """
+    Records logged translations and searches them
+    """
+    name = "history"
+
+    def __init__(self, db_path, batch_size=HISTORY_BATCH_SIZE, flush_interval=1.0,
+                 max_queue=HISTORY_QUEUE_SIZE, enqueue_timeout=0.05):
+        super().__init__(batch_size, flush_interval, max_queue, enqueue_timeout)
+        self.db_path = db_path
+        self._writer_db = None
+        self._readers = threading.local()
+        self._schema_ready = False
+        self.searches = 0
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+    def _reset(self):
+        self._writer_db = None
+
+    def _ensure_schema(self, db):
+        if self._schema_ready:
+            return
+        try:
+            db.executescript(_SCHEMA)
+        except sqlite3.OperationalError as e:
+            # SQLite builds without FTS5 cannot hold the index
+            logging.error(f"Command history disabled: {str(e)}")
+            self.db_path = None
+            raise HistoryUnavailableError("Command history is unavailable") from e
+        self._schema_ready = True
+
+    def record_log_entry(self, log_entry, owner):
+        """
+        Command log listener: queue translations for owner's history
+        """
+        if not self.db_path or not owner:
+            return
+        query = log_entry["user_query"]
+        command = log_entry["generated_command"]
+        # Execution logs and placeholder results are not translations
+        if not command or command == "API_KEY_REQUIRED" or "EXECUTION: " in query:
+            return
+        self.submit(dict(log_entry, history_owner=owner))
+
+    def _write(self, batch):
+        if not self.db_path:
+            return
+        if self._writer_db is None:
+            self._writer_db = _connect(self.db_path)
+            self._ensure_schema(self._writer_db)
+        rows = []
+        for entry in batch:
+            used_at = datetime.fromisoformat(entry["timestamp"]).timestamp()
+            rows.append((
+                entry["history_owner"],
+                entry["command_type"].lower(),
+                normalize_query(entry["user_query"]),
+                entry["command_hash"],
+                entry["user_query"],
+                entry["generated_command"],
+                entry.get("explanation"),
+                used_at,
+                used_at,
+            ))
+        with self._writer_db:
+            self._writer_db.executemany(_UPSERT, rows)
+
+    def _reader(self):
+        if not self.db_path:
+            raise HistoryUnavailableError("Command history is disabled")
+        db = getattr(self._readers, "db", None)
+        if db is None or self._readers.pid != os.getpid():
+            db = _connect(self.db_path)
+            self._ensure_schema(db)
+            self._readers.db = db
+            self._readers.pid = os.getpid()
+        return db
+
+    def search(self, owner, text="", shell=None, limit=20, offset=0):
+        """
+        Return (entries, has_more) from owner's history. With search text,
+        entries matching all its words (as prefixes) best first; without,
+        the most recently used.
+        """
+        limit = max(1, min(limit, HISTORY_MAX_LIMIT))
+        offset = max(0, min(offset, HISTORY_MAX_OFFSET))
+        expression = match_expression(text or "")
+        shell_filter = " AND h.shell = ?" if shell else ""
+        if expression:
+            sql = (
+                f"SELECT {_COLUMNS}, bm25(command_history_fts, ?, ?, ?) AS score "
+                "FROM command_history_fts JOIN command_history h ON h.id = command_history_fts.rowid "
+                f"WHERE command_history_fts MATCH ? AND h.owner = ?{shell_filter} "
+                "ORDER BY score, h.uses DESC LIMIT ? OFFSET ?"
+            )
+            parameters = [*_RANK_WEIGHTS, expression, owner]
+        else:
+            sql = (
+                f"SELECT {_COLUMNS}, NULL AS score FROM command_history h "
+                f"WHERE h.owner = ?{shell_filter} ORDER BY h.last_used DESC LIMIT ? OFFSET ?"
+            )
+            parameters = [owner]
+        if shell:
+            parameters.append(shell)
+        parameters += [limit + 1, offset]
+        try:
+            rows = self._reader().execute(sql, parameters).fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"Command history search failed: {str(e)}")
+            raise HistoryUnavailableError("Command history search failed") from e
+        with self._lock:
+            self.searches += 1
+        entries = [
+            {
+                "id": row[0],
+                "shell": row[1],
+                "query": row[2],
+                "command": row[3],
+                "explanation": row[4],
+                "uses": row[5],
+                "last_used": datetime.fromtimestamp(row[6]).isoformat(),
+                "score": None if row[7] is None else round(-row[7], 4),
+            }
+            for row in rows[:limit]
+        ]
+        return entries, len(rows) > limit
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats["searches"] = self.searches
+        stats["enabled"] = bool(self.db_path)
+        return stats
@@ -0,0 +1,138 @@
+"""
+Cached description of the host commands run on
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+Kernel, distribution, CPU, memory and shell details are read with
+os.uname() and from /proc and /etc instead of forking `uname -a` for
+every execution. They are gathered once per worker and refreshed after
+a TTL, so /execute pays no process-creation cost for them, and the same
+snapshot describes the host to the translation prompt.
+"""
+import os
+import threading
+import time
+
+# Seconds before host details are gathered again
+HOST_CONTEXT_TTL = float(os.environ.get("HOST_CONTEXT_TTL", "300"))
+
+
+def _read_os_release():
+    for path in ("/etc/os-release", "/usr/lib/os-release"):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                fields = {}
+                for line in f:
+                    key, sep, value = line.strip().partition("=")
+                    if sep:
+                        fields[key] = value.strip().strip('"\'')
+                return fields.get("PRETTY_NAME") or fields.get("NAME")
+        except OSError:
+            continue
+    return None
+
+
+def _read_meminfo():
+    memory = {}
+    try:
+        with open("/proc/meminfo", "r", encoding="utf-8") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("MemTotal", "MemAvailable"):
+                    # Values are reported in kB
+                    memory[key] = int(value.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return memory
+
+
+def _cpu_count():
+    try:
+        # CPUs this process may actually run on (respects cgroups/affinity)
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return os.cpu_count()
+
+
+def _shell():
+    # One-shot commands run through /bin/sh (subprocess shell=True), not the
+    # server's login $SHELL; report what it points at, e.g. /usr/bin/dash.
+    # Persistent sessions use bash, which also runs anything sh accepts.
+    return os.path.realpath("/bin/sh")
+
+
+def _format_bytes(size):
+    return f"{size / (1024 ** 3):.1f} GiB"
+
+
+def gather_host_context():
+    """
+    Collect host details without spawning any processes
+    """
+    uname = os.uname()
+    memory = _read_meminfo()
+    return {
+        "kernel": uname.sysname,
+        "kernel_release": uname.release,
+        "kernel_version": uname.version,
+        "hostname": uname.nodename,
+        "machine": uname.machine,
+        "distro": _read_os_release(),
+        "cpu_count": _cpu_count(),
+        "memory_total": memory.get("MemTotal"),
+        "memory_available": memory.get("MemAvailable"),
+        "shell": _shell(),
+        "working_directory": os.getcwd()
+    }
+
+
+class HostContext:
+    """
+    Host details gathered once and refreshed after ttl seconds
+    """
+
+    def __init__(self, ttl=HOST_CONTEXT_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._context = None
+        self._expires = 0
+
+    def get(self):
+        """
+        Return the current host details, gathering them again if stale
+        """
+        now = time.monotonic()
+        if self._context is None or now >= self._expires:
+            with self._lock:
+                if self._context is None or now >= self._expires:
+                    self._context = gather_host_context()
+                    self._expires = now + self.ttl
+        return self._context
+
+    def system_info(self):
+        """
+        One-line system description in the style of `uname -a`
+        """
+        context = self.get()
+        return " ".join([
+            context["kernel"], context["hostname"], context["kernel_release"],
+            context["kernel_version"], context["machine"]
+        ])
+
+    def prompt_description(self):
+        """
+        Short description of the host for the translation prompt. Only
+        details that rarely change are included, so the prompt stays stable.
+        """
+        context = self.get()
+        parts = [context["distro"] or context["kernel"]]
+        parts.append(f"{context['kernel']} {context['kernel_release']} ({context['machine']})")
+        if context["cpu_count"]:
+            parts.append(f"{context['cpu_count']} CPUs")
+        if context["memory_total"]:
+            parts.append(f"{_format_bytes(context['memory_total'])} RAM")
+        if context["shell"]:
+            parts.append(f"shell {context['shell']}")
+        return ", ".join(parts)
+
+
+host_context = HostContext()
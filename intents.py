@@ -0,0 +1,545 @@
+"""
+Offline intent matching for common translation requests
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+A curated table maps everyday requests ("what directory am I in", "show
+the last 20 lines of app.log") to command templates for Linux and
+PowerShell. Phrases are compiled once into regexes with typed slots, and
+an inverted index from words to phrases narrows each lookup to the few
+phrases sharing a word with the query. High-confidence matches are answered
+locally in microseconds, so they need neither an API call nor an API key.
+
+A fuzzy (keyword overlap) match is only made between a query and a phrase
+that ask for the same kinds of action, as semantic matches are (see
+semantic_index.actions): "delete all files" shares most of its words with
+"list all files", but `ls -la` is no answer to it, even during an outage.
+"""
+import os
+import re
+import shlex
+from collections import defaultdict
+
+from semantic_index import actions
+
+# Minimum confidence for answering without the model
+OFFLINE_CONFIDENCE_THRESHOLD = float(os.environ.get("OFFLINE_CONFIDENCE_THRESHOLD", "0.8"))
+# Lower bar used while the model is unavailable, when a rough answer beats none
+OFFLINE_DEGRADED_THRESHOLD = float(os.environ.get("OFFLINE_DEGRADED_THRESHOLD", "0.5"))
+
+# Confidence of an exact match on a weak phrase ("print {path}") whose
+# slot does not look like a path: below the normal threshold, so it is
+# only used while the model is unavailable
+WEAK_PHRASE_CONFIDENCE = 0.6
+
+# Regex for each slot type
+SLOT_PATTERNS = {
+    "count": r"\d{1,6}",
+    # A unit is required: find -size without one counts 512-byte blocks
+    "size": r"\d{1,6}\s?(?:k|m|g|kb|mb|gb)",
+    "path": r"[^\s'\"]+",
+    "name": r"[^\s'\"]+",
+    "text": r".+?",
+}
+
+# Words ignored when scoring fuzzy matches
+STOPWORDS = frozenset([
+    "a", "an", "the", "me", "my", "all", "please", "can", "you", "i", "to",
+    "of", "in", "on", "for", "is", "are", "what", "how", "do", "show",
+    "list", "display", "get", "print", "tell", "see", "view", "this",
+])
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_SIZE_RE = re.compile(r"(\d+)\s*([kmg])", re.IGNORECASE)
+# Search text that is really file-finding phrasing ("find python files in src")
+_FILE_WORDS_RE = re.compile(r"\b(?:files?|folders?|directory|directories|dirs?)$")
+_PATH_CHARS = frozenset("/\\~.*")
+_SLOT_RE = re.compile(r"\{(\w+)\}")
+_TRAILING_PUNCTUATION = "?!. "
+# Actions of text naming none ("current directory"): it asks to see something
+_DEFAULT_ACTIONS = frozenset(["read"])
+
+LINUX_INTENTS = [
+    {
+        "phrases": ["what directory am i in", "where am i", "current directory",
+                    "print working directory", "show current directory"],
+        "command": "pwd",
+        "explanation": "Prints the current working directory.",
+        "breakdown": {"pwd": "Print the full path of the working directory"},
+    },
+    {
+        "phrases": ["list files", "list all files", "show files in this directory",
+                    "list files including hidden", "show hidden files"],
+        "command": "ls -la",
+        "explanation": "Lists all files, including hidden ones, in long format.",
+        "breakdown": {"ls": "List directory contents", "-l": "Long listing format",
+                      "-a": "Include hidden entries"},
+    },
+    {
+        "phrases": ["list files by size", "sort files by size", "list largest files",
+                    "show biggest files"],
+        "command": "ls -lSh",
+        "explanation": "Lists files sorted by size, largest first, with readable sizes.",
+        "breakdown": {"ls": "List directory contents", "-l": "Long listing format",
+                      "-S": "Sort by file size", "-h": "Human-readable sizes"},
+    },
+    {
+        "phrases": ["list files by date", "sort files by date", "list newest files",
+                    "show recently modified files"],
+        "command": "ls -lt",
+        "explanation": "Lists files sorted by modification time, newest first.",
+        "breakdown": {"ls": "List directory contents", "-l": "Long listing format",
+                      "-t": "Sort by modification time"},
+    },
+    {
+        "phrases": ["list files in {path}", "show files in {path}"],
+        "weak_phrases": ["what is in {path}"],
+        "command": "ls -la {path}",
+        "explanation": "Lists all files in the given directory in long format.",
+        "breakdown": {"ls": "List directory contents", "-la": "Long format including hidden entries",
+                      "{path}": "Directory to list"},
+    },
+    {
+        "phrases": ["show disk usage", "disk usage", "disk space", "how much disk space is free",
+                    "check disk space", "free disk space"],
+        "command": "df -h",
+        "explanation": "Shows used and available space on mounted filesystems.",
+        "breakdown": {"df": "Report filesystem disk space usage", "-h": "Human-readable sizes"},
+    },
+    {
+        "phrases": ["size of this directory", "directory size", "how big is this directory",
+                    "folder size"],
+        "command": "du -sh .",
+        "explanation": "Shows the total size of the current directory.",
+        "breakdown": {"du": "Estimate file space usage", "-s": "Summarize the total",
+                      "-h": "Human-readable sizes", ".": "The current directory"},
+    },
+    {
+        "phrases": ["disk usage of {path}"],
+        "weak_phrases": ["size of {path}", "how big is {path}"],
+        "command": "du -sh {path}",
+        "explanation": "Shows the total size of the given file or directory.",
+        "breakdown": {"du": "Estimate file space usage", "-sh": "Summarized, human-readable total",
+                      "{path}": "File or directory to measure"},
+    },
+    {
+        "phrases": ["show memory usage", "memory usage", "free memory", "how much memory is free",
+                    "check memory", "ram usage"],
+        "command": "free -h",
+        "explanation": "Shows total, used and free memory and swap.",
+        "breakdown": {"free": "Display memory usage", "-h": "Human-readable sizes"},
+    },
+    {
+        "phrases": ["show running processes", "running processes", "list processes",
+                    "what processes are running"],
+        "command": "ps aux",
+        "explanation": "Lists all running processes with their owner and resource usage.",
+        "breakdown": {"ps": "Report process status", "aux": "All users' processes with details"},
+    },
+    {
+        "phrases": ["show system uptime", "uptime", "how long has the system been running",
+                    "system uptime"],
+        "command": "uptime",
+        "explanation": "Shows how long the system has been running and the load averages.",
+        "breakdown": {"uptime": "Tell how long the system has been running"},
+    },
+    {
+        "phrases": ["who am i", "current user", "which user am i", "what user am i"],
+        "command": "whoami",
+        "explanation": "Prints the name of the current user.",
+        "breakdown": {"whoami": "Print the effective user name"},
+    },
+    {
+        "phrases": ["show kernel version", "kernel version", "system information", "os version",
+                    "show system info"],
+        "command": "uname -a",
+        "explanation": "Prints the kernel name, version and machine information.",
+        "breakdown": {"uname": "Print system information", "-a": "All available information"},
+    },
+    {
+        "phrases": ["show ip address", "ip address", "what is my ip address",
+                    "network interfaces"],
+        "command": "ip addr show",
+        "explanation": "Shows the addresses of all network interfaces.",
+        "breakdown": {"ip": "Show and manipulate network settings", "addr show": "List interface addresses"},
+    },
+    {
+        "phrases": ["show listening ports", "listening ports", "open ports", "which ports are open"],
+        "command": "ss -tuln",
+        "explanation": "Lists TCP and UDP sockets that are listening for connections.",
+        "breakdown": {"ss": "Socket statistics", "-t": "TCP sockets", "-u": "UDP sockets",
+                      "-l": "Listening sockets only", "-n": "Numeric addresses and ports"},
+    },
+    {
+        "phrases": ["show date", "current date", "what time is it", "current time", "show time"],
+        "command": "date",
+        "explanation": "Prints the current date and time.",
+        "breakdown": {"date": "Print the system date and time"},
+    },
+    {
+        "phrases": ["show command history", "command history", "history"],
+        "command": "history",
+        "explanation": "Shows previously entered shell commands.",
+        "breakdown": {"history": "Display the shell command history"},
+    },
+    {
+        "phrases": ["show contents of {path}", "cat {path}", "show file {path}"],
+        "weak_phrases": ["print {path}", "display {path}", "read {path}"],
+        "command": "cat {path}",
+        "explanation": "Prints the contents of the file.",
+        "breakdown": {"cat": "Concatenate and print files", "{path}": "File to print"},
+    },
+    {
+        "phrases": ["show the last {count} lines of {path}", "last {count} lines of {path}",
+                    "tail {count} lines of {path}"],
+        "command": "tail -n {count} {path}",
+        "explanation": "Prints the last lines of the file.",
+        "breakdown": {"tail": "Output the last part of files", "-n {count}": "Number of lines",
+                      "{path}": "File to read"},
+    },
+    {
+        "phrases": ["show the first {count} lines of {path}", "first {count} lines of {path}",
+                    "head {count} lines of {path}"],
+        "command": "head -n {count} {path}",
+        "explanation": "Prints the first lines of the file.",
+        "breakdown": {"head": "Output the first part of files", "-n {count}": "Number of lines",
+                      "{path}": "File to read"},
+    },
+    {
+        "phrases": ["watch {path} for new lines", "tail -f {path}"],
+        "weak_phrases": ["follow {path}"],
+        "command": "tail -f {path}",
+        "explanation": "Prints new lines as they are appended to the file.",
+        "breakdown": {"tail": "Output the last part of files", "-f": "Follow appended data",
+                      "{path}": "File to follow"},
+    },
+    {
+        "phrases": ["count lines in {path}", "how many lines are in {path}", "line count of {path}"],
+        "command": "wc -l {path}",
+        "explanation": "Counts the lines in the file.",
+        "breakdown": {"wc": "Print newline, word and byte counts", "-l": "Count lines only",
+                      "{path}": "File to count"},
+    },
+    {
+        "phrases": ["find files named {name}", "find file {name}", "find files called {name}",
+                    "search for file {name}"],
+        "command": "find . -name {name}",
+        "explanation": "Searches the current directory tree for files with the given name.",
+        "breakdown": {"find": "Search for files", ".": "Start in the current directory",
+                      "-name {name}": "Match the file name (wildcards allowed)"},
+    },
+    {
+        "phrases": ["find files larger than {size}", "find files bigger than {size}",
+                    "files larger than {size}", "files bigger than {size}"],
+        "command": "find . -type f -size +{size}",
+        "explanation": "Finds regular files larger than the given size.",
+        "breakdown": {"find": "Search for files", "-type f": "Regular files only",
+                      "-size +{size}": "Larger than the given size"},
+    },
+    {
+        "phrases": ["search for {text} in {path}", "grep {text} in {path}", "search {path} for {text}"],
+        "weak_phrases": ["find {text} in {path}"],
+        "command": "grep -n {text} {path}",
+        "explanation": "Prints the lines of the file that contain the text, with line numbers.",
+        "breakdown": {"grep": "Print lines matching a pattern", "-n": "Show line numbers",
+                      "{text}": "Text to search for", "{path}": "File to search"},
+    },
+]
+
+POWERSHELL_INTENTS = [
+    {
+        "phrases": ["what directory am i in", "where am i", "current directory",
+                    "print working directory", "show current directory"],
+        "command": "Get-Location",
+        "explanation": "Shows the current working location.",
+        "breakdown": {"Get-Location": "Gets the current working location"},
+    },
+    {
+        "phrases": ["list files", "list all files", "show files in this directory",
+                    "list files including hidden", "show hidden files"],
+        "command": "Get-ChildItem -Force",
+        "explanation": "Lists all items in the current directory, including hidden ones.",
+        "breakdown": {"Get-ChildItem": "Gets the items in a location", "-Force": "Include hidden items"},
+    },
+    {
+        "phrases": ["list files by size", "sort files by size", "list largest files",
+                    "show biggest files"],
+        "command": "Get-ChildItem -File | Sort-Object Length -Descending",
+        "explanation": "Lists files sorted by size, largest first.",
+        "breakdown": {"Get-ChildItem -File": "Gets the files in the current directory",
+                      "Sort-Object Length -Descending": "Sorts them by size, largest first"},
+    },
+    {
+        "phrases": ["list files in {path}", "show files in {path}"],
+        "weak_phrases": ["what is in {path}"],
+        "command": "Get-ChildItem -Path {path} -Force",
+        "explanation": "Lists all items in the given directory.",
+        "breakdown": {"Get-ChildItem": "Gets the items in a location", "-Path {path}": "Directory to list",
+                      "-Force": "Include hidden items"},
+    },
+    {
+        "phrases": ["show disk usage", "disk usage", "disk space", "how much disk space is free",
+                    "check disk space", "free disk space"],
+        "command": "Get-PSDrive -PSProvider FileSystem",
+        "explanation": "Shows used and free space on each file system drive.",
+        "breakdown": {"Get-PSDrive": "Gets drives in the session",
+                      "-PSProvider FileSystem": "Only file system drives"},
+    },
+    {
+        "phrases": ["show memory usage", "memory usage", "free memory", "how much memory is free",
+                    "check memory", "ram usage"],
+        "command": "Get-CimInstance Win32_OperatingSystem | Select-Object TotalVisibleMemorySize, FreePhysicalMemory",
+        "explanation": "Shows total and free physical memory in kilobytes.",
+        "breakdown": {"Get-CimInstance Win32_OperatingSystem": "Queries operating system information",
+                      "Select-Object": "Keeps only the memory properties"},
+    },
+    {
+        "phrases": ["show running processes", "running processes", "list processes",
+                    "what processes are running"],
+        "command": "Get-Process",
+        "explanation": "Lists the processes running on the computer.",
+        "breakdown": {"Get-Process": "Gets the running processes"},
+    },
+    {
+        "phrases": ["list services", "show services", "show running services", "running services"],
+        "command": "Get-Service | Where-Object Status -eq 'Running'",
+        "explanation": "Lists services that are currently running.",
+        "breakdown": {"Get-Service": "Gets the services on the computer",
+                      "Where-Object Status -eq 'Running'": "Keeps only running services"},
+    },
+    {
+        "phrases": ["who am i", "current user", "which user am i", "what user am i"],
+        "command": "whoami",
+        "explanation": "Prints the domain and name of the current user.",
+        "breakdown": {"whoami": "Displays the current user"},
+    },
+    {
+        "phrases": ["system information", "os version", "show system info", "computer info"],
+        "command": "Get-ComputerInfo",
+        "explanation": "Shows operating system and hardware information.",
+        "breakdown": {"Get-ComputerInfo": "Gets system and operating system properties"},
+    },
+    {
+        "phrases": ["show ip address", "ip address", "what is my ip address", "network interfaces"],
+        "command": "Get-NetIPAddress",
+        "explanation": "Lists the IP address configuration of every interface.",
+        "breakdown": {"Get-NetIPAddress": "Gets IP address configuration"},
+    },
+    {
+        "phrases": ["show date", "current date", "what time is it", "current time", "show time"],
+        "command": "Get-Date",
+        "explanation": "Shows the current date and time.",
+        "breakdown": {"Get-Date": "Gets the current date and time"},
+    },
+    {
+        "phrases": ["show command history", "command history", "history"],
+        "command": "Get-History",
+        "explanation": "Lists the commands entered in this session.",
+        "breakdown": {"Get-History": "Gets the session command history"},
+    },
+    {
+        "phrases": ["show contents of {path}", "cat {path}", "show file {path}"],
+        "weak_phrases": ["print {path}", "display {path}", "read {path}"],
+        "command": "Get-Content -Path {path}",
+        "explanation": "Prints the contents of the file.",
+        "breakdown": {"Get-Content": "Gets the content of an item", "-Path {path}": "File to read"},
+    },
+    {
+        "phrases": ["show the last {count} lines of {path}", "last {count} lines of {path}",
+                    "tail {count} lines of {path}"],
+        "command": "Get-Content -Path {path} -Tail {count}",
+        "explanation": "Prints the last lines of the file.",
+        "breakdown": {"Get-Content": "Gets the content of an item", "-Path {path}": "File to read",
+                      "-Tail {count}": "Number of lines from the end"},
+    },
+    {
+        "phrases": ["show the first {count} lines of {path}", "first {count} lines of {path}",
+                    "head {count} lines of {path}"],
+        "command": "Get-Content -Path {path} -TotalCount {count}",
+        "explanation": "Prints the first lines of the file.",
+        "breakdown": {"Get-Content": "Gets the content of an item", "-Path {path}": "File to read",
+                      "-TotalCount {count}": "Number of lines from the start"},
+    },
+    {
+        "phrases": ["find files named {name}", "find file {name}", "find files called {name}",
+                    "search for file {name}"],
+        "command": "Get-ChildItem -Recurse -Filter {name}",
+        "explanation": "Searches the current directory tree for files with the given name.",
+        "breakdown": {"Get-ChildItem -Recurse": "Gets items in all subdirectories",
+                      "-Filter {name}": "Match the file name (wildcards allowed)"},
+    },
+    {
+        "phrases": ["search for {text} in {path}", "search {path} for {text}"],
+        "weak_phrases": ["find {text} in {path}"],
+        "command": "Select-String -Path {path} -Pattern {text}",
+        "explanation": "Prints the lines of the file that contain the text.",
+        "breakdown": {"Select-String": "Finds text in files", "-Path {path}": "File to search",
+                      "-Pattern {text}": "Text to search for"},
+    },
+]
+
+
+def _quote_linux(value):
+    return shlex.quote(value)
+
+
+def _quote_powershell(value):
+    # Single-quoted PowerShell strings escape ' by doubling it
+    if re.fullmatch(r"[\w.\\/:*?-]+", value):
+        return value
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _find_size(value):
+    # "100MB", "100 mb" -> "100M", the unit letters find -size accepts
+    number, unit = _SIZE_RE.match(value).groups()
+    return number + ("k" if unit.lower() == "k" else unit.upper())
+
+
+# Slot values rewritten before quoting
+SLOT_NORMALIZERS = {"size": _find_size}
+
+
+def _valid_slots(slots):
+    # Quoting does not stop "-rf" or "--help" from being read as an option
+    if any(slots.get(name, "").strip("\"' ").startswith("-") for name in ("path", "name", "text")):
+        return False
+    return not _FILE_WORDS_RE.search(slots.get("text", "").strip("\"' "))
+
+
+def _looks_like_path(value):
+    return bool(_PATH_CHARS.intersection(value))
+
+
+def _normalize(query):
+    return " ".join(query.casefold().split()).rstrip(_TRAILING_PUNCTUATION)
+
+
+def _actions(text):
+    return actions(text) or _DEFAULT_ACTIONS
+
+
+def _keywords(text):
+    return frozenset(word for word in _WORD_RE.findall(text) if word not in STOPWORDS)
+
+
+class IntentMatcher:
+    """
+    Matches queries against an intent table for one shell
+    """
+
+    def __init__(self, intents, quote, threshold=OFFLINE_CONFIDENCE_THRESHOLD):
+        self.intents = intents
+        self.quote = quote
+        self.threshold = threshold
+        # Every phrase becomes (intent index, compiled regex, keywords, has
+        # slots, weak, actions)
+        self._phrases = []
+        # Inverted index: word -> phrase ids containing it
+        self._index = defaultdict(set)
+        for intent_id, intent in enumerate(intents):
+            phrases = [(phrase, False) for phrase in intent["phrases"]]
+            phrases += [(phrase, True) for phrase in intent.get("weak_phrases", ())]
+            for phrase, weak in phrases:
+                literal = _SLOT_RE.sub(" ", phrase)
+                phrase_id = len(self._phrases)
+                self._phrases.append((intent_id, self._compile(phrase), _keywords(literal), "{" in phrase, weak,
+                                      _actions(literal)))
+                # Index every literal word so stopword-only phrases are reachable
+                for word in _WORD_RE.findall(literal):
+                    self._index[word].add(phrase_id)
+
+    @staticmethod
+    def _compile(phrase):
+        parts = []
+        for i, piece in enumerate(_SLOT_RE.split(phrase)):
+            if i % 2:
+                parts.append(f"(?P<{piece}>{SLOT_PATTERNS[piece]})")
+            else:
+                parts.append(r"\s+".join(re.escape(word) for word in piece.split()))
+                if piece.startswith(" "):
+                    parts[-1] = r"\s+" + parts[-1]
+                if piece.endswith(" "):
+                    parts[-1] += r"\s+"
+        # Optional leading filler such as "please" or "can you"
+        return re.compile(r"(?:(?:please|can you|could you|how do i|how to)\s+)*" + "".join(parts) + "$")
+
+    def match(self, query):
+        """
+        Return (intent, slots, confidence) for the best match, or None
+        """
+        normalized = _normalize(query)
+        query_keywords = _keywords(normalized)
+        query_actions = _actions(normalized)
+        candidates = set()
+        for word in set(_WORD_RE.findall(normalized)):
+            candidates |= self._index.get(word, set())
+
+        best = None
+        for phrase_id in candidates:
+            intent_id, pattern, keywords, has_slots, weak, phrase_actions = self._phrases[phrase_id]
+            found = pattern.match(normalized)
+            if found:
+                slots = {name: self._original_slot(query, value) for name, value in found.groupdict().items()}
+                if not _valid_slots(slots):
+                    continue
+                # Exact phrase (with slots filled in) is a certain match,
+                # unless the phrase is generic and its path is just a word
+                if not weak or _looks_like_path(slots.get("path", "")):
+                    return self.intents[intent_id], slots, 1.0
+                if best is None or WEAK_PHRASE_CONFIDENCE > best[2]:
+                    best = (self.intents[intent_id], slots, WEAK_PHRASE_CONFIDENCE)
+                continue
+            if has_slots or not keywords or phrase_actions != query_actions:
+                continue
+            # Fuzzy match on shared keywords for slot-free phrases
+            confidence = len(keywords & query_keywords) / len(keywords | query_keywords)
+            if best is None or confidence > best[2]:
+                best = (self.intents[intent_id], {}, confidence)
+        return best
+
+    @staticmethod
+    def _original_slot(query, value):
+        # Slots were matched on the casefolded query; recover the original casing
+        start = query.casefold().find(value)
+        return query[start:start + len(value)] if start >= 0 else value
+
+    def translate(self, query, threshold=None):
+        """
+        Return a translation result for query if it matches an intent with
+        at least threshold (default: the configured) confidence, otherwise None
+        """
+        if threshold is None:
+            threshold = self.threshold
+        matched = self.match(query)
+        if matched is None or matched[2] < threshold:
+            return None
+        intent, slots, confidence = matched
+        # Users often wrap search text or paths in their own quotes
+        quoted = {
+            name: self.quote(SLOT_NORMALIZERS.get(name, str)(value.strip().strip("\"'")))
+            for name, value in slots.items()
+        }
+        return {
+            "command": intent["command"].format(**quoted),
+            "explanation": intent["explanation"],
+            "breakdown": {
+                key.format(**quoted): value for key, value in intent["breakdown"].items()
+            },
+            "simulation": None,
+            "safety_warning": None,
+            "confidence": round(confidence, 3),
+        }
+
+
+INTENT_MATCHERS = {
+    "linux": IntentMatcher(LINUX_INTENTS, _quote_linux),
+    "powershell": IntentMatcher(POWERSHELL_INTENTS, _quote_powershell),
+}
+
+
+def translate_offline(query, shell, threshold=None):
+    """
+    Translate query locally if it is a known, high-confidence intent
+    """
+    matcher = INTENT_MATCHERS.get(shell)
+    return matcher.translate(query, threshold) if matcher else None
@@ -0,0 +1,1115 @@
+"""
+Table-driven PowerShell simulator
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+/execute_powershell never runs PowerShell. A command is split into
+statements and pipelines, each cmdlet (after alias resolution) is looked
+up in CMDLETS, and its handler receives the objects the previous stage
+produced. The objects come from a fixed model of a Windows Server host
+built once at import, so a command always gives the same output, and the
+final objects are formatted as tables or lists the way PowerShell's
+default views show them.
+
+A new cmdlet is a handler function plus a CMDLETS entry that declares its
+parameters. Commands that use a cmdlet not in the registry get a generic
+success message. Parsed commands are cached, so repeated commands only
+pay for running their handlers.
+"""
+import fnmatch
+import re
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+
+from utils import POWERSHELL_ALIASES
+
+DEFAULT_WORKING_DIR = "C:\\Users\\Administrator\\Documents"
+HOME_DIR = "C:\\Users\\Administrator"
+
+SYSTEM_INFO = {
+    "hostname": "WIN-SERVER2022",
+    "os": "Windows Server 2022 Standard",
+    "powershell_version": "PowerShell Core 7.3.4",
+    "cpu": "Intel(R) Xeon(R) CPU E5-2673 v4 @ 2.30GHz",
+    "memory": "8 GB",
+}
+
+UNSUPPORTED_OUTPUT = "Command executed successfully in simulated PowerShell environment."
+
+SimulationResult = namedtuple("SimulationResult", ["stdout", "stderr", "exit_code", "working_dir"])
+
+# A registered cmdlet: valued parameters, switch parameters, the parameters
+# bound by position, and the parameter that collects extra positional values
+Cmdlet = namedtuple("Cmdlet", ["name", "handler", "parameters", "switches", "positional", "remaining"])
+
+# One stage of a pipeline with its bound parameters
+Invocation = namedtuple("Invocation", ["cmdlet", "parameters"])
+
+# Parameters every cmdlet accepts; the simulator ignores them
+_COMMON_PARAMETERS = ("ErrorAction", "WarningAction", "OutVariable")
+_COMMON_SWITCHES = ("Verbose", "Debug", "WhatIf", "Confirm")
+
+_PARSE_CACHE_SIZE = 4096
+
+
+class PowerShellSimulationError(Exception):
+    """
+    Raised for a command the simulated shell rejects; the message is what
+    PowerShell would write to the error stream
+    """
+
+
+class PSObject:
+    """
+    A simulated .NET object: a type name that selects its default view and
+    ordered properties, looked up case-insensitively
+    """
+    __slots__ = ("type_name", "properties", "_names")
+
+    def __init__(self, type_name, properties):
+        self.type_name = type_name
+        self.properties = properties
+        self._names = {name.lower(): name for name in properties}
+
+    def property_name(self, name):
+        """
+        The actual name of property name, or None if there is none
+        """
+        lowered = name.lower()
+        return self._names.get(_PROPERTY_ALIASES.get(self.type_name, {}).get(lowered, (None, lowered))[1])
+
+    def selected_name(self, name):
+        """
+        The name Select-Object gives property name in its copy: an alias
+        keeps its own name (Name, not ProcessName), anything else the
+        property's, or None if there is no such property
+        """
+        alias = _PROPERTY_ALIASES.get(self.type_name, {}).get(name.lower())
+        actual = self.property_name(name)
+        return alias[0] if alias is not None and actual else actual
+
+    def get(self, name):
+        actual = self.property_name(name)
+        return self.properties[actual] if actual else None
+
+
+class SimulationContext:
+    """
+    State shared by the stages and statements of one command
+    """
+    __slots__ = ("working_dir", "_now")
+
+    def __init__(self, working_dir):
+        self.working_dir = working_dir
+        self._now = None
+
+    @property
+    def now(self):
+        if self._now is None:
+            self._now = datetime.now()
+        return self._now
+
+
+# ---------------------------------------------------------------------------
+# The simulated host
+# ---------------------------------------------------------------------------
+
+_PROCESSES = [
+    # Handles, NPM(K), PM(K), WS(K), CPU(s), Id, SI, ProcessName
+    (562, 38, 58840, 76456, 15.27, 7840, 1, "chrome"),
+    (482, 29, 32768, 45120, 6.02, 3344, 1, "Code"),
+    (418, 26, 44784, 56976, 8.53, 5844, 1, "explorer"),
+    (0, 0, 60, 8, 0.0, 0, 0, "Idle"),
+    (689, 21, 8904, 21012, 3.75, 812, 0, "lsass"),
+    (211, 16, 7668, 18456, 1.14, 2268, 1, "powershell"),
+    (156, 12, 3276, 9844, 0.28, 3952, 1, "svchost"),
+    (305, 17, 5120, 14348, 0.94, 1020, 0, "svchost"),
+    (1204, 0, 196, 152, 120.52, 4, 0, "System"),
+    (241, 13, 2904, 11240, 0.41, 640, 0, "wininit"),
+]
+
+_SERVICES = [
+    # Status, Name, DisplayName, StartType
+    ("Running", "BITS", "Background Intelligent Transfer Service", "Manual"),
+    ("Running", "Dhcp", "DHCP Client", "Automatic"),
+    ("Running", "Dnscache", "DNS Client", "Automatic"),
+    ("Running", "EventLog", "Windows Event Log", "Automatic"),
+    ("Running", "LanmanServer", "Server", "Automatic"),
+    ("Stopped", "Spooler", "Print Spooler", "Disabled"),
+    ("Running", "W32Time", "Windows Time", "Manual"),
+    ("Running", "WinRM", "Windows Remote Management (WS-Management)", "Automatic"),
+    ("Stopped", "wuauserv", "Windows Update", "Manual"),
+]
+
+_COMPUTER_INFO = [
+    ("WindowsBuildLabEx", "20348.1.amd64fre.fe_release.210507-1500"),
+    ("WindowsCurrentVersion", "6.3"),
+    ("WindowsEditionId", "ServerStandard"),
+    ("WindowsInstallationType", "Server"),
+    ("WindowsProductName", SYSTEM_INFO["os"]),
+    ("WindowsVersion", "2009"),
+    ("BiosFirmwareType", "Uefi"),
+    ("CsName", SYSTEM_INFO["hostname"]),
+    ("CsProcessors", "{" + SYSTEM_INFO["cpu"] + "}"),
+    ("CsNumberOfLogicalProcessors", 4),
+    ("CsNumberOfProcessors", 1),
+    ("CsTotalPhysicalMemory", 8589598720),
+    ("OsName", "Microsoft " + SYSTEM_INFO["os"]),
+]
+
+# Directory -> entries of (mode, date, time, length or None for directories, name)
+_TREE = {
+    "C:\\": [
+        ("d-----", "5/8/2021", "8:20 AM", None, "PerfLogs"),
+        ("d-r---", "3/12/2024", "9:02 AM", None, "Program Files"),
+        ("d-----", "3/12/2024", "9:01 AM", None, "Program Files (x86)"),
+        ("d-r---", "1/15/2024", "4:47 PM", None, "Users"),
+        ("d-----", "3/12/2024", "9:15 AM", None, "Windows"),
+    ],
+    "C:\\PerfLogs": [],
+    "C:\\Program Files": [],
+    "C:\\Program Files (x86)": [],
+    "C:\\Windows": [],
+    "C:\\Users": [
+        ("d-----", "1/15/2024", "4:47 PM", None, "Administrator"),
+        ("d-r---", "1/15/2024", "4:40 PM", None, "Public"),
+    ],
+    "C:\\Users\\Public": [],
+    "C:\\Users\\Administrator": [
+        ("d-r---", "4/3/2024", "8:12 AM", None, "Desktop"),
+        ("d-r---", "4/5/2024", "3:43 PM", None, "Documents"),
+        ("d-r---", "4/4/2024", "10:02 AM", None, "Downloads"),
+    ],
+    "C:\\Users\\Administrator\\Desktop": [],
+    "C:\\Users\\Administrator\\Downloads": [],
+    "C:\\Users\\Administrator\\Documents": [
+        ("d-----", "4/5/2024", "1:14 PM", None, "PowerShell Scripts"),
+        ("d-----", "4/2/2024", "11:22 AM", None, "Reports"),
+        ("-a----", "4/5/2024", "3:43 PM", 2458, "deployment.log"),
+        ("-a----", "4/4/2024", "10:19 AM", 18548, "results.csv"),
+        ("-a----", "4/1/2024", "9:56 AM", 124958, "documentation.docx"),
+    ],
+    "C:\\Users\\Administrator\\Documents\\PowerShell Scripts": [
+        ("-a----", "4/5/2024", "1:14 PM", 1532, "backup.ps1"),
+        ("-a----", "3/28/2024", "5:30 PM", 864, "cleanup.ps1"),
+    ],
+    "C:\\Users\\Administrator\\Documents\\Reports": [
+        ("-a----", "4/2/2024", "11:22 AM", 48211, "march-2024.xlsx"),
+        ("-a----", "4/1/2024", "2:05 PM", 210334, "q1-summary.pdf"),
+    ],
+}
+
+_CONTENTS = {
+    "C:\\Users\\Administrator\\Documents\\deployment.log": [
+        "2024-04-05 15:40:01 INFO  Starting deployment of build 1.4.2",
+        "2024-04-05 15:40:03 INFO  Stopping service WebApp",
+        "2024-04-05 15:40:09 INFO  Copying 42 files to C:\\inetpub\\webapp",
+        "2024-04-05 15:41:55 WARN  Setting 'CacheSize' missing; using the default",
+        "2024-04-05 15:42:10 INFO  Starting service WebApp",
+        "2024-04-05 15:43:02 INFO  Health check passed",
+        "2024-04-05 15:43:13 INFO  Deployment finished in 00:03:12",
+    ],
+    "C:\\Users\\Administrator\\Documents\\results.csv": [
+        "Test,Status,DurationSeconds",
+        "Login,Passed,1.2",
+        "Checkout,Passed,3.4",
+        "Search,Failed,0.8",
+        "Profile,Passed,2.1",
+    ],
+    "C:\\Users\\Administrator\\Documents\\PowerShell Scripts\\backup.ps1": [
+        "$source = 'C:\\Users\\Administrator\\Documents'",
+        "$target = 'D:\\Backups\\' + (Get-Date -Format 'yyyy-MM-dd')",
+        "Copy-Item -Path $source -Destination $target -Recurse",
+    ],
+    "C:\\Users\\Administrator\\Documents\\PowerShell Scripts\\cleanup.ps1": [
+        "Get-ChildItem C:\\Temp -Filter *.tmp | Remove-Item",
+    ],
+}
+
+# Properties reachable under a second name, per type:
+# lowercased alias -> (alias as PowerShell spells it, lowercased property)
+_PROPERTY_ALIASES = {
+    "System.Diagnostics.Process": {"name": ("Name", "processname")},
+}
+
+
+def _build_processes():
+    names = ("Handles", "NPM", "PM", "WS", "CPU", "Id", "SI", "ProcessName")
+    rows = sorted(_PROCESSES, key=lambda row: (row[-1].lower(), row[5]))
+    return [PSObject("System.Diagnostics.Process", dict(zip(names, row))) for row in rows]
+
+
+def _build_services():
+    names = ("Status", "Name", "DisplayName", "StartType")
+    rows = sorted(_SERVICES, key=lambda row: row[1].lower())
+    return [PSObject("System.ServiceProcess.ServiceController", dict(zip(names, row))) for row in rows]
+
+
+def _file_system_item(parent, mode, date, time, length, name):
+    full_name = parent.rstrip("\\") + "\\" + name
+    properties = {
+        "Mode": mode,
+        "LastWriteTime": f"{date} {time:>9}",
+        "Length": length,
+        "Name": name,
+        "FullName": full_name,
+        "PSParentPath": parent,
+        "PSIsContainer": length is None,
+        "Extension": "" if length is None else (name[name.rfind("."):] if "." in name else ""),
+    }
+    return PSObject("System.IO.FileSystemInfo", properties)
+
+
+def _build_file_system():
+    directories = {}  # lowercased path -> (path, children)
+    items = {}  # lowercased path -> item
+    root = _file_system_item("", "d--hs-", "4/5/2024", "3:43 PM", None, "C:")
+    root.properties["FullName"] = "C:\\"
+    items["c:\\"] = root
+    for parent, entries in _TREE.items():
+        children = [_file_system_item(parent, *entry) for entry in entries]
+        directories[parent.lower()] = (parent, children)
+        for child in children:
+            items[child.properties["FullName"].lower()] = child
+    contents = {path.lower(): tuple(lines) for path, lines in _CONTENTS.items()}
+    return directories, items, contents
+
+
+PROCESSES = _build_processes()
+SERVICES = _build_services()
+COMPUTER_INFO = PSObject("ComputerInfo", dict(_COMPUTER_INFO))
+_DIRECTORIES, _ITEMS, _FILE_CONTENTS = _build_file_system()
+
+
+# ---------------------------------------------------------------------------
+# Parsing
+# ---------------------------------------------------------------------------
+
+_TOKEN_RE = re.compile(
+    r"""\s*(?:('(?:[^']|'')*')|("(?:[^"`]|`.)*")|(\{[^{}]*\})|([|;])|([^\s|;{}'"]+))"""
+)
+_SCRIPT_BLOCK_PROPERTY_RE = re.compile(r"^\{\s*\$_(?:\.(\w+))?\s*\}$")
+_SCRIPT_BLOCK_COMPARISON_RE = re.compile(r"^\{\s*\$_(?:\.(\w+))?\s+-(\w+)\s+(.+?)\s*\}$")
+_DRIVE_RE = re.compile(r"^[A-Za-z]:")
+_WILDCARD_CHARS = frozenset("*?[")
+
+
+def _unquote(text):
+    if len(text) >= 2 and text[0] == text[-1] == "'":
+        return text[1:-1].replace("''", "'")
+    if len(text) >= 2 and text[0] == text[-1] == '"':
+        return re.sub(r"`(.)", r"\1", text[1:-1])
+    return text
+
+
+def tokenize(command):
+    """
+    Split command into (kind, value) tokens: "word", "string" (unquoted),
+    "block" (a script block with its braces), "|" and ";"
+    """
+    tokens = []
+    position = 0
+    while position < len(command):
+        found = _TOKEN_RE.match(command, position)
+        if found is None:
+            if command[position:].strip():
+                raise PowerShellSimulationError(
+                    "The string is missing the terminator or the script block is not closed."
+                )
+            break
+        position = found.end()
+        single, double, block, operator, word = found.groups()
+        if single or double:
+            tokens.append(("string", _unquote(single or double)))
+        elif block:
+            tokens.append(("block", block))
+        elif operator:
+            tokens.append((operator, operator))
+        else:
+            tokens.append(("word", word))
+    return tokens
+
+
+def _merge_lists(tokens):
+    # "Name, CPU" is one argument: a list of property names
+    merged = []
+    for kind, value in tokens:
+        if (merged and merged[-1][0] in ("word", "string") and kind in ("word", "string")
+                and (merged[-1][1].endswith(",") or value.startswith(","))):
+            merged[-1] = ("word", merged[-1][1] + value)
+        else:
+            merged.append((kind, value))
+    return merged
+
+
+def _resolve_parameter(cmdlet, name):
+    candidates = cmdlet.parameters + cmdlet.switches + _COMMON_PARAMETERS + _COMMON_SWITCHES
+    lowered = name.lower()
+    for candidate in candidates:
+        if candidate.lower() == lowered:
+            return candidate
+    matches = [candidate for candidate in candidates if candidate.lower().startswith(lowered)]
+    if len(matches) == 1:
+        return matches[0]
+    if matches:
+        raise PowerShellSimulationError(
+            f"Parameter cannot be processed because the parameter name '{name}' is ambiguous."
+        )
+    raise PowerShellSimulationError(f"A parameter cannot be found that matches parameter name '{name}'.")
+
+
+def bind(cmdlet, arguments):
+    """
+    Bind a stage's argument tokens to cmdlet's parameters
+    """
+    parameters = {}
+    positional = []
+    index = 0
+    while index < len(arguments):
+        kind, value = arguments[index]
+        index += 1
+        if kind == "word" and len(value) > 1 and value[0] == "-" and not value[1].isdigit() and value[1] != ".":
+            name, colon, inline = value[1:].partition(":")
+            name = _resolve_parameter(cmdlet, name)
+            if name in cmdlet.switches or name in _COMMON_SWITCHES:
+                parameters[name] = inline.lower() != "$false"
+            elif inline:
+                parameters[name] = inline
+            elif index < len(arguments):
+                parameters[name] = arguments[index][1]
+                index += 1
+            else:
+                raise PowerShellSimulationError(f"Missing an argument for parameter '{name}'.")
+        else:
+            positional.append(value)
+    for name in cmdlet.positional:
+        if not positional:
+            break
+        if name not in parameters:
+            parameters[name] = positional.pop(0)
+    if positional:
+        if cmdlet.remaining is None:
+            raise PowerShellSimulationError(
+                f"A positional parameter cannot be found that accepts argument '{positional[0]}'."
+            )
+        if cmdlet.remaining in parameters:
+            positional.insert(0, parameters[cmdlet.remaining])
+        parameters[cmdlet.remaining] = positional
+    return parameters
+
+
+@lru_cache(maxsize=_PARSE_CACHE_SIZE)
+def compile_command(command):
+    """
+    Parse command into statements, each a tuple of Invocations for its
+    pipeline stages. Returns None if any stage uses a cmdlet the simulator
+    does not know. Raises PowerShellSimulationError for invalid commands.
+    """
+    statements = []
+    stage = []
+    stages = []
+    for kind, value in _merge_lists(tokenize(command)) + [(";", ";")]:
+        if kind in ("|", ";"):
+            if not stage:
+                if kind == "|" or stages:
+                    raise PowerShellSimulationError("An empty pipe element is not allowed.")
+                continue
+            stages.append(stage)
+            stage = []
+            if kind == ";":
+                statements.append(stages)
+                stages = []
+        else:
+            stage.append((kind, value))
+
+    compiled = []
+    for stages in statements:
+        invocations = []
+        for (kind, name), *arguments in stages:
+            lowered = name.lower()
+            cmdlet = CMDLETS.get(_ALIASES.get(lowered, lowered)) if kind == "word" else None
+            if cmdlet is None:
+                return None
+            try:
+                invocations.append(Invocation(cmdlet, bind(cmdlet, arguments)))
+            except PowerShellSimulationError as e:
+                raise PowerShellSimulationError(f"{cmdlet.name} : {e}") from None
+        compiled.append(tuple(invocations))
+    return tuple(compiled)
+
+
+# ---------------------------------------------------------------------------
+# Helpers for handlers
+# ---------------------------------------------------------------------------
+
+def _list(value):
+    """
+    Parameter value as a list: comma-separated words are split
+    """
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [item for part in value for item in _list(part)]
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _integer(cmdlet_parameter, value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise PowerShellSimulationError(
+            f"Cannot bind parameter '{cmdlet_parameter}'. Cannot convert value \"{value}\" to type \"System.Int32\"."
+        ) from None
+
+
+def _has_wildcard(text):
+    return any(char in _WILDCARD_CHARS for char in text)
+
+
+def _like(value, pattern):
+    return fnmatch.fnmatchcase(str(value).casefold(), pattern.casefold())
+
+
+def _block_property(block):
+    """
+    The property a script block like { $_.CPU } reads ("" for { $_ })
+    """
+    found = _SCRIPT_BLOCK_PROPERTY_RE.match(block)
+    if found is None:
+        raise PowerShellSimulationError("The simulator only supports script blocks of the form { $_.Property }.")
+    return found.group(1) or ""
+
+
+def _value(item, name):
+    if name == "":
+        return item
+    return item.get(name) if isinstance(item, PSObject) else None
+
+
+def _resolve_path(context, path):
+    """
+    Absolute, normalized form of path relative to the working directory
+    """
+    path = (path or ".").replace("/", "\\")
+    if path == "~" or path.startswith("~\\"):
+        path = HOME_DIR + path[1:]
+    if _DRIVE_RE.match(path):
+        drive, rest = path[:2].upper(), path[2:]
+    elif path.startswith("\\"):
+        drive, rest = context.working_dir[:2], path
+    else:
+        drive, rest = context.working_dir[:2], context.working_dir[2:] + "\\" + path
+    parts = []
+    for part in rest.split("\\"):
+        if part in ("", "."):
+            continue
+        if part == "..":
+            if parts:
+                parts.pop()
+            continue
+        parts.append(part)
+    resolved = drive + "\\" + "\\".join(parts)
+    item = _ITEMS.get(resolved.lower())
+    return item.properties["FullName"] if item else resolved
+
+
+def _not_found(path):
+    return PowerShellSimulationError(f"Cannot find path '{path}' because it does not exist.")
+
+
+def _parent(path):
+    parent = path.rpartition("\\")[0]
+    return parent + "\\" if parent.endswith(":") else parent
+
+
+def _children(directory, pattern, recurse):
+    _, children = _DIRECTORIES[directory.lower()]
+    items = [child for child in children if pattern is None or _like(child.properties["Name"], pattern)]
+    if recurse:
+        for child in children:
+            if child.properties["PSIsContainer"]:
+                items.extend(_children(child.properties["FullName"], pattern, recurse))
+    return items
+
+
+# ---------------------------------------------------------------------------
+# Cmdlet handlers: handler(context, input objects, parameters) -> objects
+# ---------------------------------------------------------------------------
+
+def _get_process(context, objects, parameters):
+    processes = PROCESSES
+    if "Id" in parameters:
+        ids = {_integer("Id", value) for value in _list(parameters["Id"])}
+        processes = [process for process in processes if process.get("Id") in ids]
+        missing = ids - {process.get("Id") for process in processes}
+        if missing:
+            raise PowerShellSimulationError(
+                f"Cannot find a process with the process identifier {min(missing)}."
+            )
+    names = _list(parameters.get("Name"))
+    for name in names:
+        if not _has_wildcard(name) and not any(_like(p.get("ProcessName"), name) for p in processes):
+            raise PowerShellSimulationError(
+                f"Cannot find a process with the name \"{name}\". Verify the process name and call the cmdlet again."
+            )
+    if names:
+        processes = [p for p in processes if any(_like(p.get("ProcessName"), name) for name in names)]
+    return list(processes)
+
+
+def _get_service(context, objects, parameters):
+    names = _list(parameters.get("Name"))
+    for name in names:
+        if not _has_wildcard(name) and not any(_like(s.get("Name"), name) for s in SERVICES):
+            raise PowerShellSimulationError(f"Cannot find any service with service name '{name}'.")
+    if not names:
+        return list(SERVICES)
+    return [service for service in SERVICES if any(_like(service.get("Name"), name) for name in names)]
+
+
+def _get_child_item(context, objects, parameters):
+    pattern = parameters.get("Filter")
+    recurse = parameters.get("Recurse", False)
+    items = []
+    for path in _list(parameters.get("Path")) or [context.working_dir]:
+        full = _resolve_path(context, path)
+        leaf_pattern = pattern
+        if full.lower() not in _DIRECTORIES:
+            parent, leaf = _parent(full), full.rpartition("\\")[2]
+            if _has_wildcard(leaf) and parent.lower() in _DIRECTORIES:
+                full, leaf_pattern = parent, leaf
+            elif full.lower() in _ITEMS:
+                items.append(_ITEMS[full.lower()])
+                continue
+            else:
+                raise _not_found(full)
+        items.extend(_children(full, leaf_pattern, recurse))
+    if parameters.get("File"):
+        items = [item for item in items if not item.properties["PSIsContainer"]]
+    if parameters.get("Directory"):
+        items = [item for item in items if item.properties["PSIsContainer"]]
+    if parameters.get("Name"):
+        return [item.properties["Name"] for item in items]
+    return items
+
+
+def _get_item(context, objects, parameters):
+    items = []
+    for path in _list(parameters.get("Path")) or ["."]:
+        full = _resolve_path(context, path)
+        item = _ITEMS.get(full.lower())
+        if item is None:
+            raise _not_found(full)
+        items.append(item)
+    return items
+
+
+def _get_content(context, objects, parameters):
+    if "Path" not in parameters:
+        raise PowerShellSimulationError("The simulator needs a -Path for Get-Content.")
+    lines = []
+    for path in _list(parameters.get("Path")):
+        full = _resolve_path(context, path)
+        if full.lower() in _DIRECTORIES:
+            raise PowerShellSimulationError(f"Unable to get content because it is a directory: '{full}'.")
+        if full.lower() not in _ITEMS:
+            raise _not_found(full)
+        lines.extend(_FILE_CONTENTS.get(full.lower(), ()))
+    head = parameters.get("TotalCount", parameters.get("Head", parameters.get("First")))
+    if head is not None:
+        lines = lines[:_integer("TotalCount", head)]
+    if "Tail" in parameters:
+        tail = _integer("Tail", parameters["Tail"])
+        lines = lines[-tail:] if tail else []
+    return lines
+
+
+def _get_location(context, objects, parameters):
+    return [PSObject("System.Management.Automation.PathInfo", {"Path": context.working_dir})]
+
+
+def _set_location(context, objects, parameters):
+    full = _resolve_path(context, parameters.get("Path", "~"))
+    if full.lower() not in _DIRECTORIES:
+        raise _not_found(full)
+    context.working_dir = full
+    return []
+
+
+def _remove_item(context, objects, parameters):
+    if parameters.get("Recurse") and parameters.get("Force"):
+        raise PowerShellSimulationError(
+            "Operation not permitted for security reasons. Use -Confirm parameter for confirmation."
+        )
+    for path in _list(parameters.get("Path")):
+        full = _resolve_path(context, path)
+        if not _has_wildcard(full) and full.lower() not in _ITEMS:
+            raise _not_found(full)
+    # Nothing is really removed: the simulated host never changes
+    return []
+
+
+# .NET date format specifiers, longest first
+_DATE_FORMATS = (
+    ("dddd", "%A"), ("MMMM", "%B"), ("yyyy", "%Y"), ("ddd", "%a"), ("MMM", "%b"),
+    ("yy", "%y"), ("MM", "%m"), ("dd", "%d"), ("HH", "%H"), ("hh", "%I"),
+    ("mm", "%M"), ("ss", "%S"), ("tt", "%p"),
+)
+_DATE_FORMAT_RE = re.compile("|".join(specifier for specifier, _ in _DATE_FORMATS))
+
+
+def _get_date(context, objects, parameters):
+    now = context.now
+    if "Format" in parameters:
+        strftime = dict(_DATE_FORMATS)
+        return [now.strftime(_DATE_FORMAT_RE.sub(lambda m: strftime[m.group(0)], parameters["Format"]))]
+    if "UFormat" in parameters:
+        return [now.strftime(parameters["UFormat"])]
+    return [PSObject("System.DateTime", {
+        "DateTime": now.strftime("%A, %B %d, %Y %I:%M:%S %p"),
+        "Date": now.strftime("%m/%d/%Y 12:00:00 AM"),
+        "Day": now.day,
+        "DayOfWeek": now.strftime("%A"),
+        "DayOfYear": now.timetuple().tm_yday,
+        "Hour": now.hour,
+        "Minute": now.minute,
+        "Month": now.month,
+        "Second": now.second,
+        "Year": now.year,
+    })]
+
+
+def _get_computer_info(context, objects, parameters):
+    patterns = _list(parameters.get("Property"))
+    if not patterns:
+        return [COMPUTER_INFO]
+    properties = {
+        name: value for name, value in COMPUTER_INFO.properties.items()
+        if any(_like(name, pattern) for pattern in patterns)
+    }
+    return [PSObject("ComputerInfo", properties)]
+
+
+def _write_output(context, objects, parameters):
+    return _list(parameters.get("InputObject"))
+
+
+def _write_host(context, objects, parameters):
+    # Everything goes on one line, separated by spaces
+    values = _list(parameters["Object"]) if "Object" in parameters else list(objects)
+    return [" ".join(str(value) for value in values)]
+
+
+def _clear_host(context, objects, parameters):
+    return []
+
+
+def _sort_key(value):
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (1, value)
+    return (2, str(value).casefold())
+
+
+def _sort_object(context, objects, parameters):
+    names = [_block_property(name) if name.startswith("{") else name for name in _list(parameters.get("Property"))]
+    if not names:
+        names = [""]
+    ordered = sorted(
+        objects,
+        key=lambda item: tuple(_sort_key(_value(item, name)) for name in names),
+        reverse=bool(parameters.get("Descending"))
+    )
+    if parameters.get("Unique"):
+        seen = set()
+        unique = []
+        for item in ordered:
+            key = tuple(_sort_key(_value(item, name)) for name in names)
+            if key not in seen:
+                seen.add(key)
+                unique.append(item)
+        ordered = unique
+    return ordered
+
+
+def _select_object(context, objects, parameters):
+    objects = list(objects)
+    if "Skip" in parameters:
+        objects = objects[_integer("Skip", parameters["Skip"]):]
+    if "First" in parameters or "Last" in parameters:
+        first = objects[:_integer("First", parameters["First"])] if "First" in parameters else []
+        last_count = _integer("Last", parameters["Last"]) if "Last" in parameters else 0
+        last = objects[-last_count:] if last_count else []
+        objects = first + last
+    if "ExpandProperty" in parameters:
+        name = parameters["ExpandProperty"]
+        values = []
+        for item in objects:
+            if not (isinstance(item, PSObject) and item.property_name(name)):
+                raise PowerShellSimulationError(f"Property \"{name}\" cannot be found.")
+            values.append(item.get(name))
+        objects = values
+    elif "Property" in parameters:
+        patterns = _list(parameters["Property"])
+        selected = []
+        for item in objects:
+            properties = {}
+            for pattern in patterns:
+                if isinstance(item, PSObject) and _has_wildcard(pattern):
+                    properties.update(
+                        (name, value) for name, value in item.properties.items() if _like(name, pattern)
+                    )
+                else:
+                    actual = item.property_name(pattern) if isinstance(item, PSObject) else None
+                    name = item.selected_name(pattern) if actual else pattern
+                    properties[name] = item.properties[actual] if actual else None
+            type_name = item.type_name if isinstance(item, PSObject) else "System.Object"
+            selected.append(PSObject(f"Selected.{type_name}", properties))
+        objects = selected
+    if parameters.get("Unique"):
+        seen = set()
+        unique = []
+        for item in objects:
+            key = tuple(item.properties.items()) if isinstance(item, PSObject) else item
+            if key not in seen:
+                seen.add(key)
+                unique.append(item)
+        objects = unique
+    return objects
+
+
+def _number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _compare(operator, left, right):
+    if operator in ("like", "notlike"):
+        return _like(left, right) == (operator == "like")
+    if operator in ("match", "notmatch"):
+        try:
+            return bool(re.search(right, str(left), re.IGNORECASE)) == (operator == "match")
+        except re.error as e:
+            raise PowerShellSimulationError(f"The regular expression pattern {right} is not valid: {e}") from None
+    if isinstance(left, bool):
+        right = right.lower() in ("$true", "true", "1")
+    elif isinstance(left, (int, float)) and _number(right) is not None:
+        right = _number(right)
+    else:
+        left, right = ("" if left is None else str(left)).casefold(), right.casefold()
+    return _COMPARISONS[operator](left, right)
+
+
+_COMPARISONS = {
+    "eq": lambda left, right: left == right,
+    "ne": lambda left, right: left != right,
+    "gt": lambda left, right: left > right,
+    "ge": lambda left, right: left >= right,
+    "lt": lambda left, right: left < right,
+    "le": lambda left, right: left <= right,
+}
+_OPERATORS = ("EQ", "NE", "GT", "GE", "LT", "LE", "Like", "NotLike", "Match", "NotMatch")
+_OPERATOR_NAMES = frozenset(operator.lower() for operator in _OPERATORS)
+
+
+def _where_object(context, objects, parameters):
+    subject = parameters.get("FilterScript", parameters.get("Property"))
+    if subject is None:
+        raise PowerShellSimulationError("The simulator needs a property or a script block for Where-Object.")
+    if subject.startswith("{"):
+        found = _SCRIPT_BLOCK_COMPARISON_RE.match(subject)
+        if found is None or found.group(2).lower() not in _OPERATOR_NAMES:
+            raise PowerShellSimulationError(
+                "The simulator only supports script blocks of the form { $_.Property -operator value }."
+            )
+        name, operator, right = found.group(1) or "", found.group(2).lower(), _unquote(found.group(3))
+    else:
+        name = subject
+        operators = [operator.lower() for operator in _OPERATORS if parameters.get(operator)]
+        if len(operators) > 1:
+            raise PowerShellSimulationError("Parameter set cannot be resolved using the specified named parameters.")
+        operator = operators[0] if operators else None
+        right = parameters.get("Value", "")
+    if operator is None:
+        return [item for item in objects if _value(item, name)]
+    return [item for item in objects if _compare(operator, _value(item, name), right)]
+
+
+def _foreach_object(context, objects, parameters):
+    member = parameters.get("MemberName") or parameters.get("Process")
+    if member is None:
+        raise PowerShellSimulationError("The simulator needs a member name or { $_.Property } for ForEach-Object.")
+    name = _block_property(member) if member.startswith("{") else member
+    return [_value(item, name) for item in objects]
+
+
+def _measure_object(context, objects, parameters):
+    name = parameters.get("Property")
+    values = objects
+    if name is not None:
+        # Objects without the property (directories have no Length) are
+        # skipped rather than counted or summed
+        values = [value for value in (_value(item, name) for item in objects) if value is not None]
+    numbers = []
+    if any(parameters.get(option) for option in ("Sum", "Average", "Maximum", "Minimum")):
+        for value in values:
+            number = value if isinstance(value, (int, float)) else _number(str(value))
+            if number is None:
+                raise PowerShellSimulationError(
+                    f"Input object \"{value}\" is not numeric."
+                )
+            numbers.append(number)
+    return [PSObject("GenericMeasureInfo", {
+        "Count": len(values),
+        "Average": sum(numbers) / len(numbers) if parameters.get("Average") and numbers else None,
+        "Sum": sum(numbers) if parameters.get("Sum") else None,
+        "Maximum": max(numbers) if parameters.get("Maximum") and numbers else None,
+        "Minimum": min(numbers) if parameters.get("Minimum") and numbers else None,
+        "Property": name,
+    })]
+
+
+def _format_table(context, objects, parameters):
+    return [format_objects(objects, "table", _list(parameters.get("Property")) or None)]
+
+
+def _format_list(context, objects, parameters):
+    return [format_objects(objects, "list", _list(parameters.get("Property")) or None)]
+
+
+def _out_string(context, objects, parameters):
+    return [format_objects(objects)]
+
+
+def _pass_through(context, objects, parameters):
+    return objects
+
+
+def _cmdlet(name, handler, parameters=(), switches=(), positional=(), remaining=None):
+    return Cmdlet(name, handler, tuple(parameters), tuple(switches), tuple(positional), remaining)
+
+
+# Registry of simulated cmdlets keyed on the lowercased Verb-Noun name
+CMDLETS = {cmdlet.name.lower(): cmdlet for cmdlet in (
+    _cmdlet("Get-Process", _get_process, ["Name", "Id"], positional=["Name"]),
+    _cmdlet("Get-Service", _get_service, ["Name"], positional=["Name"]),
+    _cmdlet("Get-ChildItem", _get_child_item, ["Path", "Filter"],
+            ["Recurse", "File", "Directory", "Force", "Name"], ["Path", "Filter"]),
+    _cmdlet("Get-Item", _get_item, ["Path"], ["Force"], ["Path"]),
+    _cmdlet("Get-Content", _get_content, ["Path", "TotalCount", "Head", "First", "Tail"], positional=["Path"]),
+    _cmdlet("Get-Location", _get_location),
+    _cmdlet("Set-Location", _set_location, ["Path"], positional=["Path"]),
+    _cmdlet("Remove-Item", _remove_item, ["Path", "Filter"], ["Recurse", "Force"], ["Path"]),
+    _cmdlet("Get-Date", _get_date, ["Format", "UFormat"]),
+    _cmdlet("Get-ComputerInfo", _get_computer_info, ["Property"], positional=["Property"]),
+    _cmdlet("Write-Output", _write_output, ["InputObject"], positional=["InputObject"], remaining="InputObject"),
+    _cmdlet("Write-Host", _write_host, ["Object"], ["NoNewline"], ["Object"], remaining="Object"),
+    _cmdlet("Clear-Host", _clear_host),
+    _cmdlet("Sort-Object", _sort_object, ["Property"], ["Descending", "Unique"], ["Property"]),
+    _cmdlet("Select-Object", _select_object, ["Property", "ExpandProperty", "First", "Last", "Skip"],
+            ["Unique"], ["Property"]),
+    _cmdlet("Where-Object", _where_object, ["Property", "Value", "FilterScript"], _OPERATORS,
+            ["Property", "Value"]),
+    _cmdlet("ForEach-Object", _foreach_object, ["MemberName", "Process"], positional=["MemberName"]),
+    _cmdlet("Measure-Object", _measure_object, ["Property"], ["Sum", "Average", "Maximum", "Minimum"],
+            ["Property"]),
+    _cmdlet("Format-Table", _format_table, ["Property"], ["AutoSize", "Wrap"], ["Property"]),
+    _cmdlet("Format-List", _format_list, ["Property"], positional=["Property"]),
+    _cmdlet("Out-String", _out_string, switches=["Stream"]),
+    _cmdlet("Out-Host", _pass_through),
+    _cmdlet("Out-Default", _pass_through),
+)}
+
+# Aliases of the simulated cmdlets, on top of those the risk rules know
+_ALIASES = dict(POWERSHELL_ALIASES, **{
+    "ls": "get-childitem", "dir": "get-childitem", "gci": "get-childitem",
+    "gi": "get-item", "ps": "get-process", "gps": "get-process", "gsv": "get-service",
+    "cd": "set-location", "sl": "set-location", "chdir": "set-location",
+    "pwd": "get-location", "gl": "get-location",
+    "cat": "get-content", "gc": "get-content", "type": "get-content",
+    "sort": "sort-object", "select": "select-object",
+    "where": "where-object", "?": "where-object",
+    "foreach": "foreach-object", "%": "foreach-object",
+    "measure": "measure-object", "ft": "format-table", "fl": "format-list",
+    "echo": "write-output", "write": "write-output", "cls": "clear-host", "clear": "clear-host",
+})
+
+
+# ---------------------------------------------------------------------------
+# Formatting
+# ---------------------------------------------------------------------------
+
+# A table column: header, property, width (None for the last column),
+# right-aligned and a format for the value
+Column = namedtuple("Column", ["header", "property", "width", "right", "format"])
+
+# Default table views and the property whose changes start a new group
+_TABLE_VIEWS = {
+    "System.Diagnostics.Process": ([
+        Column("Handles", "Handles", 7, True, None),
+        Column("NPM(K)", "NPM", 7, True, None),
+        Column("PM(K)", "PM", 8, True, None),
+        Column("WS(K)", "WS", 10, True, None),
+        Column("CPU(s)", "CPU", 10, True, "{:.2f}"),
+        Column("Id", "Id", 6, True, None),
+        Column("SI", "SI", 3, True, None),
+        Column("ProcessName", "ProcessName", None, False, None),
+    ], None),
+    "System.ServiceProcess.ServiceController": ([
+        Column("Status", "Status", 8, False, None),
+        Column("Name", "Name", 18, False, None),
+        Column("DisplayName", "DisplayName", None, False, None),
+    ], None),
+    "System.IO.FileSystemInfo": ([
+        Column("Mode", "Mode", 6, False, None),
+        Column("LastWriteTime", "LastWriteTime", 27, True, None),
+        Column("Length", "Length", 14, True, None),
+        Column("Name", "Name", None, False, None),
+    ], ("Directory", "PSParentPath")),
+}
+# Types shown one property per line by default
+_LIST_VIEWS = frozenset(["ComputerInfo", "GenericMeasureInfo"])
+# Types shown as a single property
+_STRING_VIEWS = {"System.DateTime": "DateTime"}
+# Objects with more properties than this are listed rather than tabled
+_MAX_TABLE_PROPERTIES = 4
+
+
+def _cell(value, format=None):
+    if value is None:
+        return ""
+    if format is not None:
+        return format.format(value)
+    if isinstance(value, bool):
+        return "True" if value else "False"
+    if isinstance(value, float):
+        return f"{value:.4f}".rstrip("0").rstrip(".")
+    return str(value)
+
+
+def _auto_columns(objects, names):
+    columns = []
+    for index, name in enumerate(names):
+        values = [item.get(name) for item in objects]
+        right = all(isinstance(value, (int, float)) and not isinstance(value, bool)
+                    for value in values if value is not None) and any(v is not None for v in values)
+        last = index == len(names) - 1
+        width = None if last else max([len(name)] + [len(_cell(value)) for value in values])
+        columns.append(Column(name, name, width, right, None))
+    return columns
+
+
+def _render_row(columns, cells):
+    parts = []
+    for column, cell in zip(columns, cells):
+        if column.width is None:
+            parts.append(cell)
+        elif column.right:
+            parts.append(cell.rjust(column.width))
+        else:
+            parts.append(cell.ljust(column.width))
+    return " ".join(parts).rstrip()
+
+
+def _render_table(objects, columns, group=None):
+    lines = []
+    current = object()
+    for item in objects:
+        header = not lines
+        if group is not None and item.get(group[1]) != current:
+            current = item.get(group[1])
+            lines.extend(["", f"    {group[0]}: {current}", ""])
+            header = True
+        if header:
+            lines.append(_render_row(columns, [column.header for column in columns]))
+            lines.append(_render_row(columns, ["-" * len(column.header) for column in columns]))
+        lines.append(_render_row(columns, [_cell(item.get(column.property), column.format) for column in columns]))
+    return "\n".join(lines)
+
+
+def _render_list(objects, names=None):
+    blocks = []
+    for item in objects:
+        item_names = names or list(item.properties)
+        width = max((len(name) for name in item_names), default=0)
+        blocks.append("\n".join(f"{name.ljust(width)} : {_cell(item.get(name))}".rstrip() for name in item_names))
+    return "\n\n".join(blocks)
+
+
+def _render_group(objects, view=None, names=None):
+    first = objects[0]
+    if names:
+        names = [name for pattern in names for name in (
+            [n for n in first.properties if _like(n, pattern)] if _has_wildcard(pattern) else [pattern]
+        )]
+    if view is None and names is None:
+        if first.type_name in _STRING_VIEWS:
+            return "\n".join(str(item.get(_STRING_VIEWS[first.type_name])) for item in objects)
+        if first.type_name in _TABLE_VIEWS:
+            columns, group = _TABLE_VIEWS[first.type_name]
+            return _render_table(objects, columns, group)
+        view = "list" if (first.type_name in _LIST_VIEWS
+                          or len(first.properties) > _MAX_TABLE_PROPERTIES) else "table"
+    if view == "list":
+        return _render_list(objects, names)
+    if names is None and first.type_name in _TABLE_VIEWS:
+        columns, group = _TABLE_VIEWS[first.type_name]
+        return _render_table(objects, columns, group)
+    return _render_table(objects, _auto_columns(objects, names or list(first.properties)))
+
+
+def format_objects(objects, view=None, names=None):
+    """
+    Render pipeline output as text: runs of objects of one type as a table
+    or list, anything else one value per line
+    """
+    chunks = []
+    run = []
+    for item in objects:
+        if isinstance(item, PSObject):
+            if run and run[0].type_name != item.type_name:
+                chunks.append(_render_group(run, view, names))
+                run = []
+            run.append(item)
+        else:
+            if run:
+                chunks.append(_render_group(run, view, names))
+                run = []
+            chunks.append(_cell(item))
+    if run:
+        chunks.append(_render_group(run, view, names))
+    return "\n".join(chunk.strip("\n") for chunk in chunks)
+
+
+# ---------------------------------------------------------------------------
+# Running commands
+# ---------------------------------------------------------------------------
+
+def simulate(command, working_dir=DEFAULT_WORKING_DIR):
+    """
+    Run command against the simulated host. Returns a SimulationResult
+    with the formatted output, the error stream, an exit code and the
+    working directory afterwards.
+    """
+    try:
+        statements = compile_command(command.strip())
+    except PowerShellSimulationError as e:
+        return SimulationResult("", str(e), 1, working_dir)
+    if statements is None:
+        return SimulationResult(UNSUPPORTED_OUTPUT, "", 0, working_dir)
+
+    context = SimulationContext(working_dir)
+    output = []
+    for invocations in statements:
+        objects = []
+        for invocation in invocations:
+            try:
+                objects = invocation.cmdlet.handler(context, objects, invocation.parameters)
+            except PowerShellSimulationError as e:
+                stdout = "\n".join(chunk for chunk in output if chunk)
+                return SimulationResult(stdout, f"{invocation.cmdlet.name} : {e}", 1, context.working_dir)
+        output.append(format_objects(objects))
+    return SimulationResult("\n".join(chunk for chunk in output if chunk), "", 0, context.working_dir)
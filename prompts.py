@@ -0,0 +1,193 @@
+"""
+Compact translation prompts and structured-output schemas
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+The model is asked for exactly the fields a client wants, through a
+strict JSON schema, instead of a long prose prompt with a sample object.
+breakdown and simulation are optional: they are most of the output
+tokens, and many clients only want the command.
+
+Every (shell, fields) combination maps to one system prompt and schema
+that are built once and reused, so each request sends a byte-identical
+prefix and the provider's prompt caching can apply. The instructions that
+never change come first, then the host description, then the list of
+requested fields.
+"""
+from functools import lru_cache
+
+# Fields in the order the model generates them; the command comes first so
+# streaming clients see it as early as possible
+ALL_FIELDS = ("command", "explanation", "breakdown", "simulation", "safety_warning")
+# Fields a client may leave out
+OPTIONAL_FIELDS = ("breakdown", "simulation")
+# Fields of a quick first-phase translation; the rest are fetched on demand
+QUICK_FIELDS = tuple(name for name in ALL_FIELDS if name not in OPTIONAL_FIELDS)
+
+_SHELLS = {
+    "linux": {
+        "name": "Linux",
+        "environment": "a standard Linux environment",
+        "rules": "Never produce destructive commands such as rm -rf /. "
+                 "Prefer the safest reading of an ambiguous request.",
+    },
+    "powershell": {
+        "name": "PowerShell",
+        "environment": "Windows",
+        "rules": "Never produce commands that could damage the system. "
+                 "Use modern cmdlets and PowerShell best practices. "
+                 "Prefer the safest reading of an ambiguous request.",
+    },
+}
+
+_FIELD_DESCRIPTIONS = {
+    "command": "the exact command to run",
+    "explanation": "one or two sentences on what it does",
+    "breakdown": "each component of the command with its meaning",
+    "simulation": "plausible output of the command in {environment}",
+    "safety_warning": "any safety concern, or null",
+}
+
+_STRING = {"type": "string"}
+
+_FIELD_SCHEMAS = {
+    "command": _STRING,
+    "explanation": _STRING,
+    # Strict schemas cannot have free-form object keys, so components are
+    # listed as pairs and turned back into a mapping by normalize_field()
+    "breakdown": {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {"part": _STRING, "meaning": _STRING},
+            "required": ["part", "meaning"],
+            "additionalProperties": False,
+        },
+    },
+    "simulation": _STRING,
+    "safety_warning": {"type": ["string", "null"]},
+}
+
+
+def parse_fields(value, default=ALL_FIELDS):
+    """
+    Parse a client's fields parameter (a list or a comma-separated string)
+    into the canonical tuple of fields to generate. Required fields are
+    always included; None or empty means default. Raises ValueError for
+    unknown names.
+    """
+    if value is None or value == "" or value == []:
+        return default
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+        raise ValueError("fields must be a list or a comma-separated string")
+    names = {name.strip() for name in value if name.strip()}
+    unknown = names - set(ALL_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(name for name in ALL_FIELDS if name not in OPTIONAL_FIELDS or name in names)
+
+
+def _answer_instruction(spec, fields):
+    wanted = "; ".join(
+        f"{name}: {_FIELD_DESCRIPTIONS[name].format(environment=spec['environment'])}" for name in fields
+    )
+    return f"Answer in JSON with {wanted}."
+
+
+@lru_cache(maxsize=64)
+def system_prompt(shell, fields=ALL_FIELDS, host_description=None):
+    """
+    System prompt asking for fields of a translation to shell
+    """
+    spec = _SHELLS[shell]
+    lines = [
+        f"You translate natural language requests into {spec['name']} commands. {spec['rules']}",
+    ]
+    if host_description:
+        lines.append(f"Commands will run on this host: {host_description}.")
+    lines.append(_answer_instruction(spec, fields))
+    return "\n".join(lines)
+
+
+@lru_cache(maxsize=16)
+def response_format(fields=ALL_FIELDS):
+    """
+    Strict structured-output response_format for fields
+    """
+    properties = {name: _FIELD_SCHEMAS[name] for name in fields}
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "translation",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": properties,
+                "required": list(properties),
+                "additionalProperties": False,
+            },
+        },
+    }
+
+
+@lru_cache(maxsize=16)
+def details_prompt(shell, host_description=None):
+    """
+    System prompt asking for the optional fields of an existing translation
+    """
+    spec = _SHELLS[shell]
+    lines = [f"You explain {spec['name']} commands that answer a user's request."]
+    if host_description:
+        lines.append(f"Commands will run on this host: {host_description}.")
+    lines.append(_answer_instruction(spec, OPTIONAL_FIELDS))
+    return "\n".join(lines)
+
+
+def build_details_messages(query, command, shell, host_description=None):
+    """
+    Chat messages asking for the breakdown and simulation of command
+    """
+    return [
+        {"role": "system", "content": details_prompt(shell, host_description)},
+        {"role": "user", "content": f"Request: {query}\nCommand: {command}"},
+    ]
+
+
+def build_messages(query, shell, fields=ALL_FIELDS, host_description=None):
+    """
+    Chat messages for translating query
+    """
+    return [
+        {"role": "system", "content": system_prompt(shell, fields, host_description)},
+        {"role": "user", "content": query},
+    ]
+
+
+def normalize_field(key, value):
+    """
+    Convert a field as generated under the schema to its API form
+    """
+    if key == "breakdown" and isinstance(value, list):
+        return {
+            item.get("part", ""): item.get("meaning", "")
+            for item in value if isinstance(item, dict)
+        }
+    return value
+
+
+def normalize_result(result):
+    """
+    Convert a generated translation to its API form
+    """
+    return {key: normalize_field(key, value) for key, value in result.items()}
+
+
+def select_fields(result, fields):
+    """
+    Drop the optional fields a client did not ask for from result, in place
+    """
+    for name in OPTIONAL_FIELDS:
+        if name not in fields:
+            result.pop(name, None)
+    return result
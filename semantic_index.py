@@ -0,0 +1,372 @@
+"""
+Semantic near-duplicate lookup over past translations
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+Exact-match caching misses paraphrases ("show biggest files" / "list
+largest files"). Every translated query is embedded with a hashed word,
+word-bigram and character-trigram vectorizer into a fixed-size,
+L2-normalized float32 vector, and lookups run a cosine top-k search over
+the matrix of past queries.
+
+With SEMANTIC_INDEX_DIR set, vectors are appended to one raw float32 file
+per shell and read back through a read-only memory map, so every gunicorn
+worker shares the same page-cached matrix instead of loading its own
+copy, and picks up rows appended by other workers on the next search.
+
+Each shell keeps at most SEMANTIC_INDEX_MAX_ROWS rows. When an append
+would pass that, the oldest quarter is dropped. On disk the files are
+rewritten and swapped in under an exclusive flock on a per-shell lock file,
+and other workers reload them under a shared one once they see the vectors
+file has been replaced.
+
+A match is only reused if both queries name the same literal arguments
+(numbers, ports, IP addresses, paths and file names) and the same kinds
+of action (listing, deleting, adding, ...). Cosine similarity barely
+moves between "ping 10.0.0.5" and "ping 10.0.0.6", or between "add bob to
+the sudo group" and "remove bob from the sudo group", but the command for
+one is wrong for the other.
+
+numpy is a declared dependency. If it is missing anyway, the index is
+disabled (with a warning at start-up) and lookups return None.
+"""
+import fcntl
+import json
+import logging
+import os
+import re
+import threading
+import zlib
+from contextlib import contextmanager
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+SEMANTIC_INDEX_DIR = os.environ.get("SEMANTIC_INDEX_DIR")
+# Rows kept per shell; each costs dim * 4 bytes (4 KiB at the default 1024)
+SEMANTIC_INDEX_MAX_ROWS = int(os.environ.get("SEMANTIC_INDEX_MAX_ROWS", "10000"))
+# Minimum cosine similarity for reusing a past translation
+SEMANTIC_MATCH_THRESHOLD = float(os.environ.get("SEMANTIC_MATCH_THRESHOLD", "0.9"))
+# Bar used while the model is unavailable. It is never lower than the
+# normal one: "list" vs "delete" pairs already score about 0.85.
+SEMANTIC_DEGRADED_THRESHOLD = max(
+    SEMANTIC_MATCH_THRESHOLD,
+    float(os.environ.get("SEMANTIC_DEGRADED_THRESHOLD", str(SEMANTIC_MATCH_THRESHOLD)))
+)
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+# Words carrying a literal argument: anything with a digit or path punctuation
+_LITERAL_RE = re.compile(r"[^\s'\"]*[\d/\\~.][^\s'\"]*")
+_LITERAL_PUNCTUATION = ".,;:!?()[]{}"
+
+# Action words grouped by what they do; queries must share the groups
+_ACTION_GROUPS = {
+    "read": ["list", "show", "display", "print", "get", "view", "see", "check", "find",
+             "search", "locate", "count", "which", "what"],
+    "delete": ["delete", "remove", "erase", "rm", "purge", "wipe", "clear", "clean", "drop"],
+    "create": ["add", "create", "make", "new", "mkdir", "touch", "generate", "append"],
+    "change": ["change", "set", "modify", "update", "edit", "replace", "chmod", "chown"],
+    "move": ["move", "rename", "mv"],
+    "copy": ["copy", "cp", "duplicate", "backup", "sync"],
+    "stop": ["kill", "stop", "terminate", "end", "shutdown", "halt", "disable", "block"],
+    "start": ["start", "run", "launch", "restart", "reload", "enable", "allow", "open"],
+    "install": ["install", "upgrade"],
+    "uninstall": ["uninstall"],
+    "pack": ["compress", "zip", "archive", "tar", "pack"],
+    "unpack": ["extract", "unzip", "decompress", "untar", "unpack"],
+    "download": ["download", "fetch", "pull", "clone"],
+    "upload": ["upload", "push", "send"],
+    "mount": ["mount"],
+    "unmount": ["unmount", "umount", "eject"],
+}
+_ACTIONS = {word: group for group, words in _ACTION_GROUPS.items() for word in words}
+# Translation sources that are not an answer to the logged query itself
+_UNINDEXED_SOURCES = frozenset(["degraded", "semantic"])
+
+# Feature weights: whole words dominate so that a different verb
+# ("delete" vs "list") outweighs shared character trigrams
+_WORD_WEIGHT = 1.0
+_BIGRAM_WEIGHT = 0.7
+_TRIGRAM_WEIGHT = 0.25
+
+
+def _features(text):
+    words = _WORD_RE.findall(text.casefold())
+    for word in words:
+        yield "w:" + word, _WORD_WEIGHT
+        padded = f"#{word}#"
+        for i in range(len(padded) - 2):
+            yield "c:" + padded[i:i + 3], _TRIGRAM_WEIGHT
+    for first, second in zip(words, words[1:]):
+        yield f"b:{first} {second}", _BIGRAM_WEIGHT
+
+
+def literals(text):
+    """
+    The literal arguments in a query (numbers, IPs, ports, paths, file
+    names) as a set, so queries differing only in them can be told apart
+    """
+    found = set()
+    for word in _LITERAL_RE.findall(text):
+        # "." and ".." are directories, not punctuation
+        if word not in (".", ".."):
+            word = word.strip(_LITERAL_PUNCTUATION)
+        if _LITERAL_RE.fullmatch(word):
+            found.add(word)
+    return frozenset(found)
+
+
+def actions(text):
+    """
+    The kinds of action a query asks for, as a set of _ACTION_GROUPS names
+    """
+    return frozenset(_ACTIONS[word] for word in _WORD_RE.findall(text.casefold()) if word in _ACTIONS)
+
+
+class HashingVectorizer:
+    """
+    Maps text to an L2-normalized vector using the signed hashing trick
+    """
+
+    def __init__(self, dim=1024):
+        self.dim = dim
+
+    def transform(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in _features(text):
+            hashed = zlib.crc32(feature.encode("utf-8"))
+            # One hash bit picks the sign to reduce collision bias
+            vector[hashed % self.dim] += weight if hashed & 0x80000000 else -weight
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector
+
+
+class _Shard:
+    """
+    Vectors and entries for one shell, in memory or backed by files
+    """
+
+    def __init__(self, dim, directory=None, name=None, max_rows=SEMANTIC_INDEX_MAX_ROWS):
+        self.dim = dim
+        self.max_rows = max(1, max_rows)
+        self._reset()
+        self._vectors_path = None
+        self._entries_path = None
+        self._lock_path = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._vectors_path = os.path.join(directory, f"{name}.f32")
+            self._entries_path = os.path.join(directory, f"{name}.jsonl")
+            self._lock_path = os.path.join(directory, f"{name}.lock")
+            self.refresh()
+
+    def _reset(self):
+        self.entries = []
+        self.queries = set()
+        self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+        self._entries_offset = 0
+        self._vectors_inode = None
+
+    @property
+    def rows(self):
+        return len(self.entries)
+
+    def _keep(self):
+        # Rows left after evicting the oldest quarter
+        return self.max_rows - max(1, self.max_rows // 4)
+
+    @contextmanager
+    def _file_lock(self, operation):
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def refresh(self):
+        """
+        Map rows appended (possibly by other workers) since the last
+        refresh, or reload the files if another worker compacted them
+        """
+        if not self._vectors_path:
+            return
+        try:
+            stat = os.stat(self._vectors_path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino == self._vectors_inode and stat.st_size // (self.dim * 4) <= self.rows:
+            return
+        with self._file_lock(fcntl.LOCK_SH):
+            self._refresh_locked()
+
+    def _refresh_locked(self):
+        # Caller holds the file lock
+        try:
+            stat = os.stat(self._vectors_path)
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self._vectors_inode:
+            self._reset()
+            self._vectors_inode = stat.st_ino
+        rows = stat.st_size // (self.dim * 4)
+        if rows <= self.rows:
+            return
+        with open(self._entries_path, "r", encoding="utf-8") as f:
+            f.seek(self._entries_offset)
+            while self.rows < rows:
+                line = f.readline()
+                if not line.endswith("\n"):
+                    break
+                entry = json.loads(line)
+                self.entries.append(entry)
+                self.queries.add(entry["query"].casefold())
+            self._entries_offset = f.tell()
+        self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r",
+                                 shape=(self.rows, self.dim))
+
+    def _compact_files(self):
+        # Caller holds the exclusive file lock; rewrite both files with the
+        # newest rows and swap them in
+        start = self.rows - self._keep()
+        with open(self._entries_path + ".tmp", "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in self.entries[start:])
+        np.ascontiguousarray(self._matrix[start:self.rows]).tofile(self._vectors_path + ".tmp")
+        os.replace(self._entries_path + ".tmp", self._entries_path)
+        os.replace(self._vectors_path + ".tmp", self._vectors_path)
+        self._reset()
+        self._refresh_locked()
+
+    def append(self, entry, vector):
+        if self._vectors_path:
+            with self._file_lock(fcntl.LOCK_EX):
+                self._refresh_locked()
+                if self.rows >= self.max_rows:
+                    self._compact_files()
+                with open(self._entries_path, "a", encoding="utf-8") as entries_file, \
+                        open(self._vectors_path, "ab") as vectors_file:
+                    # Entries are written before vectors so readers never see a
+                    # vector row without its entry
+                    entries_file.write(json.dumps(entry) + "\n")
+                    entries_file.flush()
+                    vectors_file.write(vector.tobytes())
+                self._refresh_locked()
+        else:
+            if self.rows >= self.max_rows:
+                start = self.rows - self._keep()
+                self._matrix[:self.rows - start] = self._matrix[start:self.rows]
+                self.entries = self.entries[start:]
+                self.queries = {kept["query"].casefold() for kept in self.entries}
+            if self.rows == len(self._matrix):
+                # Grow geometrically so appends stay amortized O(1)
+                grown = np.zeros((min(self.max_rows, max(64, 2 * self.rows)), self.dim), dtype=np.float32)
+                grown[:self.rows] = self._matrix[:self.rows]
+                self._matrix = grown
+            self._matrix[self.rows] = vector
+            self.entries.append(entry)
+            self.queries.add(entry["query"].casefold())
+
+    def search(self, vector, k):
+        if not self.rows:
+            return []
+        scores = self._matrix[:self.rows] @ vector
+        k = min(k, self.rows)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.entries[i], float(scores[i])) for i in top]
+
+
+class SemanticIndex:
+    """
+    Cosine-similarity index of past query/command pairs, one shard per shell
+    """
+
+    def __init__(self, directory=None, dim=1024, threshold=SEMANTIC_MATCH_THRESHOLD,
+                 max_rows=SEMANTIC_INDEX_MAX_ROWS):
+        self.enabled = np is not None
+        self.directory = directory
+        self.dim = dim
+        self.max_rows = max_rows
+        self.threshold = threshold
+        self._shards = {}
+        self._lock = threading.Lock()
+        if self.enabled:
+            self.vectorizer = HashingVectorizer(dim)
+        else:
+            logging.warning("numpy is not installed: the semantic translation index is OFF "
+                            "and near-duplicate queries will always reach the model")
+
+    def _shard(self, shell):
+        shard = self._shards.get(shell)
+        if shard is None:
+            shard = self._shards[shell] = _Shard(self.dim, self.directory, shell, self.max_rows)
+        return shard
+
+    def add(self, query, command, shell):
+        """
+        Index a translated query unless the same query is already present
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            shard = self._shard(shell)
+            shard.refresh()
+            if query.casefold() in shard.queries:
+                return
+            shard.append({"query": query, "command": command}, self.vectorizer.transform(query))
+
+    def search(self, query, shell, k=5):
+        """
+        Return up to k (entry, similarity) pairs, most similar first
+        """
+        if not self.enabled:
+            return []
+        vector = self.vectorizer.transform(query)
+        with self._lock:
+            shard = self._shard(shell)
+            shard.refresh()
+            return shard.search(vector, k)
+
+    def lookup(self, query, shell, threshold=None):
+        """
+        Return (entry, similarity) for the best match at or above threshold
+        (default: the configured threshold), or None
+        """
+        if threshold is None:
+            threshold = self.threshold
+        query_literals = literals(query)
+        query_actions = actions(query)
+        for entry, similarity in self.search(query, shell, k=5):
+            if similarity < threshold:
+                break
+            if literals(entry["query"]) == query_literals and actions(entry["query"]) == query_actions:
+                return entry, similarity
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "persistent": bool(self.directory),
+                "threshold": self.threshold,
+                "max_rows": self.max_rows,
+                "rows": {shell: shard.rows for shell, shard in self._shards.items()}
+            }
+
+    def record_log_entry(self, log_entry):
+        """
+        Command log listener: index translated queries as they are logged
+        """
+        query = log_entry["user_query"]
+        command = log_entry["generated_command"]
+        # Execution logs and placeholder results are not translations
+        if not command or command == "API_KEY_REQUIRED" or "EXECUTION: " in query:
+            return
+        # Stand-in answers (an outage fallback, or another query's command)
+        # would be served later as if they were this query's own
+        if log_entry.get("source") in _UNINDEXED_SOURCES:
+            return
+        self.add(query, command, log_entry["command_type"].lower())
@@ -0,0 +1,372 @@
+"""
+Token-aware shell command parser
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+Breaks a POSIX shell command line into stages (simple commands) with their
+argv lists and redirections, following shell quoting rules, so risk checks
+can look at what actually runs instead of pattern matching the raw string.
+Command substitutions ($(...), backticks, <(...)) are parsed recursively and
+their stages are included in the result.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+
+WORD = "WORD"
+OPERATOR = "OP"
+IO_NUMBER = "IO_NUMBER"
+
+Token = namedtuple("Token", ["kind", "value"])
+
+# A single simple command: argv, its redirections and the control operator
+# that follows it ("|", "&&", "||", ";", "&" or None at the end)
+Stage = namedtuple("Stage", ["argv", "redirections", "operator"])
+
+# A redirection such as "2>&1" is Redirection(">&", "2", "1")
+Redirection = namedtuple("Redirection", ["operator", "fd", "target"])
+
+ParsedCommand = namedtuple("ParsedCommand", ["command", "stages"])
+
+# Longest operators first so matching is greedy
+OPERATORS = (
+    "<<<", "&&", "||", ";;", "|&", ">>", ">&", "<&", "&>", ">|", "<<", "<>",
+    "|", "&", ";", "<", ">", "(", ")",
+)
+OPERATOR_CHARS = frozenset("|&;<>()")
+CONTROL_OPERATORS = frozenset(["|", "|&", "&&", "||", ";", ";;", "&"])
+REDIRECT_OPERATORS = frozenset([">", ">>", "<", "<<", "<<<", "<>", ">&", "<&", "&>", ">|"])
+WRITE_REDIRECT_OPERATORS = frozenset([">", ">>", "<>", "&>", ">|"])
+
+# Reserved words that can precede the real command name
+RESERVED_WORDS = frozenset(["!", "{", "}", "if", "then", "else", "elif", "fi",
+                            "while", "until", "do", "done"])
+
+# Commands that run their arguments as another command, with the options
+# that consume a value
+COMMAND_WRAPPERS = {
+    "sudo": frozenset(["-u", "-g", "-h", "-p", "-C", "-D", "-r", "-t", "-U"]),
+    "doas": frozenset(["-u", "-C"]),
+    "env": frozenset(["-u", "-C", "-S"]),
+    "nohup": frozenset(),
+    "nice": frozenset(["-n"]),
+    "ionice": frozenset(["-c", "-n", "-p"]),
+    "time": frozenset(["-f", "-o"]),
+    "timeout": frozenset(["-k", "-s"]),
+    "command": frozenset(),
+    "exec": frozenset(["-a"]),
+    "xargs": frozenset(["-I", "-n", "-P", "-L", "-d", "-s", "-a", "-E"]),
+    "watch": frozenset(["-n", "-d"]),
+    "stdbuf": frozenset(["-i", "-o", "-e"]),
+    "builtin": frozenset(),
+    "busybox": frozenset(),
+}
+
+
+class ShellParseError(ValueError):
+    """
+    Raised when a command cannot be tokenized (e.g. unbalanced quotes)
+    """
+
+
+def _find_closing_paren(command, start):
+    """
+    Return the index of the ")" closing a group whose body starts at start
+    """
+    depth = 1
+    i = start
+    length = len(command)
+    while i < length:
+        char = command[i]
+        if char == "\\":
+            i += 2
+            continue
+        if char == "'":
+            end = command.find("'", i + 1)
+            if end < 0:
+                raise ShellParseError("Unterminated single quote")
+            i = end + 1
+            continue
+        if char == '"':
+            i = _find_closing_double_quote(command, i + 1) + 1
+            continue
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    raise ShellParseError("Unterminated command substitution")
+
+
+def _find_closing_double_quote(command, start):
+    i = start
+    length = len(command)
+    while i < length:
+        char = command[i]
+        if char == "\\":
+            i += 2
+            continue
+        if char == '"':
+            return i
+        if char == "$" and command.startswith("$(", i):
+            i = _find_closing_paren(command, i + 2) + 1
+            continue
+        i += 1
+    raise ShellParseError("Unterminated double quote")
+
+
+def tokenize(command):
+    """
+    Split a command line into tokens, returning (tokens, substitutions)
+    where substitutions are the bodies of $(...), `...` and <(...) found
+    anywhere in the command (including inside double quotes)
+    """
+    tokens = []
+    substitutions = []
+    word = []
+    in_word = False
+    quoted = False
+    i = 0
+    length = len(command)
+
+    def flush():
+        nonlocal word, in_word, quoted
+        if in_word:
+            tokens.append(Token(WORD, "".join(word)))
+        word = []
+        in_word = False
+        quoted = False
+
+    while i < length:
+        char = command[i]
+
+        if char in " \t":
+            flush()
+            i += 1
+        elif char == "\n":
+            flush()
+            tokens.append(Token(OPERATOR, ";"))
+            i += 1
+        elif char == "#" and not in_word:
+            end = command.find("\n", i)
+            i = length if end < 0 else end
+        elif char == "\\":
+            if i + 1 < length and command[i + 1] != "\n":
+                word.append(command[i + 1])
+                in_word = True
+                quoted = True
+            i += 2
+        elif char == "'":
+            end = command.find("'", i + 1)
+            if end < 0:
+                raise ShellParseError("Unterminated single quote")
+            word.append(command[i + 1:end])
+            in_word = True
+            quoted = True
+            i = end + 1
+        elif char == '"':
+            end = _find_closing_double_quote(command, i + 1)
+            body = command[i + 1:end]
+            # Substitutions still run inside double quotes
+            substitutions.extend(_scan_substitutions(body))
+            word.append(body)
+            in_word = True
+            quoted = True
+            i = end + 1
+        elif char == "$" and command.startswith("$(", i):
+            if command.startswith("$((", i):
+                # Arithmetic expansion, not a command
+                end = _find_closing_paren(command, i + 3)
+                end = command.index(")", end + 1)
+            else:
+                end = _find_closing_paren(command, i + 2)
+                substitutions.append(command[i + 2:end])
+            word.append(command[i:end + 1])
+            in_word = True
+            i = end + 1
+        elif char == "`":
+            end = command.find("`", i + 1)
+            if end < 0:
+                raise ShellParseError("Unterminated backquote")
+            substitutions.append(command[i + 1:end])
+            word.append(command[i:end + 1])
+            in_word = True
+            i = end + 1
+        elif char in "<>" and command.startswith("(", i + 1):
+            # Process substitution <(...) / >(...)
+            flush()
+            end = _find_closing_paren(command, i + 2)
+            substitutions.append(command[i + 2:end])
+            tokens.append(Token(WORD, command[i:end + 1]))
+            i = end + 1
+        elif char in OPERATOR_CHARS:
+            operator = next(op for op in OPERATORS if command.startswith(op, i))
+            if operator in REDIRECT_OPERATORS and in_word and not quoted and "".join(word).isdigit():
+                tokens.append(Token(IO_NUMBER, "".join(word)))
+                word = []
+                in_word = False
+            flush()
+            tokens.append(Token(OPERATOR, operator))
+            i += len(operator)
+        else:
+            word.append(char)
+            in_word = True
+            i += 1
+
+    flush()
+    return tokens, substitutions
+
+
+def _scan_substitutions(text):
+    """
+    Find command substitutions inside a double-quoted string
+    """
+    bodies = []
+    i = 0
+    length = len(text)
+    while i < length:
+        char = text[i]
+        if char == "\\":
+            i += 2
+        elif text.startswith("$((", i):
+            end = _find_closing_paren(text, i + 3)
+            i = text.index(")", end + 1) + 1
+        elif text.startswith("$(", i):
+            end = _find_closing_paren(text, i + 2)
+            bodies.append(text[i + 2:end])
+            i = end + 1
+        elif char == "`":
+            end = text.find("`", i + 1)
+            if end < 0:
+                raise ShellParseError("Unterminated backquote")
+            bodies.append(text[i + 1:end])
+            i = end + 1
+        else:
+            i += 1
+    return bodies
+
+
+def _build_stages(tokens):
+    """
+    Group tokens into stages split on control operators
+    """
+    stages = []
+    argv = []
+    redirections = []
+    pending_fd = None
+    i = 0
+    count = len(tokens)
+
+    def close(operator):
+        nonlocal argv, redirections
+        if argv or redirections:
+            stages.append(Stage(tuple(argv), tuple(redirections), operator))
+        elif operator is not None and stages and stages[-1].operator is None:
+            stages[-1] = stages[-1]._replace(operator=operator)
+        argv = []
+        redirections = []
+
+    while i < count:
+        kind, value = tokens[i]
+        if kind == WORD:
+            # Skip reserved words and leading VAR=value assignments
+            if not argv and (value in RESERVED_WORDS or _is_assignment(value)):
+                i += 1
+                continue
+            argv.append(value)
+        elif kind == IO_NUMBER:
+            pending_fd = value
+        elif value in REDIRECT_OPERATORS:
+            target = None
+            if i + 1 < count and tokens[i + 1].kind == WORD:
+                target = tokens[i + 1].value
+                i += 1
+            redirections.append(Redirection(value, pending_fd, target))
+            pending_fd = None
+        elif value in CONTROL_OPERATORS:
+            close(value)
+        else:
+            # Subshell/group parentheses only delimit stages
+            close(None)
+        i += 1
+
+    close(None)
+    return stages
+
+
+def _is_assignment(word):
+    name, sep, _ = word.partition("=")
+    return bool(sep) and name.isidentifier()
+
+
+# Parse results keyed by command hash, shared across requests
+_PARSE_CACHE_SIZE = 4096
+_parse_cache = OrderedDict()
+_parse_cache_lock = threading.Lock()
+
+
+def parse_command(command):
+    """
+    Parse a command line into a ParsedCommand whose stages include those
+    of any command substitutions. Results are cached by command hash.
+    Raises ShellParseError for commands that cannot be tokenized.
+    """
+    # Import here to avoid circular imports
+    from utils import generate_command_hash
+
+    key = generate_command_hash(command)
+    with _parse_cache_lock:
+        parsed = _parse_cache.get(key)
+        if parsed is not None:
+            _parse_cache.move_to_end(key)
+            return parsed
+
+    tokens, substitutions = tokenize(command)
+    stages = _build_stages(tokens)
+    for body in substitutions:
+        stages.extend(parse_command(body).stages)
+    parsed = ParsedCommand(command, tuple(stages))
+
+    with _parse_cache_lock:
+        _parse_cache[key] = parsed
+        while len(_parse_cache) > _PARSE_CACHE_SIZE:
+            _parse_cache.popitem(last=False)
+    return parsed
+
+
+def command_name(word):
+    """
+    Return the bare program name for argv[0] ("/usr/bin/rm" -> "rm")
+    """
+    return word.rsplit("/", 1)[-1]
+
+
+def effective_argv(argv):
+    """
+    Strip wrappers such as sudo, env, nohup or xargs and return the argv
+    of the command that actually runs
+    """
+    argv = list(argv)
+    while argv:
+        name = command_name(argv[0])
+        value_options = COMMAND_WRAPPERS.get(name)
+        if value_options is None:
+            break
+        i = 1
+        while i < len(argv):
+            arg = argv[i]
+            if arg == "--":
+                i += 1
+                break
+            if name == "env" and _is_assignment(arg):
+                i += 1
+            elif name == "timeout" and arg[:1].isdigit():
+                # timeout DURATION COMMAND
+                i += 1
+                break
+            elif arg.startswith("-"):
+                i += 2 if arg in value_options else 1
+            else:
+                break
+        argv = argv[i:]
+    return argv
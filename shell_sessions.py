@@ -0,0 +1,412 @@
+"""
+Persistent shell sessions for /execute
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+Each browser session gets one long-lived bash process, started under
+the same rlimits as one-shot commands. Commands are written to the shell's
+stdin, and the shell prints a per-command sentinel on stdout (followed by
+the exit code and working directory) and on stderr once a command
+finishes, which marks where that command's output ends. `cd`, exported
+variables and shell history therefore carry over between steps, and no
+step pays for starting a new shell.
+
+A session is closed when its shell exits, when a command times out, when
+the shell's resident memory passes SHELL_SESSION_MEMORY_MB, or after
+SHELL_SESSION_IDLE_TIMEOUT seconds without use. When SHELL_SESSION_MAX
+sessions are open, the least recently used idle one is evicted.
+
+Each session counts the commands that may have changed its state beyond
+the working directory (variables, aliases, functions, shell options; see
+may_change_shell_state). The execution cache keys on that count, so a
+read-only command is only shared between shells that would run it alike.
+
+Sessions live in the worker process that started them, and a browser's
+next request may be served by any worker, so they need a single gunicorn
+worker; gunicorn.conf.py enforces that while they are enabled. Set
+SHELL_SESSIONS=0 to run every command one-shot and allow more workers.
+"""
+import codecs
+import logging
+import os
+import re
+import secrets
+import selectors
+import shlex
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+from shell_parser import ShellParseError, command_name, parse_command
+from execution import (
+    EXECUTION_MAX_OUTPUT_BYTES,
+    EXECUTION_QUEUE_TIMEOUT,
+    EXECUTION_TIMEOUT,
+    TRUNCATION_MARKER,
+    ExecutionBusyError,
+    resource_limits_script,
+)
+
+# Persistent shells on/off; they also require Flask sessions (SESSION_SECRET)
+SHELL_SESSIONS_ENABLED = os.environ.get("SHELL_SESSIONS", "1") != "0"
+# Maximum open sessions per worker
+SHELL_SESSION_MAX = int(os.environ.get("SHELL_SESSION_MAX", "32"))
+# Seconds of inactivity after which a session is closed
+SHELL_SESSION_IDLE_TIMEOUT = float(os.environ.get("SHELL_SESSION_IDLE_TIMEOUT", "600"))
+# Resident memory of the shell process above which the session is closed
+SHELL_SESSION_MEMORY_BYTES = int(os.environ.get("SHELL_SESSION_MEMORY_MB", "64")) * 1024 * 1024
+
+_READ_SIZE = 65536
+
+# Builtins that change variables, aliases, functions or options of the shell
+_STATE_BUILTINS = frozenset([
+    "export", "unset", "alias", "unalias", "set", "shopt", "source", ".", "declare",
+    "typeset", "readonly", "local", "eval", "enable", "hash", "exec", "builtin",
+    "command", "function", "read", "readarray", "mapfile", "let", "printf",
+])
+# A bare assignment (PATH=/x, a[1]=y, X+=z) or a function definition
+_STATE_TEXT_RE = re.compile(r"(?:^|[\s;&|({])[A-Za-z_][A-Za-z0-9_]*(?:\[[^\]]*\])?\+?=|\(\s*\)")
+
+
+def may_change_shell_state(command):
+    """
+    True unless command certainly leaves the shell's variables, aliases,
+    functions and options as they were. Directory changes do not count;
+    sessions report their directory separately.
+    """
+    if _STATE_TEXT_RE.search(command):
+        return True
+    try:
+        stages = parse_command(command).stages
+    except ShellParseError:
+        return True
+    return any(command_name(stage.argv[0]) in _STATE_BUILTINS for stage in stages if stage.argv)
+
+
+def _resident_memory(pid):
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
+def _partial_marker_start(buffer, marker):
+    # Index where a suffix of buffer that could begin the marker starts
+    for i in range(max(0, len(buffer) - len(marker) + 1), len(buffer)):
+        if buffer[i] == marker[0] and marker.startswith(buffer[i:]):
+            return i
+    return len(buffer)
+
+
+class ShellSession:
+    """
+    A long-lived bash process that runs commands one at a time
+    """
+
+    def __init__(self, cwd=None):
+        self._token = f"__NLT_{secrets.token_hex(8)}__"
+        self._counter = 0
+        # Commands run that may have changed the shell's state
+        self.state_version = 0
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.current_directory = cwd or os.getcwd()
+        self.process = subprocess.Popen(
+            [shutil.which("bash") or "/bin/bash", "--noprofile", "--norc"],
+            cwd=cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True
+        )
+        # bash outside POSIX mode counts ulimit -f in 1024-byte blocks
+        self.process.stdin.write((resource_limits_script(1024) + "\n").encode("utf-8"))
+        self.process.stdin.flush()
+        for pipe in (self.process.stdout, self.process.stderr):
+            os.set_blocking(pipe.fileno(), False)
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def close(self):
+        """
+        Kill the shell and anything it started
+        """
+        if self.alive:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+            self.process.wait()
+        for pipe in (self.process.stdin, self.process.stdout, self.process.stderr):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+    def over_memory_limit(self):
+        return _resident_memory(self.process.pid) > SHELL_SESSION_MEMORY_BYTES
+
+    def _script(self, command, marker, working_dir):
+        # eval keeps a syntax error in the command from ending the shell, and
+        # stdin is redirected so the command cannot read the next script
+        lines = []
+        if working_dir:
+            lines.append(f"cd -- {shlex.quote(working_dir)} </dev/null")
+        lines.append(f"eval {shlex.quote(command)} </dev/null")
+        lines.append(f"printf '%s %d %s\\n' '{marker}' \"$?\" \"$PWD\"")
+        lines.append(f"printf '%s\\n' '{marker}' >&2")
+        # Not wrapped in a { } group: bash loses track of the group when
+        # eval hits a syntax error inside it
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def run(self, command, working_dir=None, timeout=EXECUTION_TIMEOUT,
+            max_output_bytes=EXECUTION_MAX_OUTPUT_BYTES):
+        """
+        Run command in the session and yield (stream, text) pairs like
+        execution.stream_command. The exit info also carries the session's
+        current_directory and session_closed, which is true when the shell
+        had to be killed or exited.
+        """
+        self._counter += 1
+        if may_change_shell_state(command):
+            # Counted up front: a failed or killed command may have changed it too
+            self.state_version += 1
+        marker = f"{self._token}{self._counter}"
+        marker_bytes = marker.encode("utf-8")
+        started = time.monotonic()
+        deadline = started + timeout
+        self.last_used = started
+
+        try:
+            self.process.stdin.write(self._script(command, marker, working_dir))
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            # The shell is gone; reading below reports how it exited
+            pass
+
+        selector = selectors.DefaultSelector()
+        buffers = {}
+        decoders = {}
+        for name, pipe in (("stdout", self.process.stdout), ("stderr", self.process.stderr)):
+            selector.register(pipe, selectors.EVENT_READ, name)
+            buffers[name] = bytearray()
+            decoders[name] = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+        output_bytes = 0
+        truncated = False
+        timed_out = False
+        exit_code = None
+        finished = False
+        try:
+            while selector.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    timed_out = True
+                    break
+                for key, _ in selector.select(remaining):
+                    name = key.data
+                    try:
+                        data = os.read(key.fd, _READ_SIZE)
+                    except BlockingIOError:
+                        continue
+                    buffer = buffers[name]
+                    if data:
+                        buffer += data
+                        index = buffer.find(marker_bytes)
+                        complete = index >= 0
+                        if complete and name == "stdout":
+                            status_end = buffer.find(b"\n", index)
+                            if status_end < 0:
+                                # Wait for the rest of the status line
+                                complete = False
+                            else:
+                                status = buffer[index + len(marker_bytes):status_end].decode("utf-8", "replace")
+                                code, _, cwd = status.strip().partition(" ")
+                                exit_code = int(code)
+                                self.current_directory = cwd or self.current_directory
+                        if complete:
+                            chunk = bytes(buffer[:index])
+                            buffer.clear()
+                            selector.unregister(key.fileobj)
+                        elif index >= 0:
+                            chunk = bytes(buffer[:index])
+                            del buffer[:index]
+                        else:
+                            # Hold back only a possible partial marker at the end
+                            split = _partial_marker_start(buffer, marker_bytes)
+                            chunk = bytes(buffer[:split])
+                            del buffer[:split]
+                    else:
+                        # The shell exited (e.g. the command ran `exit`)
+                        chunk = bytes(buffer)
+                        buffer.clear()
+                        selector.unregister(key.fileobj)
+                    if chunk and not truncated:
+                        allowed = max_output_bytes - output_bytes
+                        if len(chunk) > allowed:
+                            chunk = chunk[:allowed]
+                            truncated = True
+                        output_bytes += len(chunk)
+                        text = decoders[name].decode(chunk)
+                        if text:
+                            yield name, text
+                        if truncated:
+                            yield name, TRUNCATION_MARKER.format(limit=max_output_bytes)
+            finished = not timed_out
+        finally:
+            selector.close()
+            if not finished:
+                # Timed out, or the caller stopped reading mid-command: the
+                # shell is in an unknown state, so it cannot be reused
+                self.close()
+
+        for name, decoder in decoders.items():
+            tail = decoder.decode(b"", final=True)
+            if tail and not truncated:
+                yield name, tail
+        if exit_code is None:
+            if not timed_out:
+                # The shell itself exited
+                exit_code = self.process.wait()
+            else:
+                exit_code = self.process.returncode
+        self.last_used = time.monotonic()
+        yield "exit", {
+            "exit_code": exit_code,
+            "timed_out": timed_out,
+            "truncated": truncated,
+            "output_bytes": output_bytes,
+            "duration": round(time.monotonic() - started, 3),
+            "current_directory": self.current_directory,
+            "session_closed": not self.alive
+        }
+
+
+class ShellSessionManager:
+    """
+    Open shell sessions keyed by session id, in least recently used order
+    """
+
+    def __init__(self, max_sessions=SHELL_SESSION_MAX, idle_timeout=SHELL_SESSION_IDLE_TIMEOUT,
+                 wait_timeout=EXECUTION_QUEUE_TIMEOUT):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self.created = 0
+        self.evicted = 0
+        self.closed = 0
+
+    def _discard(self, session_id, session):
+        # Caller holds self._lock
+        if self._sessions.get(session_id) is session:
+            del self._sessions[session_id]
+        session.close()
+
+    def _evict_idle(self, now):
+        for session_id, session in list(self._sessions.items()):
+            if session.lock.locked():
+                continue
+            if not session.alive or now - session.last_used > self.idle_timeout:
+                self._discard(session_id, session)
+                self.evicted += 1
+
+    def checkout(self, session_id, cwd=None):
+        """
+        Return the session for session_id, locked for the caller's use,
+        starting one if needed. Raises ExecutionBusyError if another
+        command in the same session does not finish in time, or every
+        session slot is busy.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._evict_idle(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                if len(self._sessions) >= self.max_sessions:
+                    # Evict the least recently used idle session
+                    for old_id, old in self._sessions.items():
+                        if not old.lock.locked():
+                            self._discard(old_id, old)
+                            self.evicted += 1
+                            break
+                    else:
+                        raise ExecutionBusyError("All shell sessions are busy, please retry shortly")
+                session = self._sessions[session_id] = ShellSession(cwd)
+                self.created += 1
+                logging.debug(f"Started shell session (pid {session.process.pid})")
+            self._sessions.move_to_end(session_id)
+
+        if not session.lock.acquire(timeout=self.wait_timeout):
+            raise ExecutionBusyError("Another command is still running in this session")
+        return session
+
+    def checkin(self, session_id, session):
+        """
+        Release a session after use, closing it if it died or grew too large
+        """
+        try:
+            if not session.alive or session.over_memory_limit():
+                with self._lock:
+                    self._discard(session_id, session)
+                    self.closed += 1
+        finally:
+            session.lock.release()
+
+    def current_directory(self, session_id):
+        """
+        Working directory the session's last command left it in, or None
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session.current_directory if session is not None else None
+
+    def state_key(self, session_id):
+        """
+        Identifies the state of the session's shell for the execution
+        cache: empty while it is as a fresh shell would be (apart from its
+        directory), otherwise unique to the session and its changes
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or not session.state_version:
+                return ""
+            return f"{session_id}.{session.state_version}"
+
+    def close(self, session_id):
+        """
+        Close the session for session_id, if any
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return False
+            self._discard(session_id, session)
+            self.closed += 1
+            return True
+
+    def close_all(self):
+        with self._lock:
+            for session_id, session in list(self._sessions.items()):
+                self._discard(session_id, session)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open": len(self._sessions),
+                "busy": sum(1 for session in self._sessions.values() if session.lock.locked()),
+                "max_sessions": self.max_sessions,
+                "idle_timeout": self.idle_timeout,
+                "created": self.created,
+                "evicted": self.evicted,
+                "closed": self.closed
+            }
@@ -0,0 +1,247 @@
+"""
+Single-flight coalescing of identical upstream calls
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+When many users ask the same question at once, only the first request
+(the leader) calls the model. Concurrent requests with the same key wait
+for that call and share its result, or its exception. A failed call is
+remembered for a few seconds (a negative cache) so a burst of retries
+does not hammer an upstream that just failed.
+
+With SINGLEFLIGHT_DIR set, the leaders in different gunicorn workers
+also coordinate: each takes an exclusive flock on a per-key file in that
+directory for the duration of the call. A leader that had to wait for
+another worker rechecks the shared result store (the SQLite translation
+cache) before calling upstream. The lock file records a failed call, so
+the negative cache applies across workers too.
+
+Every waiter gets its own deep copy of the result, and the flight keeps a
+copy separate from the leader's, so a request that adds fields to its
+answer (a details handle, a degraded flag) cannot change anyone else's.
+"""
+import copy
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+SINGLEFLIGHT_DIR = os.environ.get("SINGLEFLIGHT_DIR")
+# Seconds a failed call is remembered and re-raised without calling upstream
+SINGLEFLIGHT_NEGATIVE_TTL = float(os.environ.get("SINGLEFLIGHT_NEGATIVE_TTL", "5"))
+# Seconds a request waits for another worker's call before making its own
+SINGLEFLIGHT_LOCK_TIMEOUT = float(os.environ.get("SINGLEFLIGHT_LOCK_TIMEOUT", "90"))
+
+# Lock files untouched for this long are removed
+_LOCK_FILE_MAX_AGE = 600
+
+
+class CoalescedCallError(Exception):
+    """
+    Raised for a call that failed recently in another worker
+    """
+
+
+class CancelledFlightError(Exception):
+    """
+    Raised to waiters when the leader stopped without a result
+    """
+
+
+class _Flight:
+    """
+    One in-progress call that other requests can wait on
+    """
+
+    def __init__(self, group, key):
+        self._group = group
+        self.key = key
+        self._event = threading.Event()
+        self._value = None
+        self._error = None
+
+    def wait(self, timeout=None):
+        if not self._event.wait(timeout):
+            raise CancelledFlightError("Timed out waiting for an identical request")
+        if self._error is not None:
+            raise self._error
+        return copy.deepcopy(self._value)
+
+    def resolve(self, value):
+        # The leader goes on using value; waiters copy from this snapshot
+        self._value = copy.deepcopy(value)
+        self._group._finish(self)
+
+    def reject(self, error):
+        self._error = error
+        self._group._finish(self, error)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key
+    """
+
+    def __init__(self, negative_ttl=SINGLEFLIGHT_NEGATIVE_TTL, lock_dir=SINGLEFLIGHT_DIR,
+                 lock_timeout=SINGLEFLIGHT_LOCK_TIMEOUT, transient_errors=()):
+        self.negative_ttl = negative_ttl
+        # Errors that are shared with waiters but not remembered afterwards
+        self.transient_errors = tuple(transient_errors)
+        self.lock_dir = lock_dir
+        self.lock_timeout = lock_timeout
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._failures = {}
+        self._last_cleanup = time.monotonic()
+        self.leaders = 0
+        self.shared = 0
+        self.negative_hits = 0
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    def begin(self, key):
+        """
+        Join the flight for key. Returns (flight, leader): the leader must
+        call flight.resolve() or flight.reject(); everyone else calls
+        flight.wait(). Raises the remembered error if key failed recently.
+        """
+        with self._lock:
+            failure = self._failures.get(key)
+            if failure is not None:
+                error, expires = failure
+                if time.monotonic() < expires:
+                    self.negative_hits += 1
+                    raise error
+                del self._failures[key]
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.shared += 1
+                return flight, False
+            flight = self._flights[key] = _Flight(self, key)
+            self.leaders += 1
+            return flight, True
+
+    def _finish(self, flight, error=None):
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            if (error is not None and self.negative_ttl > 0
+                    and not isinstance(error, self.transient_errors + (CancelledFlightError,))):
+                self._failures[flight.key] = (error, time.monotonic() + self.negative_ttl)
+        flight._event.set()
+
+    def do(self, key, function, recheck=None):
+        """
+        Return (value, shared). value comes from function() unless an
+        identical call is already running, here or (with a lock directory)
+        in another worker. In that case it is that call's result, or the
+        value recheck() finds once the other worker is done, and shared
+        is True.
+        """
+        flight, leader = self.begin(key)
+        if not leader:
+            return flight.wait(self.lock_timeout), True
+        try:
+            with self.interprocess(key) as waited:
+                value = recheck() if waited and recheck else None
+                shared = value is not None
+                if not shared:
+                    value = function()
+        except Exception as e:
+            flight.reject(e)
+            raise
+        except BaseException:
+            flight.reject(CancelledFlightError("The identical request was cancelled"))
+            raise
+        flight.resolve(value)
+        return value, shared
+
+    def _lock_path(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.lock_dir, f"{digest}.lock")
+
+    @contextmanager
+    def interprocess(self, key):
+        """
+        Hold the cross-worker lock for key, yielding True if another worker
+        held it first. Without a lock directory this does nothing.
+        """
+        if not self.lock_dir:
+            yield False
+            return
+        self._cleanup()
+        with open(self._lock_path(key), "a+", encoding="utf-8") as lock_file:
+            waited = False
+            deadline = time.monotonic() + self.lock_timeout
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    waited = True
+                    if time.monotonic() >= deadline:
+                        # Give up on coordination rather than fail the request
+                        logging.warning("Single-flight lock wait timed out; calling upstream")
+                        lock_file = None
+                        break
+                    time.sleep(0.02)
+            try:
+                if lock_file is not None:
+                    self._raise_recorded_failure(lock_file)
+                try:
+                    yield waited
+                except Exception as e:
+                    if lock_file is not None and not isinstance(e, self.transient_errors):
+                        self._record_failure(lock_file, e)
+                    raise
+                if lock_file is not None:
+                    lock_file.truncate(0)
+            finally:
+                if lock_file is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _record_failure(self, lock_file, error):
+        lock_file.seek(0)
+        lock_file.truncate(0)
+        lock_file.write(json.dumps({"error": str(error), "at": time.time()}))
+        lock_file.flush()
+
+    def _raise_recorded_failure(self, lock_file):
+        lock_file.seek(0)
+        content = lock_file.read()
+        if not content:
+            return
+        try:
+            failure = json.loads(content)
+        except ValueError:
+            return
+        if time.time() - failure.get("at", 0) < self.negative_ttl:
+            raise CoalescedCallError(failure.get("error") or "Upstream call failed")
+
+    def _cleanup(self):
+        now = time.monotonic()
+        if now - self._last_cleanup < _LOCK_FILE_MAX_AGE:
+            return
+        self._last_cleanup = now
+        cutoff = time.time() - _LOCK_FILE_MAX_AGE
+        try:
+            for entry in os.scandir(self.lock_dir):
+                if entry.name.endswith(".lock") and entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "leaders": self.leaders,
+                "shared": self.shared,
+                "negative_hits": self.negative_hits,
+                "remembered_failures": len(self._failures),
+                "negative_ttl": self.negative_ttl,
+                "interprocess": bool(self.lock_dir)
+            }
@@ -49,22 +49,8 @@ document.addEventListener('DOMContentLoaded', function() {
         errorMessage.classList.add('d-none');
         submitButton.disabled = true;
         
-        // Send request to backend
-        fetch('/translate', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ query: query }),
-        })
-        .then(response => {
-            if (!response.ok) {
-                return response.json().then(data => {
-                    throw new Error(data.error || 'Failed to translate command');
-                });
-            }
-            return response.json();
-        })
+        // Stream the translation so the command shows up as soon as it is generated
+        streamTranslation(query)
         .then(data => {
             // Hide loading spinner
             loadingSpinner.classList.add('d-none');
@@ -72,6 +58,11 @@ document.addEventListener('DOMContentLoaded', function() {
             
             // Display results
             displayResults(data, query);
+            
+            // Breakdown and simulation are generated on demand
+            if (data.details_id) {
+                loadDetails(data.details_id);
+            }
         })
         .catch(error => {
             // Hide loading spinner
@@ -83,6 +74,116 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
     
+    // Request a translation from the streaming endpoint, rendering fields as
+    // they arrive. Resolves with the complete result from the "done" event.
+    // Only the command fields are generated; the result carries a details_id
+    // for the breakdown and simulation.
+    async function streamTranslation(query) {
+        const response = await fetch('/translate/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ query: query, fields: ['command'] }),
+        });
+        
+        if (!response.ok) {
+            const data = await response.json();
+            throw new Error(data.error || 'Failed to translate command');
+        }
+        
+        let result = null;
+        await readEventStream(response, (eventName, payload) => {
+            if (eventName === 'done') {
+                result = payload;
+                return false;
+            }
+            if (eventName === 'error') throw new Error(payload.error || 'Failed to translate command');
+            showPartialResult(eventName, payload);
+        });
+        if (result) return result;
+        
+        throw new Error('Translation stream ended unexpectedly');
+    }
+    
+    // Fetch the breakdown and simulation for the displayed translation
+    let currentDetailsId = null;
+    function loadDetails(detailsId) {
+        currentDetailsId = detailsId;
+        fetch(`/translate/${detailsId}/details`)
+        .then(response => response.json().then(data => {
+            if (!response.ok) throw new Error(data.error || 'Failed to load details');
+            return data;
+        }))
+        .then(data => {
+            // Ignore details that arrive after a newer translation
+            if (detailsId !== currentDetailsId) return;
+            renderBreakdown(data.breakdown);
+            renderSimulation(data.simulation);
+        })
+        .catch(error => {
+            if (detailsId !== currentDetailsId) return;
+            console.error('Failed to load details: ', error);
+            renderBreakdown(null);
+            renderSimulation(null);
+            breakdownResult.textContent = `Could not load the breakdown: ${error.message}`;
+            breakdownResult.style.color = 'var(--bs-danger)';
+        });
+    }
+    
+    // Read server-sent events from a fetch response, calling onEvent(name, payload)
+    // for each one. Stops early when onEvent returns false.
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) return;
+            buffer += decoder.decode(value, { stream: true });
+            
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                let eventName = 'message';
+                let eventData = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) eventName = line.slice(7);
+                    else if (line.startsWith('data: ')) eventData += line.slice(6);
+                });
+                const payload = eventData ? JSON.parse(eventData) : {};
+                
+                if (onEvent(eventName, payload) === false) {
+                    reader.cancel();
+                    return;
+                }
+            }
+        }
+    }
+    
+    // Render a single streamed field before the full result is available
+    function showPartialResult(field, payload) {
+        if (field === 'command') {
+            loadingSpinner.classList.add('d-none');
+            resultsCard.classList.remove('d-none');
+            commandResult.textContent = payload.command === 'API_KEY_REQUIRED' ? 'API Key Required' : payload.command.trim();
+            explanationResult.textContent = '';
+            breakdownResult.innerHTML = '';
+            if (simulationResult) {
+                simulationResult.textContent = '';
+            }
+        } else if (field === 'explanation') {
+            explanationResult.textContent = payload.explanation;
+        } else if (field === 'simulation' && simulationResult && payload.simulation) {
+            simulationResult.textContent = payload.simulation;
+            simulationResult.parentElement.parentElement.classList.remove('d-none');
+        }
+    }
+    
     // Copy button handler
     copyButton.addEventListener('click', function() {
         const commandText = commandResult.textContent;
@@ -210,8 +311,12 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Function to execute the command with a specific working directory
         function executeWithWorkingDir(commandText, workingDir) {
-            // Send request to execute command
-            fetch('/execute', {
+            let headerInfo = '';
+            let output = '';
+            let hasStderr = false;
+            
+            // Send request to execute command; output is streamed back as it is produced
+            fetch('/execute/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -227,49 +332,59 @@ document.addEventListener('DOMContentLoaded', function() {
                         throw new Error(data.error || 'Failed to execute command');
                     });
                 }
-                return response.json();
+                
+                let exitData = null;
+                return readEventStream(response, (eventName, payload) => {
+                    if (eventName === 'start') {
+                        // Create header with system and directory information
+                        if (payload.system_info) {
+                            headerInfo += `System: ${payload.system_info}\n`;
+                        }
+                        if (payload.current_directory) {
+                            headerInfo += `Working Directory: ${payload.current_directory}\n`;
+                        }
+                        if (headerInfo) {
+                            headerInfo += '\n' + '-'.repeat(50) + '\n\n';
+                        }
+                        executionOutput.textContent = headerInfo;
+                        executionOutput.classList.remove('text-muted');
+                    } else if (eventName === 'stdout' || eventName === 'stderr') {
+                        // Append output as it arrives
+                        hasStderr = hasStderr || (eventName === 'stderr' && payload.text.trim() !== '');
+                        output += payload.text;
+                        executionOutput.textContent = headerInfo + output;
+                    } else if (eventName === 'exit') {
+                        exitData = payload;
+                        return false;
+                    } else if (eventName === 'error') {
+                        throw new Error(payload.error || 'Failed to execute command');
+                    }
+                }).then(() => {
+                    if (!exitData) {
+                        throw new Error('Execution stream ended unexpectedly');
+                    }
+                    return exitData;
+                });
             })
             .then(data => {
                 // Reset button state
                 executeButton.disabled = false;
                 executeButton.innerHTML = originalHtml;
                 
-                // Combine stdout and stderr, prioritizing stderr
-                let output = '';
-                
-                if (data.stderr && data.stderr.trim()) {
-                    output = data.stderr;
+                if (data.timed_out) {
+                    executionStatus.textContent = 'Timed out';
+                    executionStatus.className = 'badge bg-danger';
+                } else if (hasStderr) {
                     executionStatus.textContent = 'Completed with errors';
                     executionStatus.className = 'badge bg-warning text-dark';
-                } else if (data.stdout) {
-                    output = data.stdout;
+                } else if (output.trim()) {
                     executionStatus.textContent = 'Completed successfully';
                     executionStatus.className = 'badge bg-success';
-                } else if (data.error) {
-                    output = data.error;
-                    executionStatus.textContent = 'Error';
-                    executionStatus.className = 'badge bg-danger';
                 } else {
-                    output = 'Command executed with no output';
                     executionStatus.textContent = 'Completed';
                     executionStatus.className = 'badge bg-secondary';
                 }
                 
-                // Create header with system and directory information
-                let headerInfo = '';
-                if (data.system_info) {
-                    headerInfo += `System: ${data.system_info}\n`;
-                }
-                if (data.current_directory) {
-                    headerInfo += `Working Directory: ${data.current_directory}\n`;
-                }
-                if (headerInfo) {
-                    headerInfo += '\n' + '-'.repeat(50) + '\n\n';
-                }
-                
-                // Display execution results with improved formatting
-                executionOutput.textContent = headerInfo + output;
-                
                 // Enhance the display of execution results
                 if (output.trim() === '') {
                     executionOutput.textContent = headerInfo + '(No output from command)';
@@ -289,7 +404,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 if (data.exit_code === 0) {
                     executionExitCode.classList.add('text-success');
                     executionExitCode.classList.remove('text-danger');
-                } else if (data.exit_code > 0) {
+                } else if (data.exit_code !== 0) {
                     executionExitCode.classList.add('text-danger');
                     executionExitCode.classList.remove('text-success');
                 }
@@ -299,10 +414,14 @@ document.addEventListener('DOMContentLoaded', function() {
                 if (toast) {
                     // Update toast content based on execution result
                     const toastBody = toast.querySelector('.toast-body');
-                    if (data.exit_code === 0) {
+                    if (data.execution_successful) {
                         toastBody.innerHTML = '<i class="fas fa-check-circle me-2"></i>Command executed successfully';
                         toast.classList.remove('text-bg-danger');
                         toast.classList.add('text-bg-dark');
+                    } else if (data.timed_out) {
+                        toastBody.innerHTML = '<i class="fas fa-exclamation-circle me-2"></i>Command timed out';
+                        toast.classList.remove('text-bg-dark');
+                        toast.classList.add('text-bg-danger');
                     } else {
                         toastBody.innerHTML = '<i class="fas fa-exclamation-circle me-2"></i>Command executed with exit code ' + data.exit_code;
                         toast.classList.remove('text-bg-dark');
@@ -318,8 +437,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 executeButton.disabled = false;
                 executeButton.innerHTML = originalHtml;
                 
-                // Show error in execution result
-                executionOutput.textContent = 'Error: ' + error.message;
+                // Show error in execution result, keeping any output already received
+                executionOutput.textContent = headerInfo + output + (output ? '\n' : '') + 'Error: ' + error.message;
                 executionStatus.textContent = 'Failed';
                 executionStatus.className = 'badge bg-danger';
                 executionExitCode.textContent = 'N/A';
@@ -359,33 +478,14 @@ document.addEventListener('DOMContentLoaded', function() {
             explanationResult.style.color = 'var(--bs-secondary)';
         }
         
-        // Handle command breakdown with improved styling
-        breakdownResult.innerHTML = '';
-        if (data.breakdown && typeof data.breakdown === 'object') {
-            const dl = document.createElement('dl');
-            dl.className = 'mb-0'; // Remove bottom margin
-            
-            for (const [component, explanation] of Object.entries(data.breakdown)) {
-                const dt = document.createElement('dt');
-                dt.textContent = component;
-                dt.className = 'text-primary fw-bold mb-1'; // Blue color with bold text
-                
-                const dd = document.createElement('dd');
-                dd.textContent = explanation;
-                dd.className = 'ms-3 mb-3 pb-2'; // Add left margin and spacing
-                if (Object.entries(data.breakdown).length > 1) {
-                    dd.className += ' border-bottom border-secondary border-opacity-25'; // Add separator if multiple items
-                }
-                
-                dl.appendChild(dt);
-                dl.appendChild(dd);
-            }
-            
-            breakdownResult.appendChild(dl);
-        } else {
-            breakdownResult.textContent = 'No breakdown available';
+        // Details of a quick translation are loaded separately
+        currentDetailsId = null;
+        if (data.details_id && data.breakdown === undefined) {
+            breakdownResult.textContent = 'Loading breakdown...';
             breakdownResult.style.fontStyle = 'italic';
             breakdownResult.style.color = 'var(--bs-secondary)';
+        } else {
+            renderBreakdown(data.breakdown);
         }
         
         // Display safety warning if present
@@ -430,14 +530,10 @@ document.addEventListener('DOMContentLoaded', function() {
         }
         
         // Display simulation results if present
-        if (simulationResult) {
-            if (data.simulation) {
-                simulationResult.textContent = data.simulation;
-                simulationResult.parentElement.parentElement.classList.remove('d-none');
-            } else {
-                simulationResult.textContent = 'No simulation available';
-                simulationResult.parentElement.parentElement.classList.add('d-none');
-            }
+        if (!data.details_id || data.simulation !== undefined) {
+            renderSimulation(data.simulation);
+        } else if (simulationResult) {
+            simulationResult.parentElement.parentElement.classList.add('d-none');
         }
         
         // Set watermark information
@@ -455,6 +551,51 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    // Render the command breakdown with improved styling
+    function renderBreakdown(breakdown) {
+        breakdownResult.innerHTML = '';
+        breakdownResult.style.fontStyle = '';
+        breakdownResult.style.color = '';
+        if (breakdown && typeof breakdown === 'object') {
+            const dl = document.createElement('dl');
+            dl.className = 'mb-0'; // Remove bottom margin
+            
+            for (const [component, explanation] of Object.entries(breakdown)) {
+                const dt = document.createElement('dt');
+                dt.textContent = component;
+                dt.className = 'text-primary fw-bold mb-1'; // Blue color with bold text
+                
+                const dd = document.createElement('dd');
+                dd.textContent = explanation;
+                dd.className = 'ms-3 mb-3 pb-2'; // Add left margin and spacing
+                if (Object.entries(breakdown).length > 1) {
+                    dd.className += ' border-bottom border-secondary border-opacity-25'; // Add separator if multiple items
+                }
+                
+                dl.appendChild(dt);
+                dl.appendChild(dd);
+            }
+            
+            breakdownResult.appendChild(dl);
+        } else {
+            breakdownResult.textContent = 'No breakdown available';
+            breakdownResult.style.fontStyle = 'italic';
+            breakdownResult.style.color = 'var(--bs-secondary)';
+        }
+    }
+    
+    // Render simulated output, hiding the section when there is none
+    function renderSimulation(simulation) {
+        if (!simulationResult) return;
+        if (simulation) {
+            simulationResult.textContent = simulation;
+            simulationResult.parentElement.parentElement.classList.remove('d-none');
+        } else {
+            simulationResult.textContent = 'No simulation available';
+            simulationResult.parentElement.parentElement.classList.add('d-none');
+        }
+    }
+    
     // Function to show error message
     function showError(message) {
         errorText.textContent = message;
@@ -0,0 +1,90 @@
+"""
+Streaming helpers for server-sent translation events
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+The model streams its JSON answer a few characters at a time. The parser
+below scans the text incrementally and reports each top-level field of
+the object as soon as its value is complete, so the command can be shown
+(and risk-checked) long before the simulation has finished generating.
+"""
+import json
+
+_WHITESPACE = " \t\r\n"
+
+
+class IncrementalJSONObjectParser:
+    """
+    Incrementally parse a streamed JSON object into top-level (key, value) pairs
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._field_start = None
+        self.done = False
+
+    def feed(self, text):
+        """
+        Add streamed text and return the list of (key, value) pairs whose
+        values were completed by it
+        """
+        self._buffer += text
+        fields = []
+        buffer = self._buffer
+        i = self._position
+        length = len(buffer)
+
+        while i < length and not self.done:
+            char = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._field_start is None:
+                    self._field_start = i
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit(buffer, i, fields)
+                    self.done = True
+            elif char == "," and self._depth == 1:
+                self._emit(buffer, i, fields)
+            i += 1
+
+        self._position = i
+        # Drop text belonging to fields that were already emitted
+        if self._field_start is None and not self._in_string:
+            self._buffer = buffer[i:]
+            self._position = 0
+        elif self._field_start:
+            self._buffer = buffer[self._field_start:]
+            self._position -= self._field_start
+            self._field_start = 0
+        return fields
+
+    def _emit(self, buffer, end, fields):
+        if self._field_start is None:
+            return
+        member = buffer[self._field_start:end].strip(_WHITESPACE)
+        self._field_start = None
+        if not member:
+            return
+        key, value = json.loads("{" + member + "}").popitem()
+        fields.append((key, value))
+
+
+def format_sse(event, data):
+    """
+    Format a server-sent event whose data is JSON encoded
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
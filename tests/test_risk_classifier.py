@@ -0,0 +1,84 @@
+"""
+Regression tests for the Linux and PowerShell command risk classifiers
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+Commands that run their payload as a string (eval, sh -c, interpreters,
+ssh, su, process substitution, Invoke-Expression, powershell -Command) or
+hide the command behind an assignment, call operator or module qualifier
+must be rated as high as the command they run.
+"""
+import base64
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import validate_linux_command, validate_powershell_command  # noqa: E402
+
+
+@pytest.mark.parametrize("command", [
+    'eval "rm -rf /"',
+    "eval reboot",
+    "builtin eval rm -rf /",
+    "bash -ec 'rm -rf /'",
+    "sh -xc 'rm -rf /'",
+    "bash -lc 'reboot'",
+    "busybox rm -rf /",
+    "su -c 'rm -rf /'",
+    "source <(echo 'rm -rf /')",
+    "python3 -c 'import os; os.system(\"rm -rf /\")'",
+    "perl -e 'system(\"rm -rf /\")'",
+    "ssh host rm -rf /",
+])
+def test_payloads_run_as_strings_are_blocked(command):
+    is_safe, _, risk_level = validate_linux_command(command)
+    assert risk_level == 3
+    assert not is_safe
+
+
+@pytest.mark.parametrize("command", [
+    "ls -la",
+    "bash -c ls",
+    "eval ls",
+    "echo 'reboot later'",
+    "grep shutdown /var/log/syslog",
+])
+def test_harmless_commands_stay_safe(command):
+    assert validate_linux_command(command)[2] == 0
+
+
+def test_inline_interpreter_code_is_not_executable():
+    assert validate_linux_command('python3 -c "print(1)"')[2] == 2
+
+
+@pytest.mark.parametrize("command", [
+    "$x = Stop-Computer",
+    "$null = Remove-Item C:\\ -Recurse -Force",
+    'iex "Stop-Computer"',
+    'Invoke-Expression "Remove-Item C:\\Windows -Recurse -Force"',
+    'powershell -Command "Stop-Computer"',
+    'powershell -ExecutionPolicy Bypass -Command "Stop-Computer"',
+    'pwsh -c "Restart-Computer"',
+    "powershell -EncodedCommand " + base64.b64encode("Stop-Computer".encode("utf-16-le")).decode(),
+    '& "Stop-Computer"',
+    "Microsoft.PowerShell.Management\\Stop-Computer",
+    "Remove-Item C:\\Windows -Recurse",
+    "Remove-Item -Path:C:\\ -Recurse",
+    'Remove-Item "C:\\Program Files" -Recurse',
+])
+def test_hidden_powershell_commands_are_blocked(command):
+    is_safe, _, risk_level = validate_powershell_command(command)
+    assert risk_level == 3
+    assert not is_safe
+
+
+@pytest.mark.parametrize("command", [
+    "Get-Process | Where-Object {$_.CPU -gt 10}",
+    "$files = Get-ChildItem C:\\Windows",
+    '"Stop-Computer"',
+    "Remove-Item .\\build -Recurse",
+])
+def test_harmless_powershell_commands_stay_safe(command):
+    assert validate_powershell_command(command)[2] == 0
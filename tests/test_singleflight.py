@@ -0,0 +1,57 @@
+"""
+Regression tests for sharing results between coalesced requests
+Copyright (c) 2024 Ervin Remus Radosavlevici
+"""
+import threading
+import time
+
+from singleflight import SingleFlight
+
+
+def test_waiters_get_their_own_copy_of_the_result():
+    flights = SingleFlight(negative_ttl=0, lock_dir=None)
+    flight, leader = flights.begin("key")
+    assert leader
+    joined, leader = flights.begin("key")
+    assert not leader
+
+    result = {"command": "ls", "breakdown": {"ls": "list"}}
+    flight.resolve(result)
+    # The leader keeps mutating its result after sharing it
+    result["details_id"] = "abc"
+    result["breakdown"]["-l"] = "long"
+
+    first = joined.wait(1)
+    second = joined.wait(1)
+    assert first == {"command": "ls", "breakdown": {"ls": "list"}}
+    first["degraded"] = True
+    first["breakdown"].clear()
+    assert second == {"command": "ls", "breakdown": {"ls": "list"}}
+
+
+def test_do_returns_independent_results_to_concurrent_callers():
+    flights = SingleFlight(negative_ttl=0, lock_dir=None)
+    started = threading.Event()
+    release = threading.Event()
+    results = []
+
+    def call():
+        started.set()
+        release.wait(1)
+        return {"command": "ls"}
+
+    leader = threading.Thread(target=lambda: results.append(flights.do("key", call)))
+    leader.start()
+    started.wait(1)
+    follower = threading.Thread(target=lambda: results.append(flights.do("key", call)))
+    follower.start()
+    deadline = time.monotonic() + 1
+    while not flights.stats()["shared"] and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    leader.join(1)
+    follower.join(1)
+
+    (first, _), (second, _) = results
+    assert first == second == {"command": "ls"}
+    assert first is not second
@@ -0,0 +1,413 @@
+"""
+Shared OpenAI upstream client and concurrency limiter
+Copyright (c) 2024 Ervin Remus Radosavlevici
+
+Workers run threaded (see gunicorn.conf.py), so many translations wait on
+OpenAI concurrently inside one process. They share a single pooled HTTP
+connection pool, and a bounded semaphore caps how many upstream calls
+may be in flight at once so a burst of requests cannot open an unbounded
+number of connections to the API.
+
+Calls go through UpstreamCaller, which gives each call an overall
+deadline, retries timeouts, connection errors, rate limits and 5xx
+answers with jittered exponential backoff, and feeds a circuit breaker.
+After UPSTREAM_BREAKER_THRESHOLD consecutive failed attempts the breaker
+opens and calls fail fast with UpstreamUnavailableError for
+UPSTREAM_BREAKER_RESET seconds; then a single probe call is let through
+and its outcome closes or re-opens the breaker.
+
+The openai package takes most of a second to import, so it (and httpx) are
+only imported when the first client is built. LazyOpenAIClient defers that
+to the first translation, or to a background thread started by prewarm(),
+keeping it off the cold-start path.
+"""
+import logging
+import math
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from itertools import islice
+
+# Maximum number of concurrent OpenAI calls per worker process
+UPSTREAM_MAX_CONCURRENCY = int(os.environ.get("UPSTREAM_MAX_CONCURRENCY", "64"))
+# Seconds a request may wait for a free upstream slot before failing
+UPSTREAM_QUEUE_TIMEOUT = float(os.environ.get("UPSTREAM_QUEUE_TIMEOUT", "10"))
+# Seconds to wait for an upstream response
+UPSTREAM_TIMEOUT = float(os.environ.get("UPSTREAM_TIMEOUT", "60"))
+# Seconds one call may take in total, including retries and backoff
+UPSTREAM_DEADLINE = float(os.environ.get("UPSTREAM_DEADLINE", "30"))
+# Retries after the first attempt of a call
+UPSTREAM_MAX_RETRIES = int(os.environ.get("UPSTREAM_MAX_RETRIES", "2"))
+# Backoff before retry n is uniform in [0, min(BASE * 2**n, MAX)] seconds
+UPSTREAM_BACKOFF_BASE = float(os.environ.get("UPSTREAM_BACKOFF_BASE", "0.25"))
+UPSTREAM_BACKOFF_MAX = float(os.environ.get("UPSTREAM_BACKOFF_MAX", "4"))
+# Consecutive failed attempts that open the circuit breaker
+UPSTREAM_BREAKER_THRESHOLD = int(os.environ.get("UPSTREAM_BREAKER_THRESHOLD", "5"))
+# Seconds the breaker stays open before a probe call is allowed
+UPSTREAM_BREAKER_RESET = float(os.environ.get("UPSTREAM_BREAKER_RESET", "30"))
+
+# HTTP statuses worth retrying besides 5xx
+_RETRYABLE_STATUSES = {408, 409, 429}
+
+
+class UpstreamBusyError(Exception):
+    """
+    Raised when no upstream slot frees up within the queue timeout
+    """
+
+
+class UpstreamUnavailableError(Exception):
+    """
+    Raised when the upstream is failing: the circuit breaker is open, or a
+    call ran out of retries or time. retry_after is a hint in seconds.
+    """
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_retryable(error):
+    """
+    True for errors a later attempt may not hit: timeouts, connection
+    failures, rate limits and server errors
+    """
+    # openai is already imported whenever a client has made a call
+    from openai import APIConnectionError, APIStatusError
+
+    if isinstance(error, APIConnectionError):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in _RETRYABLE_STATUSES or error.status_code >= 500
+    return False
+
+
+def _retry_after_header(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class UpstreamLimiter:
+    """
+    Caps the number of concurrent upstream calls and counts waits/rejections
+    """
+
+    def __init__(self, max_concurrency, queue_timeout):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    @contextmanager
+    def slot(self):
+        """
+        Hold one upstream slot for the duration of the with-block
+        """
+        if not self._semaphore.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise UpstreamBusyError("Too many translations in progress, please retry shortly")
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "max_concurrency": self.max_concurrency,
+                "rejected": self.rejected
+            }
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker counting consecutive failed attempts
+    """
+    STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started = None
+        self.opened = 0
+        self.short_circuited = 0
+
+    def _current_state(self, now):
+        if self._state == "open" and now - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return self._state
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def before_call(self):
+        """
+        Raise UpstreamUnavailableError unless a call may go ahead now. In the
+        half-open state only one probe call at a time is let through.
+        """
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == "closed":
+                return
+            # A probe that never reported back (its worker died) is replaced
+            if state == "half_open" and (self._probe_started is None
+                                         or now - self._probe_started >= self.reset_timeout):
+                self._state = "half_open"
+                self._probe_started = now
+                return
+            self.short_circuited += 1
+            retry_after = 1
+            if state == "open":
+                retry_after = max(1, math.ceil(self.reset_timeout - (now - self._opened_at)))
+        raise UpstreamUnavailableError(
+            "The translation service is temporarily unavailable, please retry shortly", retry_after
+        )
+
+    def record_success(self):
+        with self._lock:
+            self._state = "closed"
+            self._failures = 0
+            self._probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == "half_open" or (
+                    self._state == "closed" and self._failures >= self.failure_threshold):
+                if self._state == "closed":
+                    logging.warning(f"Upstream circuit breaker opened after {self._failures} failures")
+                self._state = "open"
+                self._opened_at = time.monotonic()
+                self._probe_started = None
+                self.opened += 1
+
+    def retry_after(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._current_state(now) != "open":
+                return 1
+            return max(1, math.ceil(self.reset_timeout - (now - self._opened_at)))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._current_state(time.monotonic()),
+                "consecutive_failures": self._failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout": self.reset_timeout,
+                "opened": self.opened,
+                "short_circuited": self.short_circuited
+            }
+
+
+class UpstreamCaller:
+    """
+    Runs upstream calls under the limiter with a deadline, retries and a
+    circuit breaker. The function passed to call() or stream() receives
+    the timeout for its attempt in seconds.
+    """
+
+    def __init__(self, limiter, breaker, deadline=UPSTREAM_DEADLINE, max_retries=UPSTREAM_MAX_RETRIES,
+                 backoff_base=UPSTREAM_BACKOFF_BASE, backoff_max=UPSTREAM_BACKOFF_MAX,
+                 attempt_timeout=UPSTREAM_TIMEOUT):
+        self.limiter = limiter
+        self.breaker = breaker
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.attempt_timeout = attempt_timeout
+        self._lock = threading.Lock()
+        self.attempts = 0
+        self.failures = 0
+        self.retries = 0
+        self.gave_up = 0
+
+    def _admit(self, deadline):
+        # Returns the timeout for the next attempt
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise UpstreamUnavailableError("The translation service did not answer in time", 1)
+        self.breaker.before_call()
+        with self._lock:
+            self.attempts += 1
+        return min(self.attempt_timeout, remaining)
+
+    def _failed(self, error, attempt, deadline):
+        """
+        Account for a failed attempt and return the delay before retrying,
+        or raise if the call should not be retried
+        """
+        if not is_retryable(error):
+            # The API answered; the request itself was rejected
+            self.breaker.record_success()
+            raise error
+        self.breaker.record_failure()
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        delay = max(delay, _retry_after_header(error) or 0)
+        with self._lock:
+            self.failures += 1
+            if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                self.gave_up += 1
+                give_up = True
+            else:
+                self.retries += 1
+                give_up = False
+        logging.warning(f"Upstream attempt {attempt + 1} failed: {error}")
+        if give_up:
+            raise UpstreamUnavailableError(
+                f"The translation service is unavailable: {error}", self.breaker.retry_after()
+            ) from error
+        return delay
+
+    def call(self, function):
+        """
+        Return function(timeout), retrying retryable errors
+        """
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            with self.limiter.slot():
+                timeout = self._admit(deadline)
+                try:
+                    result = function(timeout)
+                except Exception as e:
+                    delay = self._failed(e, attempt, deadline)
+                else:
+                    self.breaker.record_success()
+                    return result
+            # Back off without holding an upstream slot
+            time.sleep(delay)
+            attempt += 1
+
+    def stream(self, function):
+        """
+        Yield the items of the iterable function(timeout) returns. Attempts
+        are retried until the first item arrives; after that a failure is
+        raised as UpstreamUnavailableError. The upstream slot is held until
+        the stream is consumed.
+        """
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            with self.limiter.slot():
+                timeout = self._admit(deadline)
+                try:
+                    iterator = iter(function(timeout))
+                    head = list(islice(iterator, 1))
+                except Exception as e:
+                    delay = self._failed(e, attempt, deadline)
+                else:
+                    self.breaker.record_success()
+                    yield from head
+                    try:
+                        yield from iterator
+                    except Exception as e:
+                        if not is_retryable(e):
+                            raise
+                        self.breaker.record_failure()
+                        with self._lock:
+                            self.failures += 1
+                        raise UpstreamUnavailableError(
+                            f"The translation service stopped answering: {e}", self.breaker.retry_after()
+                        ) from e
+                    return
+            time.sleep(delay)
+            attempt += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "deadline": self.deadline,
+                "max_retries": self.max_retries,
+                "attempts": self.attempts,
+                "failures": self.failures,
+                "retries": self.retries,
+                "gave_up": self.gave_up,
+                "breaker": self.breaker.stats()
+            }
+
+
+def create_openai_client(api_key):
+    """
+    Build an OpenAI client backed by a keep-alive connection pool sized to
+    the concurrency cap, shared by every request in this worker. The
+    client's own retries are off; UpstreamCaller retries instead.
+    """
+    import httpx
+    from openai import OpenAI
+
+    http_client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONCURRENCY,
+            max_keepalive_connections=UPSTREAM_MAX_CONCURRENCY
+        ),
+        timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=5.0)
+    )
+    logging.debug(f"OpenAI client pool: {UPSTREAM_MAX_CONCURRENCY} connections")
+    return OpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+
+class LazyOpenAIClient:
+    """
+    Stands in for the OpenAI client, building it on first attribute access
+    """
+
+    def __init__(self, api_key):
+        self._api_key = api_key
+        self._client = None
+        self._lock = threading.Lock()
+        self._warming = False
+
+    def get(self):
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    started = time.perf_counter()
+                    self._client = create_openai_client(self._api_key)
+                    logging.info(f"OpenAI client built in {time.perf_counter() - started:.3f}s")
+                client = self._client
+        return client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def prewarm(self):
+        """
+        Build the client in a background thread if nothing has yet
+        """
+        if self._client is not None or self._warming:
+            return
+        with self._lock:
+            if self._client is not None or self._warming:
+                return
+            self._warming = True
+        threading.Thread(target=self.get, name="openai-prewarm", daemon=True).start()
+
+
+upstream_limiter = UpstreamLimiter(UPSTREAM_MAX_CONCURRENCY, UPSTREAM_QUEUE_TIMEOUT)
+upstream_breaker = CircuitBreaker(UPSTREAM_BREAKER_THRESHOLD, UPSTREAM_BREAKER_RESET)
+upstream_caller = UpstreamCaller(upstream_limiter, upstream_breaker)
@@ -1,10 +1,785 @@
+import base64
 import hashlib
 import re
 import subprocess
 import os
 import logging
+import threading
+from collections import OrderedDict
 from datetime import datetime
 
+from shell_parser import (
+    ShellParseError,
+    WRITE_REDIRECT_OPERATORS,
+    command_name,
+    effective_argv,
+    parse_command,
+)
+
+# Linux risk rules, ordered from most to least severe tier.
+# Each rule is (pattern, description); patterns are matched case-insensitively.
+LINUX_RISK_RULES = {
+    3: [
+        (r"rm\s+-rf\s+[/\*]", "rm -rf / or rm -rf *"),
+        (r"rm\s+-[a-z]*f[a-z]*\s+/", "Any rm with f flag targeting root"),
+        (r":\s*\(\s*\)\s*\{\s*:\s*\|\s*:\s*&\s*\}\s*;\s*:", "Fork bomb"),
+        (r"dd\s+if=/dev/", "dd operations on devices"),
+        (r"mkfs", "Format filesystem"),
+        (r"mv\s+[^\s]+\s+/dev/null", "Move to /dev/null"),
+        (r">\s+/dev/sd[a-z]", "Redirect to disk"),
+        (r"wget\s+.+\s+\|\s+bash", "Download and pipe to bash"),
+        (r"curl\s+.+\s+\|\s+sh", "Curl and pipe to shell"),
+        (r"chmod\s+-[a-z]*R[a-z]*\s+777", "Recursive chmod with full permissions"),
+        (r"shred\s+(-[a-z]*\s+)*[\/]", "Shred targeting important locations"),
+        (r"truncate\s+-s\s+0\s+\/", "Truncate files at root"),
+        (r"shutdown|halt|poweroff|reboot", "System power commands"),
+        (r"fdisk|sfdisk|cfdisk", "Disk partitioning"),
+        (r"\s+>\s+\/etc\/.+", "Redirect output to /etc files"),
+        (r"chown\s+-[a-z]*R[a-z]*\s+\w+\s+\/", "Recursive ownership change of root"),
+    ],
+    2: [
+        (r"rm\s+-[a-z]*r[a-z]*\s+", "Recursive remove"),
+        (r"find\s+.+\s+-delete", "Find and delete"),
+        (r"chmod\s+777", "Chmod with full permissions"),
+        (r"chown\s+-R", "Recursive chown"),
+        (r"sudo\s+apt\s+(dist-)?upgrade", "System upgrade"),
+        (r"tar\s+-[a-z]*[xc][a-z]*\s+", "Extract/create archives (potential overwrite)"),
+        (r"\s+>\s+\/etc\/\w+", "Write to /etc"),
+        (r"(^|;|\s+)ping\s+-f", "Flood ping"),
+        (r"dd\s+of=.+", "DD with output file"),
+    ],
+    1: [
+        (r"sudo\s+apt(-get)?\s+(install|remove)", "Package management"),
+        (r"npm\s+(install|uninstall)\s+(-g\s+)?", "NPM packages"),
+        (r"pip(3)?\s+(install|uninstall)", "PIP packages"),
+        (r"ssh\s+\w+@.+", "SSH connections"),
+        (r"curl\s+(-[a-zA-Z]+\s+)*https?:\/\/", "Curl commands"),
+        (r"wget\s+(-[a-zA-Z]+\s+)*https?:\/\/", "Wget commands"),
+    ],
+}
+
+RISK_REASONS = {
+    3: "Command is high risk",
+    2: "Command carries medium risk",
+    1: "Command carries low risk",
+}
+
+
+class RiskClassifier:
+    """
+    Precompiled risk classifier
+    
+    Each tier of rules is merged into a single compiled alternation where
+    every rule is a named group, so one scan per tier (highest first) finds
+    both the tier and the rule that matched. Built once at import time.
+    
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    
+    def __init__(self, rules, reasons=RISK_REASONS, block_level=3):
+        self.block_level = block_level
+        self.reasons = reasons
+        self._tiers = []
+        for level in sorted(rules, reverse=True):
+            group_rules = {}
+            alternatives = []
+            for index, (pattern, description) in enumerate(rules[level]):
+                name = f"r{level}_{index}"
+                group_rules[name] = description
+                alternatives.append(f"(?P<{name}>{pattern})")
+            compiled = re.compile("|".join(alternatives), re.IGNORECASE)
+            self._tiers.append((level, compiled, group_rules))
+    
+    def match(self, command):
+        """
+        Return (risk_level, description) for the highest tier matching
+        command, or (0, None) if nothing matches
+        """
+        for level, compiled, group_rules in self._tiers:
+            found = compiled.search(command)
+            if found:
+                # The outer named group always closes last, so lastgroup is the rule
+                return level, group_rules[found.lastgroup]
+        return 0, None
+    
+    def classify(self, command):
+        """
+        Classify a command, returning (is_safe, reason, risk_level)
+        """
+        level, description = self.match(command)
+        if level == 0:
+            return True, "Command appears safe", 0
+        return level < self.block_level, f"{self.reasons[level]}: {description}", level
+    
+    def classify_many(self, commands):
+        """
+        Classify a batch of commands, returning results in input order.
+        Repeated commands in the batch are only scanned once.
+        """
+        seen = {}
+        results = []
+        for command in commands:
+            result = seen.get(command)
+            if result is None:
+                result = seen[command] = self.classify(command)
+            results.append(result)
+        return results
+
+
+# Shared classifier instance, compiled once at import
+LINUX_RISK_CLASSIFIER = RiskClassifier(LINUX_RISK_RULES)
+
+# Structural patterns that cannot be expressed per stage
+LINUX_RAW_RISK_CLASSIFIER = RiskClassifier({
+    3: [(r":\s*\(\s*\)\s*\{\s*:\s*\|\s*:\s*&\s*\}\s*;\s*:", "Fork bomb")],
+})
+
+
+def _short_flags(argv):
+    """
+    Collect single-letter flags from "-rf" style arguments
+    """
+    flags = set()
+    for arg in argv[1:]:
+        if arg.startswith("-") and not arg.startswith("--"):
+            flags.update(arg[1:])
+    return flags
+
+
+def _operands(argv):
+    return [arg for arg in argv[1:] if not arg.startswith("-")]
+
+
+def _always(level, description):
+    return lambda argv: (level, description)
+
+
+def _rm_risk(argv):
+    flags = _short_flags(argv)
+    long_flags = set(arg for arg in argv[1:] if arg.startswith("--"))
+    recursive = bool(flags & {"r", "R"}) or "--recursive" in long_flags
+    force = "f" in flags or "--force" in long_flags
+    targets = _operands(argv)
+    if recursive and force and any(t in ("/", "/*", "*") for t in targets):
+        return 3, "rm -rf / or rm -rf *"
+    if force and any(t.startswith("/") for t in targets):
+        return 3, "Any rm with f flag targeting root"
+    if recursive:
+        return 2, "Recursive remove"
+    return None
+
+
+def _dd_risk(argv):
+    if any(arg.startswith("if=/dev/") for arg in argv[1:]):
+        return 3, "dd operations on devices"
+    if any(arg.startswith("of=") for arg in argv[1:]):
+        return 2, "DD with output file"
+    return None
+
+
+def _mv_risk(argv):
+    if _operands(argv)[-1:] == ["/dev/null"]:
+        return 3, "Move to /dev/null"
+    return None
+
+
+def _chmod_risk(argv):
+    modes = _operands(argv)
+    if "777" in modes[:1]:
+        if _short_flags(argv) & {"R"} or "--recursive" in argv:
+            return 3, "Recursive chmod with full permissions"
+        return 2, "Chmod with full permissions"
+    return None
+
+
+def _chown_risk(argv):
+    if _short_flags(argv) & {"R"} or "--recursive" in argv:
+        if any(t.startswith("/") for t in _operands(argv)[1:]):
+            return 3, "Recursive ownership change of root"
+        return 2, "Recursive chown"
+    return None
+
+
+def _shred_risk(argv):
+    if any(t.startswith("/") for t in _operands(argv)):
+        return 3, "Shred targeting important locations"
+    return None
+
+
+def _truncate_risk(argv):
+    if "0" in argv and any(t.startswith("/") for t in _operands(argv) if t != "0"):
+        return 3, "Truncate files at root"
+    return None
+
+
+def _find_risk(argv):
+    if "-delete" in argv:
+        return 2, "Find and delete"
+    # Classify whatever find runs through -exec / -execdir / -ok
+    for i, arg in enumerate(argv):
+        if arg in ("-exec", "-execdir", "-ok", "-okdir"):
+            nested = []
+            for word in argv[i + 1:]:
+                if word in (";", "+"):
+                    break
+                nested.append(word)
+            risk = _argv_risk(nested)
+            if risk:
+                return risk
+    return None
+
+
+def _apt_risk(argv):
+    operands = _operands(argv)
+    action = operands[0] if operands else ""
+    if action in ("upgrade", "dist-upgrade", "full-upgrade"):
+        return 2, "System upgrade"
+    if action in ("install", "remove", "purge"):
+        return 1, "Package management"
+    return None
+
+
+def _tar_risk(argv):
+    mode = argv[1] if len(argv) > 1 else ""
+    flags = set(mode.lstrip("-")) if not mode.startswith("--") else set()
+    if flags & {"x", "c"} or "--extract" in argv or "--create" in argv:
+        return 2, "Extract/create archives (potential overwrite)"
+    return None
+
+
+def _ping_risk(argv):
+    if "f" in _short_flags(argv):
+        return 2, "Flood ping"
+    return None
+
+
+def _npm_risk(argv):
+    if any(arg in ("install", "i", "uninstall", "remove") for arg in argv[1:2]):
+        return 1, "NPM packages"
+    return None
+
+
+def _pip_risk(argv):
+    if any(arg in ("install", "uninstall") for arg in argv[1:]):
+        return 1, "PIP packages"
+    return None
+
+
+def _inline_code(argv, letters, attached=True):
+    """
+    Return the code string passed to an interpreter with one of the given
+    short flags (-c, -e, ...), also inside clusters such as -ec or -lc, or
+    None. With attached, "-cCODE" passes CODE too.
+    """
+    for i, arg in enumerate(argv[1:], 1):
+        if not arg.startswith("-") or arg.startswith("--") or len(arg) < 2:
+            continue
+        for position, flag in enumerate(arg[1:], 2):
+            if flag in letters:
+                if attached and arg[position:]:
+                    return arg[position:]
+                # The code is the next operand after the flag cluster
+                for word in argv[i + 1:]:
+                    if not word.startswith("-"):
+                        return word
+                return ""
+    return None
+
+
+def _nested_risk(command):
+    """
+    Classify a command line passed to another program as a string
+    """
+    level, description = LINUX_COMMAND_CLASSIFIER.match(command)
+    return (level, description) if level else None
+
+
+def _interpreter_risk(letters):
+    def rule(argv):
+        if _inline_code(argv, letters) is not None:
+            # Arbitrary code the parser cannot see into
+            return 2, "Runs inline interpreter code"
+        return None
+    return rule
+
+
+def _python_risk(argv):
+    if "-m" in argv and "pip" in argv:
+        return _pip_risk(argv)
+    return _interpreter_risk("c")(argv)
+
+
+# ssh options that take a value
+_SSH_VALUE_OPTIONS = frozenset("BbcDEeFIiJLlmOopQRSWw")
+
+
+def _ssh_risk(argv):
+    operands = []
+    i = 1
+    while i < len(argv):
+        arg = argv[i]
+        if not operands and arg.startswith("-") and len(arg) > 1:
+            # -p 22, but -p22 carries its value
+            i += 2 if arg[-1] in _SSH_VALUE_OPTIONS and len(arg) == 2 else 1
+            continue
+        operands.append(arg)
+        i += 1
+    if not operands:
+        return None
+    # ssh host COMMAND runs COMMAND on the remote host
+    nested = _nested_risk(" ".join(operands[1:])) if len(operands) > 1 else None
+    if nested and nested[0] > 1:
+        return nested
+    if len(operands) > 1 or "@" in operands[0]:
+        return 1, "SSH connections"
+    return None
+
+
+def _download_risk(argv):
+    if any(arg.startswith(("http://", "https://")) for arg in argv[1:]):
+        return 1, "Curl commands" if command_name(argv[0]) == "curl" else "Wget commands"
+    return None
+
+
+def _systemctl_risk(argv):
+    if any(arg in ("reboot", "poweroff", "halt", "kexec") for arg in _operands(argv)):
+        return 3, "System power commands"
+    return None
+
+
+def _shell_risk(argv):
+    # sh -c "...", bash -ec "..." run their argument as a command line
+    code = _inline_code(argv, "c", attached=False)
+    return _nested_risk(code) if code else None
+
+
+def _eval_risk(argv):
+    # eval joins its arguments into a command line
+    return _nested_risk(" ".join(argv[1:]))
+
+
+def _su_risk(argv):
+    for i, arg in enumerate(argv[1:], 1):
+        if arg.startswith("--command="):
+            return _nested_risk(arg.split("=", 1)[1])
+        if arg == "--command" and i + 1 < len(argv):
+            return _nested_risk(argv[i + 1])
+    code = _inline_code(argv, "c", attached=False)
+    return _nested_risk(code) if code else None
+
+
+# Per-program risk rules, looked up on the stage's argv[0]
+LINUX_COMMAND_RULES = {
+    "rm": _rm_risk,
+    "dd": _dd_risk,
+    "mkfs": _always(3, "Format filesystem"),
+    "mv": _mv_risk,
+    "chmod": _chmod_risk,
+    "chown": _chown_risk,
+    "shred": _shred_risk,
+    "truncate": _truncate_risk,
+    "shutdown": _always(3, "System power commands"),
+    "halt": _always(3, "System power commands"),
+    "poweroff": _always(3, "System power commands"),
+    "reboot": _always(3, "System power commands"),
+    "systemctl": _systemctl_risk,
+    "fdisk": _always(3, "Disk partitioning"),
+    "sfdisk": _always(3, "Disk partitioning"),
+    "cfdisk": _always(3, "Disk partitioning"),
+    "parted": _always(3, "Disk partitioning"),
+    "find": _find_risk,
+    "apt": _apt_risk,
+    "apt-get": _apt_risk,
+    "tar": _tar_risk,
+    "ping": _ping_risk,
+    "npm": _npm_risk,
+    "pip": _pip_risk,
+    "pip3": _pip_risk,
+    "python": _python_risk,
+    "python3": _python_risk,
+    "ssh": _ssh_risk,
+    "curl": _download_risk,
+    "wget": _download_risk,
+    "python2": _python_risk,
+    "perl": _interpreter_risk("eE"),
+    "ruby": _interpreter_risk("e"),
+    "node": _interpreter_risk("ep"),
+    "php": _interpreter_risk("r"),
+    "sh": _shell_risk,
+    "bash": _shell_risk,
+    "dash": _shell_risk,
+    "zsh": _shell_risk,
+    "ksh": _shell_risk,
+    "eval": _eval_risk,
+    "su": _su_risk,
+}
+
+SHELL_PROGRAMS = frozenset(["sh", "bash", "dash", "zsh", "ksh"])
+DOWNLOAD_PROGRAMS = frozenset(["curl", "wget"])
+# Programs that run strings or files as code. Their payload can hide
+# from the parser, so commands using them are also held to the regex
+# rules applied to the whole command line.
+CODE_PROGRAMS = SHELL_PROGRAMS | frozenset([
+    "eval", "source", ".", "su", "ssh", "python", "python2", "python3",
+    "perl", "ruby", "node", "php", "awk", "gawk", "mawk",
+])
+
+
+def _argv_risk(argv):
+    """
+    Look up the rule for a stage's program and return (level, description) or None
+    """
+    argv = effective_argv(argv)
+    if not argv:
+        return None
+    name = command_name(argv[0])
+    rule = LINUX_COMMAND_RULES.get(name)
+    if rule is None and "." in name:
+        # mkfs.ext4, fsck.vfat, ...
+        rule = LINUX_COMMAND_RULES.get(name.split(".", 1)[0])
+    return rule(argv) if rule else None
+
+
+def _program(stage):
+    argv = effective_argv(stage.argv)
+    return command_name(argv[0]) if argv else ""
+
+
+def _redirection_risk(redirection):
+    if redirection.operator not in WRITE_REDIRECT_OPERATORS or not redirection.target:
+        return None
+    target = redirection.target
+    if target.startswith(("/dev/sd", "/dev/nvme", "/dev/hd")):
+        return 3, "Redirect to disk"
+    if target.startswith("/etc/"):
+        return 3, "Redirect output to /etc files"
+    return None
+
+
+class CommandRiskClassifier:
+    """
+    Stage-aware risk classifier
+    
+    Parses the command into pipeline stages and matches rules per stage on
+    the program name with a dict lookup, so words inside arguments, quoted
+    strings or filenames no longer trigger rules while commands hidden
+    behind ;, &&, pipes or $(...) are still seen. Falls back to the regex
+    classifier for commands that cannot be parsed.
+    
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    
+    def __init__(self, rules, fallback, raw_rules, reasons=RISK_REASONS, block_level=3):
+        self.rules = rules
+        self.fallback = fallback
+        self.raw_rules = raw_rules
+        self.reasons = reasons
+        self.block_level = block_level
+    
+    def match(self, command):
+        """
+        Return (risk_level, description) for the riskiest stage of command
+        """
+        level, description = self.raw_rules.match(command)
+        if level >= self.block_level:
+            return level, description
+        try:
+            parsed = parse_command(command)
+        except ShellParseError:
+            return self.fallback.match(command)
+        
+        # Process substitution feeds generated text to another program
+        runs_code = "<(" in command or ">(" in command
+        previous = None
+        for stage in parsed.stages:
+            runs_code = runs_code or _program(stage) in CODE_PROGRAMS
+            candidates = [_argv_risk(stage.argv)]
+            candidates.extend(_redirection_risk(r) for r in stage.redirections)
+            # Download piped straight into a shell
+            if (previous is not None and previous.operator in ("|", "|&")
+                    and _program(previous) in DOWNLOAD_PROGRAMS
+                    and _program(stage) in SHELL_PROGRAMS):
+                candidates.append((3, "Download and pipe to shell"))
+            for candidate in candidates:
+                if candidate and candidate[0] > level:
+                    level, description = candidate
+            if level >= self.block_level:
+                break
+            previous = stage
+        if runs_code and level < self.block_level:
+            floor = self.fallback.match(command)
+            if floor[0] > level:
+                level, description = floor
+        return level, description
+    
+    def classify(self, command):
+        """
+        Classify a command, returning (is_safe, reason, risk_level)
+        """
+        level, description = self.match(command)
+        if level == 0:
+            return True, "Command appears safe", 0
+        return level < self.block_level, f"{self.reasons[level]}: {description}", level
+    
+    def classify_many(self, commands):
+        """
+        Classify a batch of commands, returning results in input order
+        """
+        seen = {}
+        results = []
+        for command in commands:
+            result = seen.get(command)
+            if result is None:
+                result = seen[command] = self.classify(command)
+            results.append(result)
+        return results
+
+
+LINUX_COMMAND_CLASSIFIER = CommandRiskClassifier(
+    LINUX_COMMAND_RULES, LINUX_RISK_CLASSIFIER, LINUX_RAW_RISK_CLASSIFIER
+)
+
+# PowerShell tokens: quoted strings, statement/pipeline/assignment
+# delimiters and barewords
+_POWERSHELL_TOKEN_RE = re.compile(r"""'(?:[^']|'')*'|"(?:[^"`]|`.)*"|[|;{}()=]|[^\s|;{}()='"]+""")
+# "$x = Stop-Computer" runs the right-hand side, so = starts a stage too
+_POWERSHELL_DELIMITERS = frozenset("|;{}()=")
+_POWERSHELL_CALL_OPERATORS = ("&", ".")
+
+# Common aliases resolved to their cmdlet before rule lookup
+POWERSHELL_ALIASES = {
+    "rm": "remove-item", "del": "remove-item", "erase": "remove-item",
+    "rd": "remove-item", "rmdir": "remove-item", "ri": "remove-item",
+    "mv": "move-item", "move": "move-item", "mi": "move-item",
+    "ni": "new-item", "mkdir": "new-item", "md": "new-item",
+    "si": "set-item", "sp": "set-itemproperty",
+    "sc": "set-content", "ac": "add-content",
+    "ren": "rename-item", "rni": "rename-item",
+    "epcsv": "export-csv", "spsv": "stop-service",
+    "iex": "invoke-expression",
+}
+
+# Root and system locations that a recursive removal must never target
+_POWERSHELL_SYSTEM_PATH_RE = re.compile(
+    r"^(?:[a-z]:|\$env:systemdrive)?\\?\*?$"
+    r"|^(?:(?:[a-z]:|\$env:systemdrive)\\|\\)"
+    r"(?:windows|program files(?: \(x86\))?|programdata|users\\?\*?$|boot|system volume information)"
+    r"|^\$env:(?:windir|systemroot|programfiles|programdata)",
+    re.IGNORECASE
+)
+
+
+def _powershell_switch(params, name, min_length=2):
+    """
+    True if a parameter (or an unambiguous prefix of it) is present,
+    e.g. -Rec for -Recurse
+    """
+    return any(len(p) >= min_length and name.startswith(p) for p in params)
+
+
+def _unquote_powershell(token):
+    if len(token) >= 2 and token[0] == token[-1] and token[0] in "'\"":
+        return token[1:-1]
+    return token
+
+
+def _powershell_system_path(path):
+    return bool(_POWERSHELL_SYSTEM_PATH_RE.match(_unquote_powershell(path).replace("/", "\\")))
+
+
+def _remove_item_risk(params, args):
+    if _powershell_switch(params, "-recurse"):
+        if any(_powershell_system_path(arg) for arg in args):
+            return 3, "Recursive removal of a root or system path"
+        if _powershell_switch(params, "-force", 3):
+            return 3, "Recursive forced removal"
+    return None
+
+
+def _ps_always(level, description):
+    return lambda params, args: (level, description)
+
+
+# Per-cmdlet risk rules, looked up on the lowercased Verb-Noun name
+POWERSHELL_COMMAND_RULES = {
+    "remove-item": _remove_item_risk,
+    "format-volume": _ps_always(3, "Formats a volume"),
+    "clear-disk": _ps_always(3, "Wipes a disk"),
+    "reset-computermachinepassword": _ps_always(3, "Resets the computer account password"),
+    "stop-computer": _ps_always(3, "Shuts down the computer"),
+    "restart-computer": _ps_always(3, "Restarts the computer"),
+    "set-item": _ps_always(2, "Changes item values"),
+    "set-itemproperty": _ps_always(2, "Changes item properties"),
+    "new-item": _ps_always(2, "Creates new items"),
+    "new-itemproperty": _ps_always(2, "Creates item properties"),
+    "move-item": _ps_always(2, "Moves items"),
+    "set-service": _ps_always(2, "Changes service configuration"),
+    "restart-service": _ps_always(2, "Restarts a service"),
+    "stop-service": _ps_always(2, "Stops a service"),
+    "out-file": _ps_always(1, "Writes output to a file"),
+    "export-csv": _ps_always(1, "Writes a CSV file"),
+    "add-content": _ps_always(1, "Appends to a file"),
+    "set-content": _ps_always(1, "Overwrites file content"),
+    "rename-item": _ps_always(1, "Renames items"),
+}
+
+
+def tokenize_powershell(command):
+    """
+    Split a PowerShell command into stages of (cmdlet, parameters, arguments).
+    Pipelines, statements, script blocks and subexpressions each start a new
+    stage; the cmdlet name and parameter names are lowercased.
+    """
+    stages = []
+    cmdlet = None
+    params = []
+    args = []
+    call = False
+    for token in _POWERSHELL_TOKEN_RE.findall(command):
+        if token in _POWERSHELL_DELIMITERS:
+            if cmdlet:
+                stages.append((cmdlet, tuple(params), tuple(args)))
+            cmdlet, params, args, call = None, [], [], False
+        elif cmdlet is None:
+            if token in _POWERSHELL_CALL_OPERATORS:
+                call = True
+                continue
+            if token.startswith(("'", '"')):
+                # & "Stop-Computer" runs the named command; a bare string does not
+                if not call:
+                    continue
+                token = _unquote_powershell(token)
+            elif token.startswith("$"):
+                continue
+            # Microsoft.PowerShell.Management\Stop-Computer -> stop-computer
+            name = token.rsplit("\\", 1)[-1].lower()
+            cmdlet = POWERSHELL_ALIASES.get(name, name)
+        elif token.startswith("-") and len(token) > 1 and not token[1].isdigit():
+            # -Recurse:$true -> -recurse, -Path:C:\ -> -path with argument C:\
+            name, colon, value = token.partition(":")
+            params.append(name.lower())
+            if value:
+                args.append(value)
+        else:
+            args.append(token)
+    if cmdlet:
+        stages.append((cmdlet, tuple(params), tuple(args)))
+    return stages
+
+
+_POWERSHELL_HOSTS = frozenset(["powershell", "powershell.exe", "pwsh", "pwsh.exe"])
+_POWERSHELL_MAX_NESTING = 4
+
+
+def _powershell_payloads(cmdlet, params, args):
+    """
+    Return the command strings a stage may run (Invoke-Expression "...",
+    powershell -Command "...", pwsh -EncodedCommand ...), or None. Raises
+    ValueError for an encoded command that does not decode.
+    """
+    if cmdlet == "invoke-expression":
+        return [" ".join(_unquote_powershell(arg) for arg in args)]
+    if cmdlet not in _POWERSHELL_HOSTS or _powershell_switch(params, "-file"):
+        return None
+    if any(p in ("-e", "-ec") or _powershell_switch([p], "-encodedcommand", 3) for p in params):
+        # = splits tokens, so base64 padding has to be restored
+        return [base64.b64decode(arg + "=" * (-len(arg) % 4), validate=True).decode("utf-16-le")
+                for arg in args]
+    # -Command is also the default for positional arguments. Values of
+    # other options (-ExecutionPolicy Bypass) are among the arguments, so
+    # each one is checked on its own as well as all of them together.
+    unquoted = [_unquote_powershell(arg) for arg in args]
+    return [" ".join(unquoted)] + unquoted
+
+
+class PowerShellRiskClassifier:
+    """
+    PowerShell counterpart of CommandRiskClassifier
+    
+    Tokenizes the command into cmdlet stages, resolves aliases, and looks
+    each Verb-Noun cmdlet up in a rule table with its parameter names.
+    Results are memoized by command hash.
+    
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    
+    def __init__(self, rules, reasons=RISK_REASONS, block_level=3, cache_size=4096):
+        self.rules = rules
+        self.reasons = reasons
+        self.block_level = block_level
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _stage_risk(self, cmdlet, params, args, depth):
+        try:
+            payloads = _powershell_payloads(cmdlet, params, args)
+        except ValueError:
+            return 3, f"Undecodable encoded command ({cmdlet})"
+        if payloads is not None:
+            if depth >= _POWERSHELL_MAX_NESTING:
+                return 3, f"Deeply nested command strings ({cmdlet})"
+            return max((self.match(payload, depth + 1) for payload in payloads),
+                       key=lambda risk: risk[0], default=None)
+        rule = self.rules.get(cmdlet)
+        risk = rule(params, args) if rule else None
+        return (risk[0], f"{risk[1]} ({cmdlet})") if risk else None
+    
+    def match(self, command, depth=0):
+        """
+        Return (risk_level, description) for the riskiest cmdlet in command,
+        including commands run from strings by Invoke-Expression or a
+        nested powershell -Command
+        """
+        level, description = 0, None
+        for cmdlet, params, args in tokenize_powershell(command):
+            risk = self._stage_risk(cmdlet, params, args, depth)
+            if risk and risk[0] > level:
+                level, description = risk
+        return level, description
+    
+    def classify(self, command):
+        """
+        Classify a command, returning (is_safe, reason, risk_level)
+        """
+        key = generate_command_hash(command)
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+                return result
+        
+        level, description = self.match(command)
+        if level == 0:
+            result = (True, "Command appears safe", 0)
+        else:
+            result = (level < self.block_level, f"{self.reasons[level]}: {description}", level)
+        
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+    
+    def classify_many(self, commands):
+        """
+        Classify a batch of commands, returning results in input order
+        """
+        return [self.classify(command) for command in commands]
+
+
+POWERSHELL_RISK_CLASSIFIER = PowerShellRiskClassifier(POWERSHELL_COMMAND_RULES)
+
+def validate_powershell_command(command):
+    """
+    Check if a PowerShell command is safe to execute
+    Returns (is_safe, reason, risk_level) using the same levels as
+    validate_linux_command
+    
+    Copyright (c) 2024 Ervin Remus Radosavlevici
+    """
+    return POWERSHELL_RISK_CLASSIFIER.classify(command)
+
 def validate_linux_command(command):
     """
     Enhanced validation to check if a command is safe to execute
@@ -19,63 +794,7 @@ def validate_linux_command(command):
     Copyright (c) 2024 Ervin Remus Radosavlevici
     This function includes proprietary DNA-based security features.
     """
-    # List of dangerous commands
-    high_risk_patterns = [
-        r"rm\s+-rf\s+[/\*]",          # rm -rf / or rm -rf *
-        r"rm\s+-[a-z]*f[a-z]*\s+/",   # Any rm with f flag targeting root
-        r":(){ :\|:& };:",            # Fork bomb
-        r"dd\s+if=/dev/",             # dd operations on devices
-        r"mkfs",                      # Format filesystem
-        r"mv\s+[^\s]+\s+/dev/null",   # Move to /dev/null
-        r">\s+/dev/sd[a-z]",          # Redirect to disk
-        r"wget\s+.+\s+\|\s+bash",     # Download and pipe to bash
-        r"curl\s+.+\s+\|\s+sh",       # Curl and pipe to shell
-        r"chmod\s+-[a-z]*R[a-z]*\s+777", # Recursive chmod with full permissions
-        r"shred\s+(-[a-z]*\s+)*[\/]", # Shred targeting important locations
-        r"truncate\s+-s\s+0\s+\/",    # Truncate files at root
-        r"shutdown|halt|poweroff|reboot", # System power commands
-        r"fdisk|sfdisk|cfdisk",       # Disk partitioning
-        r"\s+>\s+\/etc\/.+",          # Redirect output to /etc files
-        r"chown\s+-[a-z]*R[a-z]*\s+\w+\s+\/", # Recursive ownership change of root
-    ]
-    
-    medium_risk_patterns = [
-        r"rm\s+-[a-z]*r[a-z]*\s+",         # Recursive remove
-        r"find\s+.+\s+-delete",             # Find and delete
-        r"chmod\s+777",                     # Chmod with full permissions
-        r"chown\s+-R",                      # Recursive chown
-        r"sudo\s+apt\s+(dist-)?upgrade",    # System upgrade 
-        r"tar\s+-[a-z]*[xc][a-z]*\s+",      # Extract/create archives (potential overwrite)
-        r"\s+>\s+\/etc\/\w+",               # Write to /etc 
-        r"(^|;|\s+)ping\s+-f",              # Flood ping
-        r"dd\s+of=.+",                      # DD with output file
-    ]
-    
-    low_risk_patterns = [
-        r"sudo\s+apt(-get)?\s+(install|remove)",  # Package management
-        r"npm\s+(install|uninstall)\s+(-g\s+)?",  # NPM packages
-        r"pip(3)?\s+(install|uninstall)",         # PIP packages
-        r"ssh\s+\w+@.+",                        # SSH connections
-        r"curl\s+(-[a-zA-Z]+\s+)*https?:\/\/",   # Curl commands
-        r"wget\s+(-[a-zA-Z]+\s+)*https?:\/\/",   # Wget commands
-    ]
-    
-    # Check for high risk patterns
-    for pattern in high_risk_patterns:
-        if re.search(pattern, command, re.IGNORECASE):
-            return False, f"Command is high risk: {pattern}", 3
-    
-    # Check for medium risk patterns - these are warnings but not blocked
-    for pattern in medium_risk_patterns:
-        if re.search(pattern, command, re.IGNORECASE):
-            return True, f"Command carries medium risk: {pattern}", 2
-    
-    # Check for low risk patterns - these are minor warnings
-    for pattern in low_risk_patterns:
-        if re.search(pattern, command, re.IGNORECASE):
-            return True, f"Command carries low risk: {pattern}", 1
-    
-    return True, "Command appears safe", 0
+    return LINUX_COMMAND_CLASSIFIER.classify(command)
 
 def generate_command_hash(command):
     """
@@ -94,7 +813,18 @@ def sanitize_input(text):
     
     return text.strip()
 
-def log_command_request(user_query, generated_command, user_ip=None, command_type="linux"):
+# Callables notified with every audit log entry (see register_command_log_listener)
+_command_log_listeners = []
+
+def register_command_log_listener(listener):
+    """
+    Register a callable that receives each log entry dict recorded by
+    log_command_request. Listener errors are logged and never propagate.
+    """
+    _command_log_listeners.append(listener)
+
+def log_command_request(user_query, generated_command, user_ip=None, command_type="linux", explanation=None,
+                        source=None):
     """
     Log command requests for security and auditing
     Enhanced to support both Linux and PowerShell commands
@@ -107,8 +837,17 @@ def log_command_request(user_query, generated_command, user_ip=None, command_typ
         "timestamp": datetime.now().isoformat(),
         "ip_address": user_ip,
         "command_type": command_type.upper(),
-        "command_hash": generate_command_hash(generated_command)
+        "command_hash": generate_command_hash(generated_command),
+        "explanation": explanation,
+        # Where a translation came from ("model", "cache", "degraded", ...)
+        "source": source
     }
     
     logging.info(f"Command request: {log_entry}")
     # In a production system, this would write to a secure database with encryption
+    
+    for listener in _command_log_listeners:
+        try:
+            listener(log_entry)
+        except Exception as e:
+            logging.error(f"Command log listener failed: {str(e)}")